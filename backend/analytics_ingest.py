@@ -0,0 +1,204 @@
+"""
+Visitor analytics ingestion pipeline
+Buffers tracking beacons in memory and writes them to MongoDB in batches,
+so /api/track-visitor and /api/track-click can acknowledge immediately.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+GeoLookup = Callable[[str], Awaitable[Dict[str, Any]]]
+FlushHook = Callable[[str, List[Dict[str, Any]]], Awaitable[None]]
+
+
+class AnalyticsIngestQueue:
+    """Bounded in-process queue that batches analytics events into insert_many calls"""
+
+    def __init__(
+        self,
+        db,
+        geo_lookup: Optional[GeoLookup] = None,
+        on_flush: Optional[FlushHook] = None,
+        max_queue_size: int = None,
+        batch_size: int = None,
+        flush_interval: float = None,
+        enrich_concurrency: int = None,
+        enrich_timeout: float = 5.0,
+    ):
+        self.db = db
+        self.geo_lookup = geo_lookup
+        self.on_flush = on_flush
+        self.max_queue_size = max_queue_size or int(os.environ.get('ANALYTICS_QUEUE_MAX', '10000'))
+        self.batch_size = batch_size or int(os.environ.get('ANALYTICS_BATCH_SIZE', '200'))
+        self.flush_interval = flush_interval or float(os.environ.get('ANALYTICS_FLUSH_INTERVAL_SECONDS', '2'))
+        self.enrich_concurrency = enrich_concurrency or int(os.environ.get('ANALYTICS_ENRICH_CONCURRENCY', '4'))
+        self.enrich_timeout = enrich_timeout
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._accepting = False
+
+        # Counters exposed through stats()
+        self.enqueued = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+        self.last_flush_at: Optional[float] = None
+        self.last_flush_latency_ms = 0.0
+        self.max_flush_latency_ms = 0.0
+        self._total_flush_latency_ms = 0.0
+
+    async def start(self):
+        """Start the background flush worker"""
+        if self._worker and not self._worker.done():
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._accepting = True
+        self._worker = asyncio.create_task(self._run())
+        logger.info(
+            f"Analytics ingest queue started (max={self.max_queue_size}, "
+            f"batch={self.batch_size}, interval={self.flush_interval}s)"
+        )
+
+    def submit(self, collection: str, document: Dict[str, Any], enrich_ip: Optional[str] = None) -> bool:
+        """Queue an event without waiting; returns False when the event was dropped"""
+        if not self._accepting or self._queue is None:
+            self.dropped += 1
+            return False
+        try:
+            self._queue.put_nowait((collection, document, enrich_ip))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+        self.enqueued += 1
+        return True
+
+    async def drain(self, timeout: float = 10.0):
+        """Stop accepting events and flush everything still queued"""
+        if self._worker is None:
+            return
+        self._accepting = False
+        # A None sentinel tells the worker to flush and exit once the queue is empty
+        await self._queue.put(None)
+        try:
+            await asyncio.wait_for(self._worker, timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Analytics ingest drain timed out with {self._queue.qsize()} events queued")
+            self._worker.cancel()
+        self._worker = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth, throughput and flush latency counters"""
+        return {
+            "accepting": self._accepting,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "queue_capacity": self.max_queue_size,
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "written": self.written,
+            "failed": self.failed,
+            "batches": self.batches,
+            "last_flush_latency_ms": round(self.last_flush_latency_ms, 2),
+            "avg_flush_latency_ms": round(self._total_flush_latency_ms / self.batches, 2) if self.batches else 0.0,
+            "max_flush_latency_ms": round(self.max_flush_latency_ms, 2),
+            "seconds_since_last_flush": round(time.monotonic() - self.last_flush_at, 1) if self.last_flush_at else None,
+        }
+
+    async def _run(self):
+        buffer: List[tuple] = []
+        deadline = time.monotonic() + self.flush_interval
+        stopping = False
+
+        while not stopping:
+            timeout = max(deadline - time.monotonic(), 0)
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout=timeout)
+                if item is None:
+                    stopping = True
+                else:
+                    buffer.append(item)
+            except asyncio.TimeoutError:
+                pass
+
+            if buffer and (stopping or len(buffer) >= self.batch_size or time.monotonic() >= deadline):
+                await self._flush(buffer)
+                buffer = []
+            if time.monotonic() >= deadline:
+                deadline = time.monotonic() + self.flush_interval
+
+        # Pick up anything that raced in before the sentinel
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not None:
+                buffer.append(item)
+        if buffer:
+            await self._flush(buffer)
+
+    async def _flush(self, items: List[tuple]):
+        started = time.perf_counter()
+
+        await self._enrich(items)
+
+        by_collection: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        for collection, document, _ in items:
+            by_collection[collection].append(document)
+
+        for collection, documents in by_collection.items():
+            stored = documents
+            try:
+                await self.db[collection].insert_many(documents, ordered=False)
+                self.written += len(documents)
+            except Exception as e:
+                # With ordered=False a BulkWriteError still stores the good documents
+                details = getattr(e, 'details', None) or {}
+                failed_indexes = {error.get('index') for error in details.get('writeErrors', [])}
+                stored = [d for i, d in enumerate(documents) if i not in failed_indexes] if details else []
+                self.written += len(stored)
+                self.failed += len(documents) - len(stored)
+                logger.error(f"Failed to write {len(documents) - len(stored)} {collection} events: {e}")
+
+            if self.on_flush and stored:
+                try:
+                    await self.on_flush(collection, stored)
+                except Exception as e:
+                    logger.error(f"Flush hook failed for {collection}: {e}")
+
+        latency_ms = (time.perf_counter() - started) * 1000
+        self.batches += 1
+        self.last_flush_at = time.monotonic()
+        self.last_flush_latency_ms = latency_ms
+        self.max_flush_latency_ms = max(self.max_flush_latency_ms, latency_ms)
+        self._total_flush_latency_ms += latency_ms
+
+    async def _enrich(self, items: List[tuple]):
+        """Resolve geolocation once per distinct IP in the batch"""
+        if not self.geo_lookup:
+            return
+        ips = {ip for _, _, ip in items if ip}
+        if not ips:
+            return
+
+        semaphore = asyncio.Semaphore(self.enrich_concurrency)
+
+        async def resolve(ip: str):
+            async with semaphore:
+                try:
+                    return ip, await asyncio.wait_for(self.geo_lookup(ip), timeout=self.enrich_timeout)
+                except Exception as e:
+                    logger.warning(f"Geolocation enrichment failed for {ip}: {e}")
+                    return ip, {}
+
+        locations = dict(await asyncio.gather(*(resolve(ip) for ip in ips)))
+        for _, document, ip in items:
+            if not ip:
+                continue
+            location = locations.get(ip) or {}
+            document["country"] = location.get("country") or document.get("country") or "Unknown"
+            document["city"] = location.get("city") or document.get("city") or "Unknown"
@@ -0,0 +1,285 @@
+"""
+Retention and archival for raw visitor/click analytics events
+Events older than the retention window are compacted into gzip'd JSONL files,
+one per collection and day, and then removed from MongoDB. Once the archiver
+has caught up, a TTL index on ``timestamp`` acts as a backstop in case it
+stops running.
+
+One replica archives at a time, holding the ``archiver`` lease in
+``analytics_rollup_state``; with several replicas the archive directory should
+be a shared volume, since each run may land on a different one.
+"""
+
+import asyncio
+import gzip
+import json
+import logging
+import os
+import socket
+import time
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional
+
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+logger = logging.getLogger(__name__)
+
+ARCHIVED_COLLECTIONS = ("visitor_analytics", "click_analytics")
+
+# Codes MongoDB returns when an index exists on the same key with other options
+INDEX_CONFLICT_CODES = {85, 86}
+
+# Lease document (in analytics_rollup_state) held by the one replica archiving at a time
+ARCHIVER_LEASE = "archiver"
+
+
+class ArchiveLeaseLost(Exception):
+    """Another replica took the archiver lease over during a run"""
+
+
+def _json_default(value: Any):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+class AnalyticsRetention:
+    """Archive expired raw analytics events to CACHE_DIR and delete them from MongoDB"""
+
+    def __init__(
+        self,
+        db,
+        archive_dir: Path,
+        retention_days: int = None,
+        ttl_grace_days: int = None,
+        interval_hours: float = None,
+        lease_seconds: int = None,
+    ):
+        self.db = db
+        self.archive_dir = Path(archive_dir)
+        self.retention_days = retention_days or int(os.environ.get('ANALYTICS_RAW_RETENTION_DAYS', '90'))
+        # The TTL index fires later than the archiver so it only removes what archiving missed
+        self.ttl_grace_days = ttl_grace_days if ttl_grace_days is not None else int(
+            os.environ.get('ANALYTICS_TTL_GRACE_DAYS', '7')
+        )
+        self.interval_hours = interval_hours or float(os.environ.get('ANALYTICS_ARCHIVE_INTERVAL_HOURS', '24'))
+        self.lease_seconds = lease_seconds or int(os.environ.get('ANALYTICS_ARCHIVE_LEASE_SECONDS', '600'))
+        self.locks = db.analytics_rollup_state
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self.last_run_at: Optional[datetime] = None
+        self.last_run_seconds = 0.0
+        self.last_archived: Dict[str, int] = {}
+        self.last_error: Optional[str] = None
+        self.held_until: Optional[datetime] = None
+        self.ttl_enabled = False
+        # Returns the oldest event time another reader (the rollup backfill) still needs, or None
+        self.retain_since: Optional[Callable[[], Awaitable[Optional[datetime]]]] = None
+
+    @property
+    def ttl_seconds(self) -> int:
+        return (self.retention_days + self.ttl_grace_days) * 86400
+
+    def cutoff(self, now: Optional[datetime] = None) -> datetime:
+        """Start of the oldest day that is still kept in MongoDB"""
+        now = now or datetime.now(timezone.utc)
+        today = now.astimezone(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        return today - timedelta(days=self.retention_days)
+
+    def path_for(self, collection: str, day: date) -> Path:
+        return self.archive_dir / collection / f"{day:%Y}" / f"{day:%Y-%m-%d}.jsonl.gz"
+
+    async def ensure_indexes(self):
+        """Index ``timestamp`` for each raw collection; the TTL option is added once archiving catches up"""
+        for collection in ARCHIVED_COLLECTIONS:
+            try:
+                await self.db[collection].create_index("timestamp")
+            except OperationFailure as e:
+                # Already a TTL index from an earlier run
+                if e.code not in INDEX_CONFLICT_CODES:
+                    raise
+
+    async def ensure_ttl_index(self):
+        """Create (or retune) the TTL index on ``timestamp`` for each raw collection"""
+        for collection in ARCHIVED_COLLECTIONS:
+            try:
+                await self.db[collection].create_index("timestamp", expireAfterSeconds=self.ttl_seconds)
+            except OperationFailure as e:
+                if e.code not in INDEX_CONFLICT_CODES:
+                    raise
+                # The index already exists without or with a different expiry; change it in place
+                await self.db.command(
+                    "collMod", collection,
+                    index={"keyPattern": {"timestamp": 1}, "expireAfterSeconds": self.ttl_seconds},
+                )
+        self.ttl_enabled = True
+
+    async def start(self):
+        """Run the archiver now and then every ``interval_hours``"""
+        if self._task and not self._task.done():
+            return
+        self._task = asyncio.create_task(self._run())
+        logger.info(
+            f"Analytics archiver started (retention={self.retention_days}d, "
+            f"ttl={self.retention_days + self.ttl_grace_days}d, every {self.interval_hours}h)"
+        )
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                archived = await self.archive_expired()
+                # Only once nothing is held back, so the TTL index never removes events not yet archived
+                if archived is not None and not self.ttl_enabled and self.held_until is None:
+                    await self.ensure_ttl_index()
+            except Exception as e:
+                logger.error(f"Analytics archival failed: {e}")
+            await asyncio.sleep(self.interval_hours * 3600)
+
+    async def archive_expired(self) -> Optional[Dict[str, int]]:
+        """Archive and delete every raw event older than the retention cutoff
+
+        Returns None without archiving while another replica holds the archiver lease.
+        """
+        async with self._lock:
+            if not await self._acquire():
+                logger.info("Another replica is archiving analytics events; skipping this run")
+                return None
+            try:
+                return await self._archive_expired()
+            finally:
+                await self.locks.update_one(
+                    {"_id": ARCHIVER_LEASE, "owner": self.owner}, {"$set": {"lease_until": None}}
+                )
+
+    async def _acquire(self) -> bool:
+        """Take or renew the archiver lease; False while another replica holds it"""
+        now = datetime.now(timezone.utc)
+        try:
+            result = await self.locks.update_one(
+                {"_id": ARCHIVER_LEASE, "$or": [
+                    {"owner": self.owner}, {"lease_until": None}, {"lease_until": {"$lt": now}},
+                ]},
+                {"$set": {"owner": self.owner, "lease_until": now + timedelta(seconds=self.lease_seconds)}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            return False
+        return bool(result.matched_count or result.upserted_id)
+
+    async def _archive_expired(self) -> Dict[str, int]:
+        started = time.perf_counter()
+        cutoff = self.cutoff()
+        archived = {}
+        try:
+            needed = await self.retain_since() if self.retain_since else None
+            self.held_until = needed if needed is not None and needed < cutoff else None
+            if self.held_until:
+                cutoff = self.held_until
+            for collection in ARCHIVED_COLLECTIONS:
+                archived[collection] = await self._archive_collection(collection, cutoff)
+            self.last_error = None
+        except Exception as e:
+            self.last_error = str(e)
+            raise
+        finally:
+            self.last_run_at = datetime.now(timezone.utc)
+            self.last_run_seconds = time.perf_counter() - started
+            self.last_archived = archived
+        if any(archived.values()):
+            logger.info(f"Archived expired analytics events: {archived}")
+        return archived
+
+    async def _archive_collection(self, collection: str, cutoff: datetime) -> int:
+        total = 0
+        while True:
+            oldest = await self.db[collection].find_one(
+                {"timestamp": {"$lt": cutoff}}, {"timestamp": 1}, sort=[("timestamp", 1)]
+            )
+            if oldest is None:
+                return total
+            timestamp = oldest["timestamp"]
+            if timestamp.tzinfo is None:
+                timestamp = timestamp.replace(tzinfo=timezone.utc)
+            day_start = timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+            # Renewed per day; a replica that lost the lease must not delete what it did not write
+            if not await self._acquire():
+                raise ArchiveLeaseLost("Another replica took over analytics archiving")
+            total += await self._archive_day(collection, day_start, min(day_start + timedelta(days=1), cutoff))
+
+    async def _archive_day(self, collection: str, day_start: datetime, day_end: datetime) -> int:
+        window = {"timestamp": {"$gte": day_start, "$lt": day_end}}
+        lines = []
+        async for document in self.db[collection].find(window).sort("timestamp", 1):
+            document["_id"] = str(document["_id"])
+            lines.append(json.dumps(document, default=_json_default, separators=(',', ':')))
+
+        if lines:
+            path = self.path_for(collection, day_start.date())
+            await asyncio.to_thread(self._write_day, path, lines)
+        # Only delete once the file is safely on disk
+        result = await self.db[collection].delete_many(window)
+        return result.deleted_count
+
+    @staticmethod
+    def _write_day(path: Path, lines: List[str]):
+        """Append lines to a day file as a new gzip member, skipping ids already archived"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        existing = b""
+        if path.exists():
+            existing = path.read_bytes()
+            # A previous run may have written the file but died before deleting
+            archived_ids = {json.loads(line)["_id"] for line in gzip.decompress(existing).splitlines() if line}
+            lines = [line for line in lines if json.loads(line)["_id"] not in archived_ids]
+            if not lines:
+                return
+
+        temp_path = path.with_name(path.name + ".tmp")
+        with open(temp_path, "wb") as f:
+            f.write(existing)
+            f.write(gzip.compress(("\n".join(lines) + "\n").encode("utf-8")))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+
+    def iter_archived(self, collection: str, start: date, end: date) -> Iterator[Dict[str, Any]]:
+        """Yield archived events for days in [start, end], e.g. for yearly reports"""
+        day = start
+        while day <= end:
+            path = self.path_for(collection, day)
+            if path.exists():
+                with gzip.open(path, "rt", encoding="utf-8") as f:
+                    for line in f:
+                        if line.strip():
+                            yield json.loads(line)
+            day += timedelta(days=1)
+
+    def stats(self) -> Dict[str, Any]:
+        files = list(self.archive_dir.glob("*/*/*.jsonl.gz")) if self.archive_dir.exists() else []
+        return {
+            "retention_days": self.retention_days,
+            "ttl_days": self.retention_days + self.ttl_grace_days,
+            "ttl_enabled": self.ttl_enabled,
+            "cutoff": self.cutoff().isoformat(),
+            # Events from here on are kept past the cutoff until the rollup backfill has read them
+            "held_until": self.held_until.isoformat() if self.held_until else None,
+            "running": bool(self._task and not self._task.done()),
+            "last_run_at": self.last_run_at.isoformat() if self.last_run_at else None,
+            "last_run_seconds": round(self.last_run_seconds, 2),
+            "last_archived": self.last_archived,
+            "last_error": self.last_error,
+            "archive_files": len(files),
+            "archive_bytes": sum(f.stat().st_size for f in files),
+        }
@@ -0,0 +1,343 @@
+"""
+Pre-aggregated hourly/daily rollups for visitor and click analytics
+Each rollup document holds counters per page, country and element type plus
+a HyperLogLog sketch of visitor IPs, so dashboards read one document per
+hour or day instead of scanning raw events.
+
+Events recorded before the rollups existed are backfilled once, by whichever
+replica holds the lease on the ``analytics_rollup_state`` document. The backfill
+works through whole days and marks each bucket it has written, so a backfill
+interrupted by a restart is resumed without counting any event twice.
+"""
+
+import asyncio
+import hashlib
+import logging
+import math
+import os
+import socket
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+HLL_PRECISION = 12
+HLL_REGISTERS = 1 << HLL_PRECISION
+
+HOURLY = "hourly"
+DAILY = "daily"
+
+BACKFILL_STATE = "backfill"
+EVENT_FIELDS = {
+    "visitor_analytics": {"_id": 0, "timestamp": 1, "page_url": 1, "country": 1, "ip_address": 1},
+    "click_analytics": {"_id": 0, "timestamp": 1, "element_type": 1},
+}
+
+
+class HyperLogLog:
+    """HyperLogLog sketch kept as a sparse {register: rank} map"""
+
+    def __init__(self, registers: Optional[Dict[int, int]] = None):
+        self.registers: Dict[int, int] = dict(registers or {})
+
+    @staticmethod
+    def register_for(value: str) -> tuple:
+        """Register index and rank (position of the first set bit) for a value"""
+        hashed = int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
+        index = hashed >> (64 - HLL_PRECISION)
+        remaining = hashed & ((1 << (64 - HLL_PRECISION)) - 1)
+        rank = (64 - HLL_PRECISION) - remaining.bit_length() + 1
+        return index, rank
+
+    def add(self, value: str):
+        index, rank = self.register_for(value)
+        if rank > self.registers.get(index, 0):
+            self.registers[index] = rank
+
+    def merge(self, registers: Dict[Any, int]):
+        for index, rank in registers.items():
+            index = int(index)
+            if rank > self.registers.get(index, 0):
+                self.registers[index] = rank
+
+    def estimate(self) -> int:
+        if not self.registers:
+            return 0
+        m = HLL_REGISTERS
+        alpha = 0.7213 / (1 + 1.079 / m)
+        zero_registers = m - len(self.registers)
+        harmonic = zero_registers + sum(2.0 ** -rank for rank in self.registers.values())
+        raw = alpha * m * m / harmonic
+        # Linear counting is more accurate while many registers are still empty
+        if raw <= 2.5 * m and zero_registers:
+            return int(round(m * math.log(m / zero_registers)))
+        return int(round(raw))
+
+
+def encode_key(key: Any) -> str:
+    """Make a value safe to use as a MongoDB field name"""
+    if key is None or key == "":
+        return "Unknown"
+    return str(key).replace('%', '%25').replace('.', '%2E').replace('$', '%24')
+
+
+def decode_key(key: str) -> str:
+    return key.replace('%24', '$').replace('%2E', '.').replace('%25', '%')
+
+
+def bucket_start(timestamp: datetime, granularity: str) -> datetime:
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    timestamp = timestamp.astimezone(timezone.utc)
+    if granularity == HOURLY:
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def bucket_id(start: datetime, granularity: str) -> str:
+    return start.strftime("%Y-%m-%dT%H" if granularity == HOURLY else "%Y-%m-%d")
+
+
+def _utc(timestamp: datetime) -> datetime:
+    return timestamp if timestamp.tzinfo else timestamp.replace(tzinfo=timezone.utc)
+
+
+def _new_bucket() -> Dict[str, Any]:
+    return {"visits": 0, "clicks": 0, "pages": Counter(), "countries": Counter(),
+            "element_types": Counter(), "hll": {}}
+
+
+class AnalyticsRollups:
+    """Maintains visitor_rollups_hourly / visitor_rollups_daily from raw events"""
+
+    def __init__(self, db, lease_seconds: int = None):
+        self.db = db
+        self.collections = {
+            HOURLY: db.visitor_rollups_hourly,
+            DAILY: db.visitor_rollups_daily,
+        }
+        self.state = db.analytics_rollup_state
+        self.lease_seconds = lease_seconds or int(os.environ.get('ANALYTICS_BACKFILL_LEASE_SECONDS', '300'))
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._task: Optional[asyncio.Task] = None
+        self.last_error: Optional[str] = None
+
+    async def ensure_indexes(self):
+        for collection in self.collections.values():
+            await collection.create_index("bucket_start")
+
+    async def apply(self, source: str, documents: Iterable[Dict[str, Any]]):
+        """Fold a batch of raw events into the rollups with $inc/$max upserts"""
+        buckets: Dict[tuple, Dict[str, Any]] = defaultdict(_new_bucket)
+        self._accumulate(buckets, source, documents)
+        await self._write(buckets)
+
+    @staticmethod
+    def _accumulate(buckets: Dict[tuple, Dict[str, Any]], source: str, documents: Iterable[Dict[str, Any]]):
+        for document in documents:
+            timestamp = document.get("timestamp")
+            if not isinstance(timestamp, datetime):
+                continue
+            for granularity in (HOURLY, DAILY):
+                start = bucket_start(timestamp, granularity)
+                bucket = buckets[(granularity, start)]
+                if source == "visitor_analytics":
+                    bucket["visits"] += 1
+                    bucket["pages"][encode_key(document.get("page_url"))] += 1
+                    bucket["countries"][encode_key(document.get("country"))] += 1
+                    if document.get("ip_address"):
+                        index, rank = HyperLogLog.register_for(document["ip_address"])
+                        if rank > bucket["hll"].get(index, 0):
+                            bucket["hll"][index] = rank
+                elif source == "click_analytics":
+                    bucket["clicks"] += 1
+                    bucket["element_types"][encode_key(document.get("element_type"))] += 1
+
+    async def _write(self, buckets: Dict[tuple, Dict[str, Any]], backfill: bool = False):
+        """Upsert accumulated buckets; backfilled buckets are written at most once"""
+        operations: Dict[str, List[UpdateOne]] = defaultdict(list)
+        for (granularity, start), bucket in buckets.items():
+            increments = {"visits": bucket["visits"], "clicks": bucket["clicks"]}
+            for field in ("pages", "countries", "element_types"):
+                for key, count in bucket[field].items():
+                    increments[f"{field}.{key}"] = count
+            selector: Dict[str, Any] = {"_id": bucket_id(start, granularity)}
+            update = {
+                "$inc": increments,
+                "$setOnInsert": {"bucket_start": start},
+            }
+            if bucket["hll"]:
+                update["$max"] = {f"hll.{index}": rank for index, rank in bucket["hll"].items()}
+            if backfill:
+                # A bucket already backfilled no longer matches, and its upsert fails as a duplicate
+                selector["backfilled"] = {"$ne": True}
+                update["$set"] = {"backfilled": True}
+            operations[granularity].append(UpdateOne(selector, update, upsert=True))
+
+        for granularity, ops in operations.items():
+            try:
+                await self.collections[granularity].bulk_write(ops, ordered=False)
+            except BulkWriteError as e:
+                # Two concurrent upserts of a new bucket can race; replay the losers once
+                failed = [ops[error["index"]] for error in e.details.get("writeErrors", [])
+                          if error.get("code") == 11000]
+                if not failed:
+                    raise
+                try:
+                    await self.collections[granularity].bulk_write(failed, ordered=False)
+                except BulkWriteError as replay_error:
+                    # Still duplicates on replay: written by an earlier, interrupted backfill
+                    errors = replay_error.details.get("writeErrors", [])
+                    if not backfill or any(error.get("code") != 11000 for error in errors):
+                        raise
+
+    async def start_backfill(self, until: datetime):
+        """Backfill events older than ``until`` in the background until some replica completes it"""
+        if self._task and not self._task.done():
+            return
+        self._task = asyncio.create_task(self._run_backfill(until))
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run_backfill(self, until: datetime):
+        while True:
+            try:
+                if await self.backfill(until):
+                    return
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"Analytics rollup backfill failed: {e}")
+            # Another replica holds the lease, or this attempt failed; try again once it could expire
+            await asyncio.sleep(self.lease_seconds)
+
+    async def _claim_backfill(self, until: datetime) -> Optional[Dict[str, Any]]:
+        """Take the backfill lease; None while another replica holds it"""
+        now = datetime.now(timezone.utc)
+        lease = {"owner": self.owner, "lease_until": now + timedelta(seconds=self.lease_seconds)}
+        try:
+            # The first claim fixes the cutoff; later events are counted by the ingest queue
+            await self.state.insert_one({
+                "_id": BACKFILL_STATE, "cutoff": until, "done_until": None, "completed": False,
+                "started_at": now, "completed_at": None, **lease,
+            })
+        except DuplicateKeyError:
+            result = await self.state.update_one(
+                {"_id": BACKFILL_STATE, "completed": False,
+                 "$or": [{"owner": self.owner}, {"lease_until": {"$lt": now}}]},
+                {"$set": lease},
+            )
+            if not result.matched_count:
+                return None
+        return await self.state.find_one({"_id": BACKFILL_STATE})
+
+    async def backfill(self, until: datetime) -> bool:
+        """Build rollups from raw events older than the backfill cutoff, a day at a time
+
+        Returns True once the backfill is complete, here or on another replica,
+        and False while another replica is running it.
+        """
+        state = await self.state.find_one({"_id": BACKFILL_STATE})
+        if state and state["completed"]:
+            return True
+        state = await self._claim_backfill(until)
+        if state is None:
+            return False
+        cutoff = _utc(state["cutoff"])
+
+        if state["done_until"]:
+            day = _utc(state["done_until"])
+            logger.info(f"Resuming analytics rollup backfill from {day.isoformat()}")
+        else:
+            first = [
+                document["timestamp"] for document in await asyncio.gather(*(
+                    self.db[source].find_one({"timestamp": {"$lt": cutoff}}, {"timestamp": 1},
+                                             sort=[("timestamp", 1)])
+                    for source in EVENT_FIELDS
+                )) if document
+            ]
+            day = bucket_start(min(first), DAILY) if first else cutoff
+            logger.info("Backfilling analytics rollups from raw events")
+
+        while day < cutoff:
+            end = min(day + timedelta(days=1), cutoff)
+            await self._backfill_window(day, end)
+            now = datetime.now(timezone.utc)
+            result = await self.state.update_one(
+                {"_id": BACKFILL_STATE, "owner": self.owner},
+                {"$set": {"done_until": end, "lease_until": now + timedelta(seconds=self.lease_seconds)}},
+            )
+            if not result.matched_count:
+                logger.warning("Lost the analytics rollup backfill lease to another replica")
+                return False
+            day = end
+
+        await self.state.update_one(
+            {"_id": BACKFILL_STATE},
+            {"$set": {"completed": True, "completed_at": datetime.now(timezone.utc), "lease_until": None}},
+        )
+        self.last_error = None
+        logger.info("Analytics rollup backfill complete")
+        return True
+
+    async def _backfill_window(self, start: datetime, end: datetime):
+        buckets: Dict[tuple, Dict[str, Any]] = defaultdict(_new_bucket)
+        for source, fields in EVENT_FIELDS.items():
+            async for document in self.db[source].find({"timestamp": {"$gte": start, "$lt": end}}, fields):
+                self._accumulate(buckets, source, (document,))
+        if buckets:
+            await self._write(buckets, backfill=True)
+
+    async def retained_since(self) -> Optional[datetime]:
+        """Oldest event time the backfill still has to read, or None once it is complete"""
+        state = await self.state.find_one({"_id": BACKFILL_STATE})
+        if state and state["completed"]:
+            return None
+        if state and state["done_until"]:
+            return _utc(state["done_until"])
+        return datetime.min.replace(tzinfo=timezone.utc)
+
+    async def fetch(self, granularity: str, start: datetime, end: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        query: Dict[str, Any] = {"$gte": start}
+        if end is not None:
+            query["$lt"] = end
+        return await self.collections[granularity].find(
+            {"bucket_start": query}
+        ).sort("bucket_start", 1).to_list(length=None)
+
+    @staticmethod
+    def summarize(documents: List[Dict[str, Any]], top: int = 10) -> Dict[str, Any]:
+        """Merge rollup documents into totals, top lists and a unique-visitor estimate"""
+        pages, countries, element_types = Counter(), Counter(), Counter()
+        sketch = HyperLogLog()
+        visits = clicks = 0
+        for document in documents:
+            visits += document.get("visits", 0)
+            clicks += document.get("clicks", 0)
+            pages.update(document.get("pages", {}))
+            countries.update(document.get("countries", {}))
+            element_types.update(document.get("element_types", {}))
+            sketch.merge(document.get("hll", {}))
+
+        def ranked(counter: Counter):
+            return [{"_id": decode_key(key), "count": count} for key, count in counter.most_common(top)]
+
+        return {
+            "visits": visits,
+            "clicks": clicks,
+            "unique_visitors": sketch.estimate(),
+            "top_pages": ranked(pages),
+            "top_countries": ranked(countries),
+            "top_element_types": ranked(element_types),
+        }
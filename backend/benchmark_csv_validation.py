@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Compare the column-wise CSV validator with the previous row-by-row one on
+synthetic donation and visitor spreadsheets, and check both report exactly the
+same errors.
+
+    python benchmark_csv_validation.py [--rows 100000] [--error-rate 0.01]
+"""
+
+import argparse
+import time
+from datetime import datetime
+from io import StringIO
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+from csv_import import CURRENCIES, DATE_FIELDS, REQUIRED_FIELDS, YN_FIELDS, validate_csv_data
+
+# Accepted by one parser but not the other, or otherwise easy to get wrong
+EDGE_DATES = ['2024-1-5', '1500-01-01', '9999-12-31', '2024-02-30', '2024-13-01', ' 2024-01-01', '20240101', '']
+EDGE_AMOUNTS = ['1_000', ' 12 ', '1e3', 'nan', 'inf', '-0', '1,000', '$5', '']
+
+
+def validate_rows(df: pd.DataFrame, file_type: str) -> List[str]:
+    """The row-by-row validator that ``csv_import.validate_csv_data`` replaced"""
+    errors = []
+    for field in REQUIRED_FIELDS.get(file_type, []):
+        if field not in df.columns:
+            errors.append(f"Missing required field: {field}")
+
+    for index, row in df.iterrows():
+        row_num = index + 2
+        if 'email' in row and pd.notna(row['email']):
+            if '@' not in str(row['email']):
+                errors.append(f"Row {row_num}: Invalid email format: {row['email']}")
+        for date_field in DATE_FIELDS:
+            if date_field in row and pd.notna(row[date_field]):
+                try:
+                    datetime.strptime(str(row[date_field]), '%Y-%m-%d')
+                except ValueError:
+                    errors.append(f"Row {row_num}: Invalid date format in {date_field}: {row[date_field]}. Expected YYYY-MM-DD")
+        if 'amount_currency' in row and pd.notna(row['amount_currency']):
+            if str(row['amount_currency']).upper() not in CURRENCIES:
+                errors.append(f"Row {row_num}: Invalid currency code: {row['amount_currency']}. Must be USD or LRD")
+        if 'amount' in row and pd.notna(row['amount']):
+            try:
+                float(row['amount'])
+            except ValueError:
+                errors.append(f"Row {row_num}: Amount must be numeric: {row['amount']}")
+        for yn_field in YN_FIELDS:
+            if yn_field in row and pd.notna(row[yn_field]):
+                if str(row[yn_field]).upper() not in ['Y', 'N']:
+                    errors.append(f"Row {row_num}: {yn_field} must be Y or N: {row[yn_field]}")
+    return errors
+
+
+def _corrupt(rng: np.random.Generator, values: np.ndarray, bad: List[str], rate: float) -> np.ndarray:
+    values = values.astype(object)
+    hits = rng.random(len(values)) < rate
+    values[hits] = rng.choice(np.array(bad, dtype=object), hits.sum())
+    # A few blanks, which are skipped rather than reported
+    values[rng.random(len(values)) < rate / 2] = None
+    return values
+
+
+def _dates(rng: np.random.Generator, rows: int) -> np.ndarray:
+    days = rng.integers(0, 3 * 365, rows)
+    return (np.datetime64('2022-01-01') + days.astype('timedelta64[D]')).astype(str)
+
+
+def donations(rows: int, rate: float, seed: int = 7) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    amounts = np.round(rng.gamma(2.0, 40.0, rows), 2).astype(str)
+    return pd.DataFrame({
+        'donor_name': [f"Donor {i}" for i in range(rows)],
+        'email': _corrupt(rng, np.array([f"donor{i}@example.org" for i in range(rows)]),
+                          ['donor.example.org', 'n/a'], rate),
+        'amount': _corrupt(rng, amounts, EDGE_AMOUNTS + ['ten', 'N/A'], rate),
+        'amount_currency': _corrupt(rng, rng.choice(['USD', 'LRD', 'usd', 'lrd'], rows), ['EUR', 'US$'], rate),
+        'date_iso': _corrupt(rng, _dates(rng, rows), EDGE_DATES + ['01/05/2024', 'soon'], rate),
+        'anonymous_y_n': _corrupt(rng, rng.choice(['Y', 'N', 'y', 'n'], rows), ['yes', 'No', '1'], rate),
+    })
+
+
+def visitors(rows: int, rate: float, seed: int = 11) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'name': [f"Visitor {i}" for i in range(rows)],
+        'email': _corrupt(rng, np.array([f"visitor{i}@example.org" for i in range(rows)]),
+                          ['visitor', 'none'], rate),
+        'date_iso': _corrupt(rng, _dates(rng, rows), EDGE_DATES, rate),
+        'consent_y_n': _corrupt(rng, rng.choice(['Y', 'N'], rows), ['yes', 'X'], rate),
+    })
+
+
+def _timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--error-rate", type=float, default=0.01)
+    args = parser.parse_args()
+
+    for file_type, build in (('donations', donations), ('visitors', visitors)):
+        # Read back through CSV so column dtypes match a real import
+        df = pd.read_csv(StringIO(build(args.rows, args.error_rate).to_csv(index=False)))
+
+        expected, row_seconds = _timed(validate_rows, df, file_type)
+        actual, column_seconds = _timed(validate_csv_data, df, file_type)
+        if actual != expected:
+            mismatch = next(i for i, (a, b) in enumerate(zip(actual + [None], expected + [None])) if a != b)
+            raise SystemExit(f"{file_type}: results differ at error {mismatch}: "
+                             f"{actual[mismatch:mismatch + 1]} != {expected[mismatch:mismatch + 1]}")
+        print(f"{file_type:<10} {len(df):>8} rows {len(expected):>6} errors  "
+              f"row-by-row {row_seconds:8.3f}s  column-wise {column_seconds:7.3f}s  "
+              f"{row_seconds / column_seconds:6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+"""
+Response compression
+Brotli or gzip is chosen from Accept-Encoding, and only content types that
+compress well are encoded once they pass a per-type size threshold. The same
+helpers back the ASGI middleware, the response cache's pre-compressed
+variants and pre-compressed static files.
+"""
+
+import asyncio
+import gzip
+import logging
+import mimetypes
+import os
+import zlib
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import StaticFiles
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Minimum body size (bytes) before a content type is compressed; unlisted types are never compressed
+COMPRESSION_THRESHOLDS: Dict[str, int] = {
+    "application/json": 1024,
+    "application/rss+xml": 512,
+    "application/xml": 512,
+    "text/xml": 512,
+    "text/csv": 1024,
+    "text/html": 1024,
+    "text/plain": 1024,
+    "text/css": 1024,
+    "application/javascript": 1024,
+    "image/svg+xml": 1024,
+}
+
+# Dynamic responses favour speed; static files are compressed once, so use the best ratio
+BROTLI_DYNAMIC_QUALITY = int(os.environ.get('BROTLI_QUALITY', '5'))
+GZIP_DYNAMIC_LEVEL = int(os.environ.get('GZIP_LEVEL', '6'))
+
+
+def threshold_for(media_type: Optional[str]) -> Optional[int]:
+    if not media_type:
+        return None
+    return COMPRESSION_THRESHOLDS.get(media_type.split(";")[0].strip().lower())
+
+
+def negotiate(accept_encoding: Optional[str]) -> Optional[str]:
+    """Pick ``br`` or ``gzip`` from an Accept-Encoding header, honouring q=0"""
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for part in accept_encoding.split(","):
+        pieces = part.strip().split(";")
+        coding = pieces[0].strip().lower()
+        quality = 1.0
+        for parameter in pieces[1:]:
+            name, _, value = parameter.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding:
+            accepted[coding] = quality
+    for coding in (["br"] if BROTLI_AVAILABLE else []) + ["gzip"]:
+        if accepted.get(coding, accepted.get("*", 0.0)) > 0:
+            return coding
+    return None
+
+
+def choose_encoding(accept_encoding: Optional[str], media_type: Optional[str], size: int) -> Optional[str]:
+    threshold = threshold_for(media_type)
+    if threshold is None or size < threshold:
+        return None
+    return negotiate(accept_encoding)
+
+
+def compress(body: bytes, encoding: str, best: bool = False) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=11 if best else BROTLI_DYNAMIC_QUALITY)
+    return gzip.compress(body, compresslevel=9 if best else GZIP_DYNAMIC_LEVEL, mtime=0)
+
+
+def weaken_etag(etag: Optional[str]) -> Optional[str]:
+    """An encoded body is not byte-identical to the original, so its validator becomes weak"""
+    if etag and not etag.startswith("W/"):
+        return f"W/{etag}"
+    return etag
+
+
+def _compressor(encoding: str):
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=BROTLI_DYNAMIC_QUALITY)
+        return compressor.process, compressor.finish
+    compressor = zlib.compressobj(GZIP_DYNAMIC_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress, compressor.flush
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing eligible responses, including streamed ones"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await _CompressedResponder(self.app, encoding)(scope, receive, send)
+
+
+class _CompressedResponder:
+    def __init__(self, app: ASGIApp, encoding: str):
+        self.app = app
+        self.encoding = encoding
+        self.send: Optional[Send] = None
+        self.start_message: Optional[Message] = None
+        self.threshold: Optional[int] = None
+        self.pending: List[bytes] = []
+        self.pending_size = 0
+        self.compressing = False
+        self.passthrough = False
+        self.process = self.finish = None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        self.send = send
+        await self.app(scope, receive, self.send_wrapper)
+
+    async def send_wrapper(self, message: Message):
+        if message["type"] == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            self.threshold = threshold_for(headers.get("content-type"))
+            if (
+                self.threshold is None
+                or "content-encoding" in headers
+                or message["status"] in (204, 206, 304)
+            ):
+                self.passthrough = True
+                await self.send(message)
+            else:
+                # Hold the start message until we know whether the body is big enough
+                self.start_message = message
+            return
+
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.compressing:
+            chunk = self.process(body)
+            if not more_body:
+                chunk += self.finish()
+            await self.send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+            return
+
+        self.pending.append(body)
+        self.pending_size += len(body)
+        if more_body and self.pending_size < self.threshold:
+            return
+
+        buffered = b"".join(self.pending)
+        self.pending = []
+        headers = MutableHeaders(raw=self.start_message["headers"])
+        if self.pending_size < self.threshold:
+            # Whole body arrived and is too small to be worth encoding
+            await self.send(self.start_message)
+            await self.send({"type": "http.response.body", "body": buffered, "more_body": False})
+            return
+
+        headers["Content-Encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        if "etag" in headers:
+            headers["ETag"] = weaken_etag(headers["etag"])
+        if not more_body:
+            compressed = compress(buffered, self.encoding)
+            headers["Content-Length"] = str(len(compressed))
+            await self.send(self.start_message)
+            await self.send({"type": "http.response.body", "body": compressed, "more_body": False})
+            return
+
+        # Streamed body: switch to incremental compression
+        if "content-length" in headers:
+            del headers["content-length"]
+        self.compressing = True
+        self.process, self.finish = _compressor(self.encoding)
+        await self.send(self.start_message)
+        await self.send({"type": "http.response.body", "body": self.process(buffered), "more_body": True})
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """StaticFiles that adds Cache-Control and serves compressible files from compressed copies
+
+    Compressed copies are written once to ``compressed_dir`` and rebuilt when the
+    source file changes. Images and other already-compressed formats are served as-is.
+    """
+
+    def __init__(self, *args, compressed_dir: Path, cache_control: str = "public, max-age=86400", **kwargs):
+        super().__init__(*args, **kwargs)
+        self.compressed_dir = Path(compressed_dir)
+        self.cache_control = cache_control
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        response = await super().get_response(path, scope)
+        if response.status_code not in (200, 304):
+            return response
+        response.headers["Cache-Control"] = self.cache_control
+        if response.status_code != 200 or not isinstance(response, FileResponse):
+            return response
+
+        source = Path(response.path)
+        media_type = response.media_type or mimetypes.guess_type(source.name)[0]
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding"), media_type, source.stat().st_size)
+        if encoding is None:
+            return response
+
+        try:
+            compressed = await asyncio.to_thread(self._compressed_copy, source, path, encoding)
+        except Exception as e:
+            logger.warning(f"Failed to pre-compress {path}: {e}")
+            return response
+        # Keep the source file's validators so conditional requests still match
+        return FileResponse(
+            compressed,
+            media_type=media_type,
+            headers={
+                "Content-Encoding": encoding,
+                "Vary": "Accept-Encoding",
+                "Cache-Control": self.cache_control,
+                "ETag": weaken_etag(response.headers.get("etag")),
+                "Last-Modified": response.headers.get("last-modified"),
+            },
+        )
+
+    def _compressed_copy(self, source: Path, path: str, encoding: str) -> Path:
+        target = self.compressed_dir / f"{path}.{encoding}"
+        if target.exists() and target.stat().st_mtime >= source.stat().st_mtime:
+            return target
+        target.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = target.with_name(target.name + ".tmp")
+        temp_path.write_bytes(compress(source.read_bytes(), encoding, best=True))
+        os.replace(temp_path, target)
+        return target
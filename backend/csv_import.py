@@ -0,0 +1,368 @@
+"""
+CRM spreadsheet import
+Validation runs column by column on whole DataFrames (``pd.to_datetime``,
+``pd.to_numeric``, vectorized string checks) instead of row by row, and still
+reports errors per spreadsheet row in the same order and wording as before.
+Rows are then written in batches (``insert_many`` or, in upsert mode, a
+``bulk_write`` keyed on each type's natural key), and write errors are mapped
+back to spreadsheet row numbers.
+"""
+
+import logging
+import os
+import uuid
+from datetime import date, datetime
+from typing import IO, Any, Callable, Dict, Iterator, List, Optional, Tuple, Type
+
+import numpy as np
+import openpyxl
+import pandas as pd
+from pydantic import BaseModel
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+# Required columns per import type
+REQUIRED_FIELDS = {
+    'visitors': ['name', 'email'],
+    'donations': ['donor_name', 'amount', 'amount_currency'],
+    'projects': ['project_code', 'name'],
+    'finance': ['type', 'category', 'amount', 'amount_currency'],
+    'tasks_reminders': ['due_date_iso', 'agency', 'description_short'],
+    'users_roles': ['name', 'role', 'email'],
+    'invoices': ['donor_name', 'amount', 'amount_currency'],
+    'stories': ['name_or_anonymous', 'story_text']
+}
+
+DATE_FIELDS = ['date_iso', 'start_date_iso', 'end_date_iso', 'due_date_iso']
+YN_FIELDS = ['consent_y_n', 'anonymous_y_n', 'approved_y_n']
+CURRENCIES = ['USD', 'LRD']
+
+# Fields identifying a record across imports, used by upsert mode; types without one can only be inserted
+NATURAL_KEYS = {
+    'visitors': ('email', 'date_iso'),
+    'donations': ('receipt_no',),
+    'projects': ('project_code',),
+    'finance': ('reference',),
+    'tasks_reminders': ('agency', 'due_date_iso', 'description_short'),
+    'users_roles': ('email',),
+    'invoices': ('receipt_no',),
+}
+
+IMPORT_MODES = ('insert', 'upsert')
+DEFAULT_BATCH_SIZE = int(os.environ.get('CSV_IMPORT_BATCH_SIZE', '1000'))
+MAX_BATCH_SIZE = 10000
+
+# Rows parsed, validated and written at a time when importing an uploaded file
+CHUNK_ROWS = int(os.environ.get('CSV_IMPORT_CHUNK_ROWS', '5000'))
+SPREADSHEET_FORMATS = {'.csv': 'csv', '.xlsx': 'xlsx'}
+
+
+def _parses(values: pd.Series, fast: Callable[[pd.Series], pd.Series], exact: Callable[[str], object]) -> pd.Series:
+    """Boolean mask of values that ``exact`` accepts, checked with ``fast`` first
+
+    ``fast`` is the vectorized parser; anything it rejects is re-checked once per
+    distinct value with ``exact`` (the scalar parser the rules are defined by), so
+    its narrower range or syntax never produces an error the scalar check would not.
+    """
+    ok = fast(values).notna()
+    if ok.all():
+        return ok
+    rejected = values[~ok]
+    accepted = set()
+    for value in rejected.unique():
+        try:
+            exact(value)
+            accepted.add(value)
+        except ValueError:
+            pass
+    if accepted:
+        ok[~ok] = rejected.isin(accepted).to_numpy()
+    return ok
+
+
+def _is_date(value: str):
+    return datetime.strptime(value, '%Y-%m-%d')
+
+
+def missing_fields(columns, file_type: str) -> List[str]:
+    return [f"Missing required field: {field}" for field in REQUIRED_FIELDS.get(file_type, []) if field not in columns]
+
+
+def row_errors(df: pd.DataFrame, file_type: str) -> List[Tuple[int, str]]:
+    """(row position, message) for every invalid value, in row-by-row order"""
+    # (row position, check order, message); sorted below into the row-by-row order
+    found: List[Tuple[int, int, str]] = []
+    positions = np.arange(len(df))
+    row_numbers = df.index + 2  # +2 for header and 0-based indexing
+    check = 0
+
+    def report(column: str, invalid: pd.Series, message: Callable[[int, object], str]):
+        for position in positions[invalid.to_numpy()]:
+            found.append((position, check, message(row_numbers[position], df[column].iat[position])))
+
+    def present(column: str) -> Tuple[pd.Series, pd.Series]:
+        mask = df[column].notna()
+        return mask, df[column][mask].astype(str)
+
+    # Validate email format
+    if 'email' in df.columns:
+        mask, values = present('email')
+        invalid = pd.Series(False, index=df.index)
+        invalid[mask] = (~values.str.contains('@', regex=False)).to_numpy()
+        report('email', invalid, lambda row, value: f"Row {row}: Invalid email format: {value}")
+    check += 1
+
+    # Validate date format (ISO dates should be YYYY-MM-DD)
+    for date_field in DATE_FIELDS:
+        if date_field in df.columns:
+            mask, values = present(date_field)
+            invalid = pd.Series(False, index=df.index)
+            invalid[mask] = (~_parses(
+                values, lambda v: pd.to_datetime(v, format='%Y-%m-%d', errors='coerce'), _is_date
+            )).to_numpy()
+            report(date_field, invalid, lambda row, value, field=date_field: (
+                f"Row {row}: Invalid date format in {field}: {value}. Expected YYYY-MM-DD"
+            ))
+        check += 1
+
+    # Validate currency codes
+    if 'amount_currency' in df.columns:
+        mask, values = present('amount_currency')
+        invalid = pd.Series(False, index=df.index)
+        invalid[mask] = (~values.str.upper().isin(CURRENCIES)).to_numpy()
+        report('amount_currency', invalid, lambda row, value: (
+            f"Row {row}: Invalid currency code: {value}. Must be USD or LRD"
+        ))
+    check += 1
+
+    # Validate amounts are numeric
+    if 'amount' in df.columns and not pd.api.types.is_numeric_dtype(df['amount']):
+        mask = df['amount'].notna()
+        values = df['amount'][mask]
+        invalid = pd.Series(False, index=df.index)
+        invalid[mask] = (~_parses(values, lambda v: pd.to_numeric(v, errors='coerce'), float)).to_numpy()
+        report('amount', invalid, lambda row, value: f"Row {row}: Amount must be numeric: {value}")
+    check += 1
+
+    # Validate Y/N fields
+    for yn_field in YN_FIELDS:
+        if yn_field in df.columns:
+            mask, values = present(yn_field)
+            invalid = pd.Series(False, index=df.index)
+            invalid[mask] = (~values.str.upper().isin(['Y', 'N'])).to_numpy()
+            report(yn_field, invalid, lambda row, value, field=yn_field: f"Row {row}: {field} must be Y or N: {value}")
+        check += 1
+
+    found.sort(key=lambda item: (item[0], item[1]))
+    return [(int(position), message) for position, _, message in found]
+
+
+def validate_csv_data(df: pd.DataFrame, file_type: str) -> List[str]:
+    """Validate CSV data and return list of errors"""
+    errors = missing_fields(df.columns, file_type)
+    errors.extend(message for _, message in row_errors(df, file_type))
+    return errors
+
+
+def spreadsheet_format(filename: str) -> str:
+    extension = os.path.splitext(filename or '')[1].lower()
+    if extension not in SPREADSHEET_FORMATS:
+        raise ValueError(f"Unsupported file extension. Must be one of: {', '.join(SPREADSHEET_FORMATS)}")
+    return SPREADSHEET_FORMATS[extension]
+
+
+def _cell(value) -> Optional[str]:
+    """Spreadsheet cell as the text a CSV export of it would contain"""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date().isoformat() if value.time() == datetime.min.time() else value.isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _xlsx_chunks(file: IO[bytes], chunk_rows: int) -> Iterator[pd.DataFrame]:
+    workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [str(name).strip() if name is not None else f"Unnamed: {i}" for i, name in enumerate(header)]
+        start, batch = 0, []
+        for row in rows:
+            if all(value is None for value in row):
+                continue  # blank lines are skipped like read_csv does
+            values = [_cell(value) for value in row[:len(columns)]]
+            batch.append(values + [None] * (len(columns) - len(values)))
+            if len(batch) == chunk_rows:
+                yield pd.DataFrame(batch, columns=columns, index=range(start, start + len(batch)), dtype=object)
+                start, batch = start + len(batch), []
+        if batch:
+            yield pd.DataFrame(batch, columns=columns, index=range(start, start + len(batch)), dtype=object)
+    finally:
+        workbook.close()
+
+
+def read_chunks(file: IO[bytes], file_format: str, chunk_rows: int = CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """DataFrames of at most ``chunk_rows`` rows, indexed by data row so row numbers carry on across chunks
+
+    Every value is read as text, so a column has the same type in every chunk
+    whatever the first rows of a chunk happen to contain.
+    """
+    if file_format == 'xlsx':
+        return _xlsx_chunks(file, chunk_rows)
+    return iter(pd.read_csv(file, chunksize=chunk_rows, dtype=str, encoding='utf-8-sig'))
+
+
+class ImportResult(BaseModel):
+    success: bool
+    imported_count: int
+    error_count: int
+    errors: List[str] = []
+    validation_errors: List[str] = []
+    # Existing records matched by their natural key in upsert mode
+    updated_count: int = 0
+
+
+class ImportOptions(BaseModel):
+    mode: str = 'insert'  # insert/upsert
+    # Stop at the first failing row instead of writing every row that is valid
+    ordered: bool = False
+    batch_size: int = DEFAULT_BATCH_SIZE
+
+
+def _write_error(error: Dict[str, Any]) -> str:
+    if error.get('code') == 11000 and error.get('keyValue'):
+        values = ', '.join(f"{field}={value!r}" for field, value in error['keyValue'].items())
+        return f"Duplicate key: {values}"
+    return error.get('errmsg', 'Write failed')
+
+
+class CsvImporter:
+    """Turns DataFrame rows into records and writes them in batches"""
+
+    def __init__(self, db, models: Dict[str, Type[BaseModel]]):
+        self.db = db
+        self.models = models
+
+    def check(self, file_type: str, options: ImportOptions):
+        """Raise ValueError for options this file type cannot be imported with"""
+        if file_type not in self.models:
+            raise ValueError(f"Unsupported file type: {file_type}")
+        if options.mode not in IMPORT_MODES:
+            raise ValueError(f"Invalid import mode. Must be one of: {', '.join(IMPORT_MODES)}")
+        if options.mode == 'upsert' and file_type not in NATURAL_KEYS:
+            raise ValueError(f"Upsert mode is not available for {file_type}: it has no natural key")
+        if not 1 <= options.batch_size <= MAX_BATCH_SIZE:
+            raise ValueError(f"batch_size must be between 1 and {MAX_BATCH_SIZE}")
+
+    async def import_frame(self, df: pd.DataFrame, file_type: str, options: Optional[ImportOptions] = None) -> ImportResult:
+        options = options or ImportOptions()
+        self.check(file_type, options)
+        result = ImportResult(success=False, imported_count=0, error_count=0)
+        try:
+            await self.import_chunk(df, file_type, options, result)
+        except Exception as e:
+            # e.g. a lost connection after some batches were written; report what was imported
+            logger.error(f"CSV import of {file_type} failed after {result.imported_count} records: {e}")
+            result.errors.append(f"Import processing error: {str(e)}")
+            return result
+        result.success = result.error_count == 0
+        return result
+
+    async def import_chunk(self, df: pd.DataFrame, file_type: str, options: ImportOptions, result: ImportResult,
+                           id_seed: Optional[str] = None, skip_existing: bool = False) -> bool:
+        """Import one chunk batch by batch into ``result``; False once an ordered import stopped
+
+        With ``id_seed`` record ids are derived from it and the row number, so a chunk
+        that is imported again (``skip_existing``, after an interrupted job) skips the
+        rows that were already written instead of duplicating them.
+        """
+        for start in range(0, len(df), options.batch_size):
+            batch = df.iloc[start:start + options.batch_size]
+            rows, documents, stopped = self._documents(batch, file_type, options, result, id_seed)
+            if skip_existing and options.mode == 'insert' and documents and 'id' in documents[0]:
+                rows, documents = await self._unwritten(file_type, rows, documents, result)
+            if documents and not await self._write(file_type, rows, documents, options, result):
+                stopped = True
+            if stopped:
+                result.errors.append("Import stopped at the first failed row (ordered mode); later rows were not imported")
+                return False
+        return True
+
+    def _documents(self, df: pd.DataFrame, file_type: str, options: ImportOptions, result: ImportResult,
+                   id_seed: Optional[str] = None) -> Tuple[List[int], List[Dict[str, Any]], bool]:
+        model_class = self.models[file_type]
+        key = NATURAL_KEYS[file_type] if options.mode == 'upsert' else ()
+        rows, documents = [], []
+        values = df.astype(object).where(df.notna(), None)
+        for row_number, record in zip(df.index + 2, values.to_dict('records')):
+            try:
+                document = model_class(**record).dict()
+                missing = [field for field in key if document.get(field) in (None, '')]
+                if missing:
+                    raise ValueError(f"{', '.join(missing)} required in upsert mode")
+            except Exception as e:
+                self._fail(result, row_number, e)
+                if options.ordered:
+                    return rows, documents, True
+                continue
+            if isinstance(document.get('created_at'), datetime):
+                document['created_at'] = document['created_at'].isoformat()
+            if id_seed and 'id' in document:
+                document['id'] = str(uuid.uuid5(uuid.NAMESPACE_URL, f"{id_seed}/{row_number}"))
+            rows.append(int(row_number))
+            documents.append(document)
+        return rows, documents, False
+
+    async def _unwritten(self, file_type: str, rows: List[int], documents: List[Dict[str, Any]],
+                         result: ImportResult) -> Tuple[List[int], List[Dict[str, Any]]]:
+        written = set(await self.db[file_type].distinct('id', {'id': {'$in': [document['id'] for document in documents]}}))
+        result.imported_count += len(written)
+        keep = [index for index, document in enumerate(documents) if document['id'] not in written]
+        return [rows[index] for index in keep], [documents[index] for index in keep]
+
+    @staticmethod
+    def _upsert(file_type: str, document: Dict[str, Any]) -> UpdateOne:
+        # The generated id and creation time belong to the first import of a record
+        first_import = {field: document[field] for field in ('id', 'created_at') if field in document}
+        update = {'$set': {field: value for field, value in document.items() if field not in first_import}}
+        if first_import:
+            update['$setOnInsert'] = first_import
+        return UpdateOne({field: document[field] for field in NATURAL_KEYS[file_type]}, update, upsert=True)
+
+    async def _write(self, file_type: str, rows: List[int], documents: List[Dict[str, Any]],
+                     options: ImportOptions, result: ImportResult) -> bool:
+        collection = self.db[file_type]
+        try:
+            if options.mode == 'upsert':
+                outcome = await collection.bulk_write(
+                    [self._upsert(file_type, document) for document in documents], ordered=options.ordered
+                )
+                result.imported_count += outcome.upserted_count
+                result.updated_count += outcome.matched_count
+            else:
+                await collection.insert_many(documents, ordered=options.ordered)
+                result.imported_count += len(documents)
+            return True
+        except BulkWriteError as e:
+            details = e.details
+            result.imported_count += details.get('nInserted', 0) + details.get('nUpserted', 0)
+            result.updated_count += details.get('nMatched', 0)
+            write_errors = details.get('writeErrors', [])
+            for error in write_errors:
+                # index is the position in this batch's operations, which follow ``rows``
+                self._fail(result, rows[error['index']], _write_error(error))
+            logger.warning(f"{file_type} import: {len(write_errors)} of {len(documents)} rows failed to write")
+            return not options.ordered
+
+    @staticmethod
+    def _fail(result: ImportResult, row_number: int, error):
+        result.error_count += 1
+        result.errors.append(f"Row {row_number}: {error}")
@@ -0,0 +1,224 @@
+"""
+Content-addressed document preview cache
+Preview images are rendered once by a background worker and named after the
+source document's content hash. A JSON manifest maps each preview field to its
+image URLs, so page requests only read the manifest. Sources are revalidated
+with conditional requests (ETag / Last-Modified) and re-rendered only when
+their content actually changes. With an image pipeline, every preview also gets
+responsive WebP/AVIF variants for ``<picture>`` elements.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+
+class PreviewSource:
+    """A document whose previews are rendered by ``render(content) -> [image bytes]``"""
+
+    def __init__(self, field: str, render: Callable[..., List[bytes]], prefix: str,
+                 url: Optional[str] = None, version: str = "1", extension: str = "png",
+                 render_kwargs: Optional[Dict[str, Any]] = None):
+        self.field = field
+        self.render = render
+        self.render_kwargs = render_kwargs or {}
+        self.prefix = prefix
+        # Sources without a URL (e.g. placeholders) are rendered from nothing, keyed by version
+        self.url = url
+        self.version = version
+        self.extension = extension
+
+
+class DocumentPreviewCache:
+    """Manifest of rendered previews plus the worker that keeps it current"""
+
+    def __init__(self, manifest_path: Path, output_dir: Path, url_prefix: str,
+                 refresh_hours: float = None, timeout: float = 30.0,
+                 run: Optional[Callable[..., Awaitable[Any]]] = None, pipeline=None):
+        self.manifest_path = Path(manifest_path)
+        self.output_dir = Path(output_dir)
+        self.url_prefix = url_prefix.rstrip("/")
+        self.refresh_hours = refresh_hours or float(os.environ.get('DOCUMENT_PREVIEW_REFRESH_HOURS', '24'))
+        self.timeout = timeout
+        # Awaitable runner for the CPU-bound render step, e.g. a process pool
+        self.run = run or asyncio.to_thread
+        # Optional ImagePipeline for responsive variants of each preview
+        self.pipeline = pipeline
+
+        self.sources: Dict[str, PreviewSource] = {}
+        self.manifest: Dict[str, Dict[str, Any]] = self._load_manifest()
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self.renders = 0
+        self.revalidations = 0
+        self.last_error: Optional[str] = None
+
+    def register(self, source: PreviewSource):
+        self.sources[source.field] = source
+
+    def previews(self) -> Dict[str, List[str]]:
+        """Image URLs per preview field; fields not rendered yet are empty"""
+        return {field: list(self.manifest.get(field, {}).get("images", [])) for field in self.sources}
+
+    def pictures(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Responsive ``<picture>`` data per preview field, one entry per image"""
+        return {field: list(self.manifest.get(field, {}).get("pictures", [])) for field in self.sources}
+
+    def _load_manifest(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            return json.loads(self.manifest_path.read_text())
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable preview manifest {self.manifest_path}: {e}")
+            return {}
+
+    def _save_manifest(self):
+        self.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self.manifest_path.with_name(self.manifest_path.name + ".tmp")
+        temp_path.write_text(json.dumps(self.manifest, indent=2, sort_keys=True))
+        os.replace(temp_path, self.manifest_path)
+
+    async def start(self):
+        """Render missing previews now, then revalidate sources every ``refresh_hours``"""
+        if self._task and not self._task.done():
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh_all()
+            except Exception as e:
+                logger.error(f"Document preview refresh failed: {e}")
+            await asyncio.sleep(self.refresh_hours * 3600)
+
+    async def refresh_all(self, force: bool = False) -> Dict[str, str]:
+        """Revalidate every source; returns what happened per field"""
+        async with self._lock:
+            outcome = {}
+            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout)) as session:
+                for field, source in self.sources.items():
+                    try:
+                        outcome[field] = await self._refresh_source(session, source, force)
+                    except Exception as e:
+                        self.last_error = f"{field}: {e}"
+                        outcome[field] = "failed"
+                        logger.warning(f"Failed to refresh previews for {field}: {e}")
+            self._save_manifest()
+            return outcome
+
+    async def _refresh_source(self, session: aiohttp.ClientSession, source: PreviewSource, force: bool) -> str:
+        entry = self.manifest.get(source.field, {})
+        current = (
+            not force and entry.get("url") == source.url and self._files_exist(entry)
+            and (self.pipeline is None or "pictures" in entry)
+        )
+
+        if source.url is None:
+            content, content_hash = None, hashlib.sha256(f"{source.prefix}:{source.version}".encode()).hexdigest()
+            validators = {}
+        else:
+            headers = {}
+            if current and entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if current and entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+            self.revalidations += 1
+            async with session.get(source.url, headers=headers) as response:
+                if response.status == 304:
+                    entry["checked_at"] = datetime.now(timezone.utc).isoformat()
+                    return "not_modified"
+                if response.status != 200:
+                    raise RuntimeError(f"HTTP {response.status}")
+                content = await response.read()
+                validators = {"etag": response.headers.get("ETag"), "last_modified": response.headers.get("Last-Modified")}
+            content_hash = hashlib.sha256(content).hexdigest()
+
+        checked = {"checked_at": datetime.now(timezone.utc).isoformat(), **validators}
+        if current and entry.get("content_hash") == content_hash and entry.get("version") == source.version:
+            entry.update(checked)
+            return "unchanged"
+
+        started = time.perf_counter()
+        images = await self.run(source.render, content, **source.render_kwargs)
+        if not images:
+            # Keep serving the previous previews rather than replacing them with nothing
+            raise RuntimeError("renderer produced no images")
+        names = await asyncio.to_thread(self._write_images, source, content_hash, images)
+        pictures = []
+        if self.pipeline is not None:
+            for index, data in enumerate(images, start=1):
+                manifest = await self.pipeline.process(data, source=f"preview:{source.field}:{index}")
+                pictures.append(self.pipeline.picture(manifest))
+        self.renders += 1
+        stale = set(entry.get("files", [])) - set(names)
+
+        self.manifest[source.field] = {
+            "url": source.url,
+            "version": source.version,
+            "content_hash": content_hash,
+            "files": names,
+            "images": [f"{self.url_prefix}/{name}" for name in names],
+            "pictures": pictures,
+            "rendered_at": datetime.now(timezone.utc).isoformat(),
+            "render_seconds": round(time.perf_counter() - started, 2),
+            **checked,
+        }
+        # Previous renders of this source are no longer referenced
+        for name in stale:
+            (self.output_dir / name).unlink(missing_ok=True)
+        logger.info(f"Rendered {len(names)} previews for {source.field}")
+        return "rendered"
+
+    def _files_exist(self, entry: Dict[str, Any]) -> bool:
+        return bool(entry.get("files")) and all((self.output_dir / name).exists() for name in entry["files"])
+
+    def _write_images(self, source: PreviewSource, content_hash: str, images: List[bytes]) -> List[str]:
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        names = []
+        for index, data in enumerate(images, start=1):
+            name = f"{source.prefix}_{content_hash[:16]}_{index}.{source.extension}"
+            path = self.output_dir / name
+            if not path.exists():
+                temp_path = path.with_name(path.name + ".tmp")
+                temp_path.write_bytes(data)
+                os.replace(temp_path, path)
+            names.append(name)
+        return names
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sources": {
+                field: {
+                    key: self.manifest.get(field, {}).get(key)
+                    for key in ("content_hash", "images", "rendered_at", "checked_at", "render_seconds")
+                }
+                for field in self.sources
+            },
+            "running": bool(self._task and not self._task.done()),
+            "refresh_hours": self.refresh_hours,
+            "renders": self.renders,
+            "revalidations": self.revalidations,
+            "last_error": self.last_error,
+        }
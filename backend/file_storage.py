@@ -0,0 +1,624 @@
+"""
+Async project file storage
+One interface with Dropbox, local disk and S3-compatible implementations, plus a
+size-bounded LRU disk cache that any of them can sit behind. The Dropbox and
+boto3 SDKs are synchronous, so their calls run on a small dedicated thread pool
+instead of the event loop. Large uploads are sent in chunks (upload sessions,
+multipart uploads) and downloads are streamed with HTTP Range support, so
+neither direction holds a whole file in memory.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, Union
+
+import aiofiles
+import boto3
+import dropbox
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+# Dropbox caps a single files_upload call at 150 MB; sessions have no practical limit
+DROPBOX_CHUNK_BYTES = int(os.environ.get('DROPBOX_CHUNK_MB', '8')) * MB
+# S3 multipart parts must be at least 5 MB (except the last)
+S3_PART_BYTES = max(int(os.environ.get('S3_PART_MB', '8')), 5) * MB
+DOWNLOAD_CHUNK_BYTES = int(os.environ.get('FILE_DOWNLOAD_CHUNK_KB', '256')) * 1024
+
+
+class RangeNotSatisfiable(Exception):
+    """The requested byte range lies outside the file"""
+
+
+def parse_byte_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """(start, end) inclusive for a single-range ``Range`` header, None for the whole file
+
+    Multiple ranges are not supported and are answered with the whole file, which
+    RFC 9110 allows.
+    """
+    if not header:
+        return None
+    match = re.fullmatch(r"\s*bytes=(\d*)-(\d*)\s*", header)
+    if not match or (not match.group(1) and not match.group(2)):
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        # Suffix range: the last N bytes
+        start = max(size - int(last), 0)
+        end = size - 1
+    if start >= size or start > end:
+        raise RangeNotSatisfiable(f"bytes {first}-{last} outside {size} byte file")
+    return start, end
+
+
+async def _read_chunk(source, size: int) -> bytes:
+    data = source.read(size)
+    if asyncio.iscoroutine(data):
+        data = await data
+    return data
+
+
+class FileStorage:
+    """Storage interface for project files
+
+    Paths look like ``/projects/<project_code>/<category>/<filename>``. Uploads
+    never overwrite: with ``autorename`` an existing name gets a `` (1)`` suffix,
+    so a stored path always refers to the same content.
+    """
+
+    name = "base"
+
+    async def upload(self, path: str, source: Union[bytes, Any], autorename: bool = True) -> Dict[str, Any]:
+        """Upload ``bytes`` or a file-like object (e.g. an ``UploadFile``) read chunk by chunk"""
+        raise NotImplementedError
+
+    async def stat(self, path: str) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def stream(self, path: str, start: int = 0, end: Optional[int] = None,
+               chunk_bytes: int = DOWNLOAD_CHUNK_BYTES) -> AsyncIterator[bytes]:
+        """Yield the file (or bytes ``start``..``end`` inclusive) chunk by chunk"""
+        raise NotImplementedError
+
+    async def download(self, path: str) -> Tuple[bytes, Dict[str, Any]]:
+        """Whole file in memory; only for small files such as receipts sent for analysis"""
+        content = b"".join([chunk async for chunk in self.stream(path)])
+        return content, await self.stat(path)
+
+    async def list_folder(self, path: str, recursive: bool = False) -> List[Dict[str, Any]]:
+        """Files in ``path`` (and its subfolders if ``recursive``); a missing folder is empty"""
+        raise NotImplementedError
+
+    async def list_changes(self, path: str, cursor: Optional[str] = None) -> Dict[str, Any]:
+        """Files under ``path`` changed since ``cursor``
+
+        Returns ``entries`` (file infos), ``deleted`` (lower-cased paths), the next
+        ``cursor`` and ``reset``: when true, ``entries`` is the complete listing and
+        anything not in it is gone. Storages without change tracking always reset.
+        """
+        return {"entries": await self.list_folder(path, recursive=True), "deleted": [], "cursor": None, "reset": True}
+
+    def close(self):
+        pass
+
+
+class _ThreadedStorage(FileStorage):
+    """Base for storages whose client library blocks"""
+
+    def __init__(self, max_workers: int):
+        # Bounds concurrent requests as well as the threads they occupy
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=self.name)
+
+    async def _call(self, func, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, lambda: func(*args, **kwargs)
+        )
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class DropboxStorage(_ThreadedStorage):
+    """Dropbox files API with the blocking SDK calls moved off the event loop"""
+
+    name = "dropbox"
+
+    def __init__(self, access_token: str, max_workers: int = None, chunk_bytes: int = DROPBOX_CHUNK_BYTES,
+                 timeout: float = None):
+        super().__init__(max_workers or int(os.environ.get('DROPBOX_MAX_WORKERS', '4')))
+        self.client = dropbox.Dropbox(
+            access_token, timeout=timeout or float(os.environ.get('DROPBOX_TIMEOUT_SECONDS', '100'))
+        )
+        self.chunk_bytes = chunk_bytes
+
+    async def upload(self, path: str, source: Union[bytes, Any], autorename: bool = True) -> Dict[str, Any]:
+        if isinstance(source, (bytes, bytearray)):
+            source = _BytesReader(source)
+        mode = dropbox.files.WriteMode('add')
+
+        chunk = await _read_chunk(source, self.chunk_bytes)
+        following = await _read_chunk(source, self.chunk_bytes) if len(chunk) == self.chunk_bytes else b""
+        if not following:
+            # Small file: one request
+            metadata = await self._call(
+                self.client.files_upload, bytes(chunk), path, mode=mode, autorename=autorename
+            )
+            return _file_info(metadata)
+
+        start = await self._call(self.client.files_upload_session_start, bytes(chunk))
+        cursor = dropbox.files.UploadSessionCursor(session_id=start.session_id, offset=len(chunk))
+        chunk = following
+        while True:
+            following = await _read_chunk(source, self.chunk_bytes)
+            if not following:
+                break
+            await self._call(self.client.files_upload_session_append_v2, bytes(chunk), cursor)
+            cursor.offset += len(chunk)
+            chunk = following
+        commit = dropbox.files.CommitInfo(path=path, mode=mode, autorename=autorename)
+        metadata = await self._call(self.client.files_upload_session_finish, bytes(chunk), cursor, commit)
+        logger.info(f"Uploaded {cursor.offset + len(chunk)} bytes to {metadata.path_display} in a session")
+        return _file_info(metadata)
+
+    async def stat(self, path: str) -> Dict[str, Any]:
+        return _file_info(await self._call(self.client.files_get_metadata, path))
+
+    async def stream(self, path: str, start: int = 0, end: Optional[int] = None,
+                     chunk_bytes: int = DOWNLOAD_CHUNK_BYTES) -> AsyncIterator[bytes]:
+        headers = None
+        if start or end is not None:
+            headers = {"Range": f"bytes={start}-{'' if end is None else end}"}
+        _, response = await self._call(self.client.files_download, path, extra_headers=headers)
+        try:
+            chunks = response.iter_content(chunk_size=chunk_bytes)
+            while True:
+                chunk = await self._call(next, chunks, None)
+                if chunk is None:
+                    break
+                yield chunk
+        finally:
+            response.close()
+
+    async def download(self, path: str) -> Tuple[bytes, Dict[str, Any]]:
+        metadata, response = await self._call(self.client.files_download, path)
+        try:
+            content = await self._call(lambda: response.content)
+        finally:
+            response.close()
+        return content, _file_info(metadata)
+
+    async def list_folder(self, path: str, recursive: bool = False) -> List[Dict[str, Any]]:
+        entries = []
+        try:
+            result = await self._call(self.client.files_list_folder, path, recursive=recursive)
+        except dropbox.exceptions.ApiError as e:
+            if e.error.is_path() and e.error.get_path().is_not_found():
+                return []
+            raise
+        while True:
+            entries.extend(_file_info(entry) for entry in result.entries if isinstance(entry, dropbox.files.FileMetadata))
+            if not result.has_more:
+                return entries
+            result = await self._call(self.client.files_list_folder_continue, result.cursor)
+
+    async def list_changes(self, path: str, cursor: Optional[str] = None) -> Dict[str, Any]:
+        reset = cursor is None
+        try:
+            if cursor:
+                result = await self._call(self.client.files_list_folder_continue, cursor)
+            else:
+                result = await self._call(self.client.files_list_folder, path, recursive=True)
+        except dropbox.exceptions.ApiError as e:
+            if cursor and e.error.is_reset():
+                # Dropbox expired the cursor; start again from a full listing
+                logger.info(f"Dropbox cursor for {path} was reset")
+                return await self.list_changes(path)
+            if not cursor and e.error.is_path() and e.error.get_path().is_not_found():
+                return {"entries": [], "deleted": [], "cursor": None, "reset": True}
+            raise
+
+        entries, deleted = [], []
+        while True:
+            for entry in result.entries:
+                if isinstance(entry, dropbox.files.FileMetadata):
+                    entries.append(_file_info(entry))
+                elif isinstance(entry, dropbox.files.DeletedMetadata):
+                    deleted.append(entry.path_lower)
+            if not result.has_more:
+                break
+            result = await self._call(self.client.files_list_folder_continue, result.cursor)
+        return {"entries": entries, "deleted": deleted, "cursor": result.cursor, "reset": reset}
+
+    def close(self):
+        super().close()
+        self.client.close()
+
+
+class LocalStorage(FileStorage):
+    """Files in a local directory; also a stand-in for Dropbox/S3 in development and tests"""
+
+    name = "local"
+
+    def __init__(self, root: Path):
+        self.root = Path(root).resolve()
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _local_path(self, path: str) -> Path:
+        target = (self.root / path.lstrip("/")).resolve()
+        if self.root not in target.parents:
+            raise ValueError(f"Path outside storage root: {path}")
+        return target
+
+    def _info(self, target: Path, content_hash: Optional[str] = None) -> Dict[str, Any]:
+        relative = "/" + target.relative_to(self.root).as_posix()
+        stat = target.stat()
+        return {
+            'file_id': f"local:{hashlib.sha1(relative.encode()).hexdigest()[:24]}",
+            'filename': target.name,
+            'file_path': relative,
+            'file_size': stat.st_size,
+            'content_hash': content_hash,
+            'server_modified': datetime.fromtimestamp(stat.st_mtime, timezone.utc).isoformat(),
+        }
+
+    async def upload(self, path: str, source: Union[bytes, Any], autorename: bool = True) -> Dict[str, Any]:
+        if isinstance(source, (bytes, bytearray)):
+            source = _BytesReader(source)
+        target = self._local_path(path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = target.with_name(f".{target.name}.{uuid.uuid4().hex}.part")
+        digest = hashlib.sha256()
+        try:
+            async with aiofiles.open(temp_path, "wb") as handle:
+                while True:
+                    chunk = await _read_chunk(source, DROPBOX_CHUNK_BYTES)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    await handle.write(chunk)
+            target = await asyncio.to_thread(_commit_file, temp_path, target, autorename)
+        finally:
+            temp_path.unlink(missing_ok=True)
+        return self._info(target, digest.hexdigest())
+
+    async def stat(self, path: str) -> Dict[str, Any]:
+        return self._info(self._local_path(path))
+
+    def stream(self, path: str, start: int = 0, end: Optional[int] = None,
+               chunk_bytes: int = DOWNLOAD_CHUNK_BYTES) -> AsyncIterator[bytes]:
+        return _stream_file(self._local_path(path), start, end, chunk_bytes)
+
+    async def list_folder(self, path: str, recursive: bool = False) -> List[Dict[str, Any]]:
+        folder = self._local_path(path)
+        if not folder.is_dir():
+            return []
+        entries = await asyncio.to_thread(
+            lambda: sorted(
+                p for p in (folder.rglob("*") if recursive else folder.iterdir())
+                if p.is_file() and not p.name.startswith(".")
+            )
+        )
+        return [self._info(entry) for entry in entries]
+
+
+class S3Storage(_ThreadedStorage):
+    """S3-compatible object storage (AWS, MinIO, Spaces, R2) through boto3"""
+
+    name = "s3"
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: Optional[str] = None,
+                 region: Optional[str] = None, max_workers: int = None, part_bytes: int = S3_PART_BYTES):
+        super().__init__(max_workers or int(os.environ.get('S3_MAX_WORKERS', '8')))
+        # Credentials come from the standard AWS environment variables / config files
+        self.client = boto3.client("s3", endpoint_url=endpoint_url, region_name=region)
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        self.part_bytes = part_bytes
+
+    def _key(self, path: str) -> str:
+        return self.prefix + path.lstrip("/")
+
+    def _info(self, key: str, size: int, etag: Optional[str], modified: datetime) -> Dict[str, Any]:
+        return {
+            'file_id': f"s3:{hashlib.sha1(key.encode()).hexdigest()[:24]}",
+            'filename': key.rsplit("/", 1)[-1],
+            'file_path': "/" + key[len(self.prefix):],
+            'file_size': size,
+            'content_hash': (etag or "").strip('"') or None,
+            'server_modified': modified.isoformat(),
+        }
+
+    async def _exists(self, key: str) -> bool:
+        try:
+            await self._call(self.client.head_object, Bucket=self.bucket, Key=key)
+            return True
+        except self.client.exceptions.ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    async def upload(self, path: str, source: Union[bytes, Any], autorename: bool = True) -> Dict[str, Any]:
+        if isinstance(source, (bytes, bytearray)):
+            source = _BytesReader(source)
+        key = self._key(path)
+        if autorename:
+            # Not atomic across writers; good enough for admin uploads
+            for candidate in _renamed(key):
+                if not await self._exists(candidate):
+                    key = candidate
+                    break
+
+        chunk = await _read_chunk(source, self.part_bytes)
+        following = await _read_chunk(source, self.part_bytes) if len(chunk) == self.part_bytes else b""
+        if not following:
+            await self._call(self.client.put_object, Bucket=self.bucket, Key=key, Body=bytes(chunk))
+            return await self.stat("/" + key[len(self.prefix):])
+
+        upload_id = (await self._call(self.client.create_multipart_upload, Bucket=self.bucket, Key=key))["UploadId"]
+        parts = []
+        try:
+            while chunk:
+                part = await self._call(
+                    self.client.upload_part, Bucket=self.bucket, Key=key, UploadId=upload_id,
+                    PartNumber=len(parts) + 1, Body=bytes(chunk)
+                )
+                parts.append({"PartNumber": len(parts) + 1, "ETag": part["ETag"]})
+                chunk, following = following, (await _read_chunk(source, self.part_bytes) if following else b"")
+            await self._call(
+                self.client.complete_multipart_upload, Bucket=self.bucket, Key=key, UploadId=upload_id,
+                MultipartUpload={"Parts": parts}
+            )
+        except BaseException:
+            await self._call(self.client.abort_multipart_upload, Bucket=self.bucket, Key=key, UploadId=upload_id)
+            raise
+        logger.info(f"Uploaded {key} to S3 in {len(parts)} parts")
+        return await self.stat("/" + key[len(self.prefix):])
+
+    async def stat(self, path: str) -> Dict[str, Any]:
+        key = self._key(path)
+        head = await self._call(self.client.head_object, Bucket=self.bucket, Key=key)
+        return self._info(key, head["ContentLength"], head.get("ETag"), head["LastModified"])
+
+    async def stream(self, path: str, start: int = 0, end: Optional[int] = None,
+                     chunk_bytes: int = DOWNLOAD_CHUNK_BYTES) -> AsyncIterator[bytes]:
+        request = {"Bucket": self.bucket, "Key": self._key(path)}
+        if start or end is not None:
+            request["Range"] = f"bytes={start}-{'' if end is None else end}"
+        body = (await self._call(self.client.get_object, **request))["Body"]
+        try:
+            chunks = body.iter_chunks(chunk_size=chunk_bytes)
+            while True:
+                chunk = await self._call(next, chunks, None)
+                if chunk is None:
+                    break
+                yield chunk
+        finally:
+            body.close()
+
+    async def list_folder(self, path: str, recursive: bool = False) -> List[Dict[str, Any]]:
+        prefix = self._key(path).rstrip("/") + "/"
+
+        def list_objects():
+            paginator = self.client.get_paginator("list_objects_v2")
+            objects = []
+            pages = paginator.paginate(Bucket=self.bucket, Prefix=prefix, **({} if recursive else {"Delimiter": "/"}))
+            for page in pages:
+                objects.extend(page.get("Contents", []))
+            return objects
+
+        return [
+            self._info(item["Key"], item["Size"], item.get("ETag"), item["LastModified"])
+            for item in await self._call(list_objects)
+        ]
+
+
+class CachedStorage(FileStorage):
+    """Size-bounded LRU read-through disk cache in front of another storage
+
+    A file is cached on its first complete read and served from disk afterwards,
+    including byte ranges. Partial reads of uncached files pass straight through.
+    Stored paths never change content (see ``FileStorage``), so entries need no
+    revalidation; they are only evicted when the cache is over ``max_bytes``.
+    """
+
+    def __init__(self, backend: FileStorage, cache_dir: Path, max_bytes: int, max_file_bytes: int = None):
+        self.backend = backend
+        self.name = f"{backend.name}+cache"
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        # One large video should not flush every receipt out of the cache
+        self.max_file_bytes = max_file_bytes or max_bytes // 10
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        # Cache file name -> size, least recently used first; seeded from disk by access time
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total = 0
+        existing = [p for p in self.cache_dir.iterdir() if p.is_file() and not p.name.startswith(".")]
+        for entry in sorted(existing, key=lambda p: p.stat().st_atime):
+            self._add(entry.name, entry.stat().st_size)
+
+    def _cache_path(self, path: str) -> Path:
+        return self.cache_dir / hashlib.sha256(f"{self.backend.name}:{path}".encode()).hexdigest()
+
+    def _add(self, name: str, size: int):
+        self._total += size - self._entries.pop(name, 0)
+        self._entries[name] = size
+        while self._total > self.max_bytes and len(self._entries) > 1:
+            evicted, evicted_size = self._entries.popitem(last=False)
+            (self.cache_dir / evicted).unlink(missing_ok=True)
+            self._total -= evicted_size
+            self.evictions += 1
+
+    def _lookup(self, path: str) -> Optional[Path]:
+        cached = self._cache_path(path)
+        if cached.name in self._entries:
+            if cached.exists():
+                self._entries.move_to_end(cached.name)
+                return cached
+            self._total -= self._entries.pop(cached.name)
+        elif cached.exists():
+            # Written by another worker process sharing the directory
+            self._add(cached.name, cached.stat().st_size)
+            return cached
+        return None
+
+    def invalidate(self, path: str):
+        cached = self._cache_path(path)
+        self._total -= self._entries.pop(cached.name, 0)
+        cached.unlink(missing_ok=True)
+
+    async def upload(self, path: str, source: Union[bytes, Any], autorename: bool = True) -> Dict[str, Any]:
+        info = await self.backend.upload(path, source, autorename)
+        self.invalidate(info['file_path'])
+        return info
+
+    async def stat(self, path: str) -> Dict[str, Any]:
+        return await self.backend.stat(path)
+
+    async def stream(self, path: str, start: int = 0, end: Optional[int] = None,
+                     chunk_bytes: int = DOWNLOAD_CHUNK_BYTES) -> AsyncIterator[bytes]:
+        cached = self._lookup(path)
+        if cached is not None:
+            self.hits += 1
+            os.utime(cached)
+            async for chunk in _stream_file(cached, start, end, chunk_bytes):
+                yield chunk
+            return
+
+        self.misses += 1
+        if start or end is not None:
+            async for chunk in self.backend.stream(path, start, end, chunk_bytes):
+                yield chunk
+            return
+
+        cached = self._cache_path(path)
+        temp_path = cached.with_name(f".{cached.name}.{uuid.uuid4().hex}.part")
+        handle = await aiofiles.open(temp_path, "wb")
+        size = 0
+        complete = False
+        try:
+            async for chunk in self.backend.stream(path, chunk_bytes=chunk_bytes):
+                size += len(chunk)
+                if handle is not None:
+                    if size > self.max_file_bytes:
+                        await handle.close()
+                        handle = None
+                    else:
+                        await handle.write(chunk)
+                yield chunk
+            complete = True
+        finally:
+            if handle is not None:
+                await handle.close()
+                if complete:
+                    os.replace(temp_path, cached)
+                    self._add(cached.name, size)
+            temp_path.unlink(missing_ok=True)
+
+    async def download(self, path: str) -> Tuple[bytes, Dict[str, Any]]:
+        cached = self._lookup(path)
+        if cached is None:
+            return await super().download(path)
+        self.hits += 1
+        async with aiofiles.open(cached, "rb") as handle:
+            content = await handle.read()
+        return content, await self.stat(path)
+
+    async def list_folder(self, path: str, recursive: bool = False) -> List[Dict[str, Any]]:
+        return await self.backend.list_folder(path, recursive)
+
+    async def list_changes(self, path: str, cursor: Optional[str] = None) -> Dict[str, Any]:
+        return await self.backend.list_changes(path, cursor)
+
+    def close(self):
+        self.backend.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.backend.name,
+            "entries": len(self._entries),
+            "bytes": self._total,
+            "max_bytes": self.max_bytes,
+            "max_file_bytes": self.max_file_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class _BytesReader:
+    def __init__(self, data: bytes):
+        self._view = memoryview(data)
+        self._offset = 0
+
+    def read(self, size: int) -> bytes:
+        chunk = self._view[self._offset:self._offset + size]
+        self._offset += len(chunk)
+        return chunk.tobytes()
+
+
+def _file_info(metadata) -> Dict[str, Any]:
+    return {
+        'file_id': metadata.id,
+        'filename': metadata.name,
+        'file_path': metadata.path_display,
+        'file_size': metadata.size,
+        'content_hash': metadata.content_hash,
+        'server_modified': metadata.server_modified.isoformat(),
+    }
+
+
+def _renamed(path: str):
+    """``path``, then ``name (1).ext``, ``name (2).ext``... as Dropbox autorename does"""
+    yield path
+    directory, _, filename = path.rpartition("/")
+    stem, dot, extension = filename.rpartition(".")
+    if not dot:
+        stem, extension = filename, ""
+    counter = 1
+    while True:
+        name = f"{stem} ({counter}){dot}{extension}"
+        yield f"{directory}/{name}" if directory else name
+        counter += 1
+
+
+def _commit_file(temp_path: Path, target: Path, autorename: bool) -> Path:
+    if not autorename:
+        os.replace(temp_path, target)
+        return target
+    for candidate in _renamed(str(target)):
+        try:
+            # A hard link fails if the name exists, so two uploads never take the same name
+            os.link(temp_path, candidate)
+            return Path(candidate)
+        except FileExistsError:
+            continue
+
+
+async def _stream_file(path: Path, start: int = 0, end: Optional[int] = None,
+                       chunk_bytes: int = DOWNLOAD_CHUNK_BYTES) -> AsyncIterator[bytes]:
+    remaining = None if end is None else end - start + 1
+    async with aiofiles.open(path, "rb") as handle:
+        await handle.seek(start)
+        while remaining is None or remaining > 0:
+            chunk = await handle.read(chunk_bytes if remaining is None else min(chunk_bytes, remaining))
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
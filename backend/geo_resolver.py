@@ -0,0 +1,280 @@
+"""
+Layered IP geolocation resolver
+Lookups go through an in-memory LRU, an optional offline CIDR database,
+a MongoDB-backed cache and finally the ipapi.co API.
+"""
+
+import asyncio
+import bisect
+import csv
+import ipaddress
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+UNKNOWN_LOCATION = {"country": "Unknown", "city": "Unknown"}
+
+
+class LRUTTLCache:
+    """Small ordered-dict LRU where every entry carries its own expiry"""
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, ttl_seconds: float):
+        self._data[key] = (time.monotonic() + ttl_seconds, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class OfflineCIDRDatabase:
+    """CIDR ranges loaded into sorted start/end arrays for binary-search lookups
+
+    The source file is a CSV with a ``network`` column (e.g. ``41.57.80.0/20``)
+    and any of ``country``, ``city``, ``region``, ``latitude``, ``longitude``.
+    Ranges are expected not to overlap.
+    """
+
+    def __init__(self):
+        # One set of arrays per IP version so integer ranges never collide
+        self._starts: Dict[int, List[int]] = {4: [], 6: []}
+        self._ends: Dict[int, List[int]] = {4: [], 6: []}
+        self._locations: Dict[int, List[Dict[str, Any]]] = {4: [], 6: []}
+
+    @classmethod
+    def load(cls, path: Path) -> "OfflineCIDRDatabase":
+        database = cls()
+        rows = {4: [], 6: []}
+        with open(path, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                try:
+                    network = ipaddress.ip_network(row["network"].strip(), strict=False)
+                except (KeyError, ValueError):
+                    continue
+                location = {
+                    "country": row.get("country") or None,
+                    "city": row.get("city") or None,
+                    "region": row.get("region") or None,
+                    "latitude": float(row["latitude"]) if row.get("latitude") else None,
+                    "longitude": float(row["longitude"]) if row.get("longitude") else None,
+                }
+                rows[network.version].append(
+                    (int(network.network_address), int(network.broadcast_address), location)
+                )
+
+        for version, entries in rows.items():
+            entries.sort(key=lambda entry: entry[0])
+            database._starts[version] = [entry[0] for entry in entries]
+            database._ends[version] = [entry[1] for entry in entries]
+            database._locations[version] = [entry[2] for entry in entries]
+        return database
+
+    def lookup(self, ip: ipaddress._BaseAddress) -> Optional[Dict[str, Any]]:
+        starts = self._starts[ip.version]
+        value = int(ip)
+        index = bisect.bisect_right(starts, value) - 1
+        if index >= 0 and value <= self._ends[ip.version][index]:
+            return self._locations[ip.version][index]
+        return None
+
+    def __len__(self) -> int:
+        return len(self._starts[4]) + len(self._starts[6])
+
+
+class GeoResolver:
+    """Resolve IP addresses to locations with layered caching"""
+
+    def __init__(self, db=None, offline_db_path: Optional[str] = None):
+        self.collection = db.ip_geolocation_cache if db is not None else None
+        self.memory_ttl = int(os.environ.get('GEOIP_MEMORY_TTL_SECONDS', '3600'))
+        self.negative_ttl = int(os.environ.get('GEOIP_NEGATIVE_TTL_SECONDS', '300'))
+        self.persistent_ttl_days = int(os.environ.get('GEOIP_CACHE_TTL_DAYS', '30'))
+        self.api_timeout = float(os.environ.get('GEOIP_API_TIMEOUT_SECONDS', '3'))
+        self.api_cooldown = int(os.environ.get('GEOIP_API_COOLDOWN_SECONDS', '300'))
+        self.memory = LRUTTLCache(int(os.environ.get('GEOIP_MEMORY_MAX_ENTRIES', '10000')))
+
+        self.offline_db: Optional[OfflineCIDRDatabase] = None
+        offline_db_path = offline_db_path or os.environ.get('GEOIP_CIDR_DB')
+        if offline_db_path:
+            try:
+                self.offline_db = OfflineCIDRDatabase.load(Path(offline_db_path))
+                logger.info(f"Loaded offline geolocation database with {len(self.offline_db)} ranges")
+            except Exception as e:
+                logger.warning(f"Failed to load offline geolocation database {offline_db_path}: {e}")
+
+        self._http: Optional[httpx.AsyncClient] = None
+        self._api_blocked_until = 0.0
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.hits = {"memory": 0, "offline": 0, "persistent": 0, "api": 0, "private": 0, "unresolved": 0}
+
+    @staticmethod
+    def prefix_for(ip: ipaddress._BaseAddress) -> str:
+        """Network prefix shared by neighbouring addresses (/24 for IPv4, /48 for IPv6)"""
+        prefix_len = 24 if ip.version == 4 else 48
+        return str(ipaddress.ip_network(f"{ip}/{prefix_len}", strict=False))
+
+    async def ensure_indexes(self):
+        """Create the lookup and expiry indexes for the persistent cache"""
+        if self.collection is None:
+            return
+        await self.collection.create_index("key", unique=True)
+        await self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    async def close(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "hits": dict(self.hits),
+            "memory_entries": len(self.memory),
+            "offline_ranges": len(self.offline_db) if self.offline_db else 0,
+            "api_available": time.monotonic() >= self._api_blocked_until,
+        }
+
+    async def resolve(self, ip_address: str) -> Dict[str, Any]:
+        """Return a location dict for the address; never raises"""
+        cached = self.memory.get(ip_address)
+        if cached is not None:
+            self.hits["memory"] += 1
+            return cached
+
+        # Coalesce concurrent lookups for the same address
+        pending = self._inflight.get(ip_address)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[ip_address] = future
+        try:
+            location, ttl = await self._resolve_uncached(ip_address)
+            self.memory.set(ip_address, location, ttl)
+            future.set_result(location)
+            return location
+        except Exception as e:
+            logger.error(f"Failed to get IP location: {e}")
+            return UNKNOWN_LOCATION
+        finally:
+            if not future.done():
+                future.set_result(UNKNOWN_LOCATION)
+            del self._inflight[ip_address]
+
+    async def _resolve_uncached(self, ip_address: str) -> Tuple[Dict[str, Any], float]:
+        try:
+            ip = ipaddress.ip_address(ip_address)
+        except ValueError:
+            self.hits["unresolved"] += 1
+            return UNKNOWN_LOCATION, self.negative_ttl
+
+        # Loopback and LAN addresses never resolve upstream
+        if not ip.is_global:
+            self.hits["private"] += 1
+            return UNKNOWN_LOCATION, self.memory_ttl
+
+        if self.offline_db is not None:
+            location = self.offline_db.lookup(ip)
+            if location:
+                self.hits["offline"] += 1
+                return location, self.memory_ttl
+
+        prefix = self.prefix_for(ip)
+        location = await self._read_persistent(ip_address, prefix)
+        if location:
+            self.hits["persistent"] += 1
+            return location, self.memory_ttl
+
+        location = await self._fetch_from_api(ip_address)
+        if location:
+            self.hits["api"] += 1
+            await self._write_persistent(ip_address, prefix, location)
+            return location, self.memory_ttl
+
+        self.hits["unresolved"] += 1
+        return UNKNOWN_LOCATION, self.negative_ttl
+
+    async def _read_persistent(self, ip_address: str, prefix: str) -> Optional[Dict[str, Any]]:
+        if self.collection is None:
+            return None
+        try:
+            documents = await self.collection.find(
+                {"key": {"$in": [ip_address, prefix]}}, {"_id": 0}
+            ).to_list(2)
+        except Exception as e:
+            logger.warning(f"Geolocation cache read failed: {e}")
+            return None
+        # Prefer an exact address match over the shared prefix entry
+        documents.sort(key=lambda document: document["key"] != ip_address)
+        return documents[0]["location"] if documents else None
+
+    async def _write_persistent(self, ip_address: str, prefix: str, location: Dict[str, Any]):
+        if self.collection is None:
+            return
+        now = datetime.now(timezone.utc)
+        expires_at = now + timedelta(days=self.persistent_ttl_days)
+        try:
+            for key in (ip_address, prefix):
+                await self.collection.update_one(
+                    {"key": key},
+                    {"$set": {"location": location, "updated_at": now, "expires_at": expires_at}},
+                    upsert=True,
+                )
+        except Exception as e:
+            logger.warning(f"Geolocation cache write failed: {e}")
+
+    async def _fetch_from_api(self, ip_address: str) -> Optional[Dict[str, Any]]:
+        if time.monotonic() < self._api_blocked_until:
+            return None
+        if self._http is None:
+            self._http = httpx.AsyncClient(timeout=self.api_timeout)
+        try:
+            response = await self._http.get(f"https://ipapi.co/{ip_address}/json/")
+        except httpx.HTTPError as e:
+            logger.warning(f"ipapi.co unreachable, pausing lookups for {self.api_cooldown}s: {e}")
+            self._api_blocked_until = time.monotonic() + self.api_cooldown
+            return None
+
+        if response.status_code == 429:
+            logger.warning(f"ipapi.co rate limit hit, pausing lookups for {self.api_cooldown}s")
+            self._api_blocked_until = time.monotonic() + self.api_cooldown
+            return None
+        if response.status_code != 200:
+            return None
+
+        data = response.json()
+        if data.get("error"):
+            return None
+        return {
+            "country": data.get("country_name"),
+            "city": data.get("city"),
+            "region": data.get("region"),
+            "latitude": data.get("latitude"),
+            "longitude": data.get("longitude")
+        }
@@ -0,0 +1,198 @@
+"""
+Responsive image pipeline
+Source images (partner photos, document previews) are resized to a fixed set of
+widths and encoded as WebP, AVIF where Pillow supports it, and a JPEG/PNG
+fallback. Files are named after the source's content hash, so the same image is
+only ever processed once, and each source gets a manifest with ready-made
+``srcset`` strings so browsers on slow connections pick the smallest adequate file.
+"""
+
+import asyncio
+import hashlib
+import ipaddress
+import logging
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+from urllib.parse import urlsplit
+
+import aiohttp
+from PIL import features
+
+import renderers
+
+logger = logging.getLogger(__name__)
+
+RESPONSIVE_WIDTHS = (160, 320, 480, 640, 960, 1280)
+
+MIME_TYPES = {
+    "avif": "image/avif",
+    "webp": "image/webp",
+    "jpeg": "image/jpeg",
+    "png": "image/png",
+}
+
+# Most compact first, the order <source> elements should appear in a <picture>
+FORMAT_PREFERENCE = ("avif", "webp", "jpeg", "png")
+
+# Width of the plain ``src`` for browsers that ignore srcset
+DEFAULT_SRC_WIDTH = 640
+
+
+def default_formats() -> List[str]:
+    formats = ["webp", "jpeg"]
+    if os.environ.get('IMAGE_AVIF', 'true').lower() == 'true' and features.check("avif"):
+        formats.insert(0, "avif")
+    return formats
+
+
+class ImagePipeline:
+    """Content-addressed responsive variants with a MongoDB manifest per source image"""
+
+    def __init__(self, db, output_dir: Path, url_prefix: str,
+                 run: Optional[Callable[..., Awaitable[Any]]] = None,
+                 widths: Sequence[int] = RESPONSIVE_WIDTHS, formats: Optional[Sequence[str]] = None,
+                 quality: int = None, max_bytes: int = None, timeout: float = 30.0):
+        self.collection = db.image_manifests
+        self.output_dir = Path(output_dir)
+        self.url_prefix = url_prefix.rstrip("/")
+        # Awaitable runner for the CPU-bound resize step, e.g. a process pool
+        self.run = run or asyncio.to_thread
+        self.widths = tuple(sorted(widths))
+        self.formats = list(formats or default_formats())
+        self.quality = quality or int(os.environ.get('IMAGE_QUALITY', '78'))
+        self.max_bytes = max_bytes or int(os.environ.get('IMAGE_MAX_BYTES', str(15 * 1024 * 1024)))
+        self.timeout = timeout
+        self.processed = 0
+        self.reused = 0
+
+    async def get(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        return await self.collection.find_one({"content_hash": content_hash}, {"_id": 0})
+
+    async def process(self, image_bytes: bytes, source: Optional[str] = None) -> Dict[str, Any]:
+        """Manifest for an image, generating its variants unless they already exist"""
+        content_hash = hashlib.sha256(image_bytes).hexdigest()
+        manifest = await self.get(content_hash)
+        if manifest and self._files_exist(manifest):
+            self.reused += 1
+            if source and source not in manifest.get("sources", []):
+                await self.collection.update_one({"content_hash": content_hash}, {"$addToSet": {"sources": source}})
+                manifest["sources"].append(source)
+            return manifest
+
+        result = await self.run(renderers.responsive_variants, image_bytes, self.widths, self.formats, self.quality)
+        variants = await asyncio.to_thread(self._write_variants, content_hash, result["variants"])
+        self.processed += 1
+
+        manifest = {
+            "content_hash": content_hash,
+            "width": result["width"],
+            "height": result["height"],
+            "has_alpha": result["has_alpha"],
+            "variants": variants,
+            **self._srcsets(variants),
+            "processed_at": datetime.utcnow(),
+        }
+        update = {"$set": manifest}
+        if source:
+            update["$addToSet"] = {"sources": source}
+        else:
+            update["$setOnInsert"] = {"sources": []}
+        await self.collection.update_one({"content_hash": content_hash}, update, upsert=True)
+        return await self.get(content_hash)
+
+    async def from_url(self, url: str) -> Dict[str, Any]:
+        """Manifest for a remote image; URLs seen before are not downloaded again"""
+        manifest = await self.collection.find_one({"sources": url}, {"_id": 0})
+        if manifest and self._files_exist(manifest):
+            self.reused += 1
+            return manifest
+
+        await self._check_public(url)
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout)) as session:
+            # Redirects are not followed: the target would skip the host check above
+            async with session.get(url, allow_redirects=False) as response:
+                if response.status != 200:
+                    raise RuntimeError(f"HTTP {response.status} for {url}")
+                if response.content_length and response.content_length > self.max_bytes:
+                    raise ValueError(f"Image larger than {self.max_bytes} bytes: {url}")
+                data = await response.content.read(self.max_bytes + 1)
+                if len(data) > self.max_bytes:
+                    raise ValueError(f"Image larger than {self.max_bytes} bytes: {url}")
+        return await self.process(data, source=url)
+
+    async def _check_public(self, url: str) -> None:
+        """Refuse URLs that are not http(s) or resolve to private, loopback or link-local hosts"""
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise ValueError(f"Image URL must be http(s): {url}")
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        infos = await asyncio.get_running_loop().getaddrinfo(parts.hostname, port)
+        for info in infos:
+            address = ipaddress.ip_address(info[4][0].split("%")[0])
+            if not address.is_global or address.is_multicast:
+                raise ValueError(f"Image host {parts.hostname} resolves to non-public address {address}")
+
+    def picture(self, manifest: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """What a page needs for ``<picture>``: typed srcsets plus a fallback ``src``"""
+        if not manifest:
+            return None
+        fallback = manifest["fallback_format"]
+        candidates = [v for v in manifest["variants"] if v["format"] == fallback]
+        src = min(candidates, key=lambda v: (abs(v["width"] - DEFAULT_SRC_WIDTH), v["width"]))
+        return {
+            "hash": manifest["content_hash"],
+            "width": manifest["width"],
+            "height": manifest["height"],
+            "src": src["url"],
+            "srcset": manifest["srcset"][fallback],
+            "sources": [
+                {"type": MIME_TYPES[image_format], "srcset": manifest["srcset"][image_format]}
+                for image_format in FORMAT_PREFERENCE
+                if image_format != fallback and image_format in manifest["srcset"]
+            ],
+        }
+
+    def _srcsets(self, variants: List[Dict[str, Any]]) -> Dict[str, Any]:
+        srcset: Dict[str, List[str]] = {}
+        for variant in sorted(variants, key=lambda v: v["width"]):
+            srcset.setdefault(variant["format"], []).append(f"{variant['url']} {variant['width']}w")
+        fallback = next((f for f in ("jpeg", "png") if f in srcset), next(iter(srcset)))
+        return {"srcset": {f: ", ".join(entries) for f, entries in srcset.items()}, "fallback_format": fallback}
+
+    def _files_exist(self, manifest: Dict[str, Any]) -> bool:
+        return bool(manifest.get("variants")) and all(
+            (self.output_dir / variant["file"]).exists() for variant in manifest["variants"]
+        )
+
+    def _write_variants(self, content_hash: str, variants: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        written = []
+        for variant in variants:
+            extension = "jpg" if variant["format"] == "jpeg" else variant["format"]
+            name = f"{content_hash[:16]}_{variant['width']}.{extension}"
+            path = self.output_dir / name
+            if not path.exists():
+                temp_path = path.with_name(path.name + ".tmp")
+                temp_path.write_bytes(variant["data"])
+                os.replace(temp_path, path)
+            written.append({
+                "format": variant["format"],
+                "type": MIME_TYPES[variant["format"]],
+                "width": variant["width"],
+                "height": variant["height"],
+                "bytes": len(variant["data"]),
+                "file": name,
+                "url": f"{self.url_prefix}/{name}",
+            })
+        return written
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "widths": list(self.widths),
+            "formats": self.formats,
+            "quality": self.quality,
+            "processed": self.processed,
+            "reused": self.reused,
+        }
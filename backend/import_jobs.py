@@ -0,0 +1,448 @@
+"""
+Background spreadsheet imports
+An uploaded CSV or XLSX file is stored in GridFS (``import_uploads``) and
+imported by a background worker, so the request returns at once and a job is
+tracked in ``import_jobs`` with its state, counters and error samples.
+
+Workers claim jobs with a lease, which a heartbeat renews while they run,
+parse, validate and write them chunk by chunk (see csv_import), with the next
+chunk parsed in a worker thread while the current one is written, and
+checkpoint the counters after every chunk. A job
+whose worker went away (pod restart) is claimed again once its lease expires and
+resumes after its last committed chunk; record ids are derived from the job and
+row number, so rows of the interrupted chunk that were already written are not
+written twice.
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import tempfile
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import IO, Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+import gridfs
+import pandas as pd
+from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+from pymongo import ReturnDocument
+
+from csv_import import (
+    CHUNK_ROWS, CsvImporter, ImportOptions, ImportResult, missing_fields, read_chunks, row_errors, spreadsheet_format
+)
+
+logger = logging.getLogger(__name__)
+
+# Error messages kept on the job per list; error_count stays exact
+MAX_ERROR_SAMPLES = int(os.environ.get('IMPORT_MAX_ERROR_SAMPLES', '100'))
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+FINISHED_STATES = ("completed", "failed", "cancelled")
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class LeaseLost(Exception):
+    """Another worker claimed the job after this one missed its lease"""
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class ImportJobs:
+    """Queue, run and checkpoint spreadsheet imports"""
+
+    def __init__(self, db, importer: CsvImporter, concurrency: int = None, lease_seconds: int = None,
+                 poll_seconds: float = None):
+        self.jobs = db.import_jobs
+        self.uploads = AsyncIOMotorGridFSBucket(db, bucket_name="import_uploads")
+        self.importer = importer
+        self.concurrency = concurrency or int(os.environ.get('IMPORT_JOB_CONCURRENCY', '2'))
+        self.lease_seconds = lease_seconds or int(os.environ.get('IMPORT_JOB_LEASE_SECONDS', '120'))
+        self.poll_seconds = poll_seconds or float(os.environ.get('IMPORT_JOB_POLL_SECONDS', '15'))
+        # Stable across a container restart in the same pod, so its jobs are resumed at once
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._task: Optional[asyncio.Task] = None
+        self._running: Dict[str, asyncio.Task] = {}
+        self._wake = asyncio.Event()
+        # Called with the final job document whenever a job completes, fails or is cancelled
+        self.on_finish: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await self.jobs.find_one({"id": job_id}, {"_id": 0})
+
+    async def submit(self, source: IO[bytes], filename: str, file_type: str, options: ImportOptions,
+                     origin: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Store the file and queue its import; ValueError for unusable files or options"""
+        file_format = spreadsheet_format(filename)
+        self.importer.check(file_type, options)
+
+        job_id = str(uuid.uuid4())
+        upload = self.uploads.open_upload_stream_with_id(job_id, filename, metadata={"file_type": file_type})
+        size = 0
+        try:
+            while True:
+                data = await asyncio.to_thread(source.read, UPLOAD_CHUNK_BYTES)
+                if not data:
+                    break
+                size += len(data)
+                await upload.write(data)
+        except Exception:
+            await upload.abort()
+            raise
+        if not size:
+            await upload.abort()
+            raise ValueError("File is empty")
+        await upload.close()
+
+        now = _now().isoformat()
+        job = {
+            "id": job_id,
+            "file_type": file_type,
+            "filename": filename,
+            "format": file_format,
+            "file_size": size,
+            **options.dict(),
+            "chunk_rows": CHUNK_ROWS,
+            "origin": origin or {"type": "upload"},
+            "status": "queued",
+            "cancel_requested": False,
+            "rows_processed": 0,
+            "imported_count": 0,
+            "updated_count": 0,
+            "error_count": 0,
+            "errors": [],
+            "validation_errors": [],
+            "stopped": False,
+            "success": None,
+            "error": None,
+            "attempts": 0,
+            "worker": None,
+            "lease_until": None,
+            "created_at": now,
+            "started_at": None,
+            "updated_at": now,
+            "finished_at": None,
+        }
+        await self.jobs.insert_one(dict(job))
+        self._wake.set()
+        return job
+
+    async def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Cancel a queued job at once, or a running one at its next checkpoint"""
+        now = _now().isoformat()
+        job = await self.jobs.find_one_and_update(
+            {"id": job_id, "status": "queued"},
+            {"$set": {"status": "cancelled", "cancel_requested": True, "finished_at": now, "updated_at": now}},
+            projection={"_id": 0}, return_document=ReturnDocument.AFTER,
+        )
+        if job:
+            await self._discard_upload(job_id)
+            await self._notify(job)
+            return job
+        job = await self.jobs.find_one_and_update(
+            {"id": job_id, "status": "running"},
+            {"$set": {"cancel_requested": True, "updated_at": now}},
+            projection={"_id": 0}, return_document=ReturnDocument.AFTER,
+        )
+        return job or await self.get(job_id)
+
+    async def start(self):
+        """Run queued and interrupted jobs now and whenever new ones are submitted"""
+        if self._task and not self._task.done():
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        tasks = list(self._running.values())
+        if self._task:
+            tasks.append(self._task)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+        # Hand unfinished jobs back at once instead of waiting for their leases to expire
+        await self.jobs.update_many(
+            {"worker": self.worker_id, "status": "running"}, {"$set": {"lease_until": None}}
+        )
+
+    async def _run(self):
+        while True:
+            try:
+                await self._dispatch()
+            except Exception as e:
+                logger.error(f"Import job dispatch failed: {e}")
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def _dispatch(self):
+        while len(self._running) < self.concurrency:
+            job = await self._claim()
+            if job is None:
+                return
+            task = asyncio.create_task(self._execute(job))
+            self._running[job["id"]] = task
+            task.add_done_callback(lambda _, job_id=job["id"]: self._finished(job_id))
+
+    def _finished(self, job_id: str):
+        self._running.pop(job_id, None)
+        self._wake.set()
+
+    async def _claim(self) -> Optional[Dict[str, Any]]:
+        now = _now()
+        return await self.jobs.find_one_and_update(
+            {
+                "status": {"$in": ["queued", "running"]},
+                "id": {"$nin": list(self._running)},
+                "$or": [
+                    {"lease_until": None},
+                    {"lease_until": {"$lt": now.isoformat()}},
+                    {"worker": self.worker_id},
+                ],
+            },
+            {
+                "$set": {
+                    "status": "running",
+                    "worker": self.worker_id,
+                    "lease_until": self._lease(now),
+                    "started_at": now.isoformat(),
+                    "updated_at": now.isoformat(),
+                },
+                "$inc": {"attempts": 1},
+            },
+            projection={"_id": 0}, sort=[("created_at", 1)], return_document=ReturnDocument.AFTER,
+        )
+
+    def _lease(self, now: Optional[datetime] = None) -> str:
+        return ((now or _now()) + timedelta(seconds=self.lease_seconds)).isoformat()
+
+    async def _execute(self, job: Dict[str, Any]):
+        lost = asyncio.Event()
+        heartbeat = asyncio.create_task(self._heartbeat(job["id"], asyncio.current_task(), lost))
+        try:
+            await self._run_job(job)
+        except asyncio.CancelledError:
+            if not lost.is_set():
+                # Shutting down; the job is resumed from its last checkpoint
+                raise
+            logger.warning(f"Import {job['id']} was taken over by another worker")
+        finally:
+            heartbeat.cancel()
+
+    async def _heartbeat(self, job_id: str, task: asyncio.Task, lost: asyncio.Event):
+        """Renew the lease while a job runs, so a slow download or chunk write is not claimed again"""
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                renewed = await self.jobs.update_one(
+                    {"id": job_id, "worker": self.worker_id, "status": "running"},
+                    {"$set": {"lease_until": self._lease()}},
+                )
+                if renewed.matched_count:
+                    continue
+                job = await self.jobs.find_one({"id": job_id}, {"worker": 1, "status": 1})
+            except Exception as e:
+                logger.warning(f"Failed to renew the lease of import {job_id}: {e}")
+                continue
+            if job is None or (job["status"] == "running" and job["worker"] != self.worker_id):
+                # Another worker claimed it after a missed renewal; stop writing at once
+                lost.set()
+                task.cancel()
+            return
+
+    async def _run_job(self, job: Dict[str, Any]):
+        job_id = job["id"]
+        result = ImportResult(
+            success=False,
+            imported_count=job["imported_count"],
+            updated_count=job["updated_count"],
+            error_count=job["error_count"],
+            errors=job["errors"],
+            validation_errors=job["validation_errors"],
+        )
+        rows_processed = job["rows_processed"]
+        if rows_processed:
+            logger.info(f"Resuming import {job_id} after row {rows_processed}")
+        path = None
+        try:
+            if job.get("cancel_requested"):
+                raise JobCancelled()
+            path = await self._download(job)
+            # Picks up a cancellation requested during the download
+            await self._checkpoint(job_id, result, rows_processed)
+            with open(path, "rb") as file:
+                async for rows_processed in self._import(file, job, result):
+                    await self._checkpoint(job_id, result, rows_processed)
+            result.success = result.error_count == 0 and not result.validation_errors
+            await self._finish(job, "completed", result, rows_processed)
+        except JobCancelled:
+            await self._finish(job, "cancelled", result, rows_processed)
+        except LeaseLost:
+            logger.warning(f"Import {job_id} was taken over by another worker")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if not isinstance(e, ValueError):
+                logger.error(f"Import {job_id} of {job['filename']} failed: {e}")
+            await self._finish(job, "failed", result, rows_processed, error=str(e))
+        finally:
+            if path:
+                os.unlink(path)
+
+    async def _download(self, job: Dict[str, Any]) -> str:
+        fd, path = tempfile.mkstemp(suffix=f".{job['format']}")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                await self.uploads.download_to_stream(job["id"], file)
+        except gridfs.errors.NoFile:
+            os.unlink(path)
+            raise ValueError("Uploaded file is no longer available")
+        return path
+
+    async def _import(self, file: IO[bytes], job: Dict[str, Any], result: ImportResult):
+        """Import chunk by chunk after the job's checkpoint, yielding the rows processed after each one"""
+        file_type, file_format = job["file_type"], job["format"]
+        options = ImportOptions(mode=job["mode"], ordered=job["ordered"], batch_size=job["batch_size"])
+        resume_after = job["rows_processed"]
+
+        chunks = await asyncio.to_thread(self._open, file, file_format, job["chunk_rows"])
+        pending = asyncio.ensure_future(asyncio.to_thread(self._parse_next, chunks, file_format, file_type, resume_after))
+        rows_processed = resume_after
+        try:
+            parsed = await pending
+            if parsed is None:
+                if resume_after:
+                    return
+                raise ValueError("File is empty")
+            missing = missing_fields(parsed[0].columns, file_type)
+            if missing:
+                result.validation_errors = missing
+                result.error_count = len(missing)
+                return
+
+            while parsed is not None:
+                chunk, errors = parsed
+                # Rows of the chunk the job was interrupted in may already be written
+                resumed = resume_after > 0 and rows_processed == resume_after
+                rows_processed = int(chunk.index[-1]) + 1
+                # Parse and validate the next chunk while this one is written
+                pending = asyncio.ensure_future(asyncio.to_thread(self._parse_next, chunks, file_format, file_type))
+
+                stopped = False
+                if errors:
+                    positions = sorted({position for position, _ in errors})
+                    if options.ordered:
+                        # Keep the rows before the first invalid one, then stop
+                        errors = [error for error in errors if error[0] == positions[0]]
+                        chunk, positions, stopped = chunk.iloc[:positions[0]], positions[:1], True
+                    else:
+                        chunk = chunk.drop(chunk.index[positions])
+                    result.validation_errors.extend(message for _, message in errors)
+                    result.error_count += len(positions)
+
+                if not await self.importer.import_chunk(chunk, file_type, options, result,
+                                                        id_seed=job["id"], skip_existing=resumed):
+                    stopped = True
+                elif stopped:
+                    result.errors.append("Import stopped at the first invalid row (ordered mode); "
+                                         "later rows were not imported")
+                job["stopped"] = stopped
+                yield rows_processed
+                if stopped:
+                    return
+                parsed = await pending
+        finally:
+            if not pending.done():
+                # A worker thread cannot be interrupted; let it finish before the file is closed
+                await asyncio.gather(pending, return_exceptions=True)
+
+    @staticmethod
+    def _open(file: IO[bytes], file_format: str, chunk_rows: int) -> Iterator[pd.DataFrame]:
+        try:
+            return read_chunks(file, file_format, chunk_rows)
+        except pd.errors.EmptyDataError:
+            raise ValueError("File is empty")
+        except Exception as e:
+            raise ValueError(f"Invalid {file_format.upper()} format: {e}")
+
+    @staticmethod
+    def _parse_next(chunks: Iterator[pd.DataFrame], file_format: str, file_type: str,
+                    skip_rows: int = 0) -> Optional[Tuple[pd.DataFrame, List[Tuple[int, str]]]]:
+        try:
+            chunk = next(chunks, None)
+            # Rows before a checkpoint are parsed again but neither validated nor written
+            while chunk is not None and int(chunk.index[-1]) < skip_rows:
+                chunk = next(chunks, None)
+        except Exception as e:
+            raise ValueError(f"Invalid {file_format.upper()} format: {e}")
+        if chunk is None:
+            return None
+        chunk = chunk[chunk.index >= skip_rows]
+        return chunk, row_errors(chunk, file_type)
+
+    @staticmethod
+    def _counters(result: ImportResult, rows_processed: int) -> Dict[str, Any]:
+        del result.errors[MAX_ERROR_SAMPLES:]
+        del result.validation_errors[MAX_ERROR_SAMPLES:]
+        return {
+            "rows_processed": rows_processed,
+            "imported_count": result.imported_count,
+            "updated_count": result.updated_count,
+            "error_count": result.error_count,
+            "errors": result.errors,
+            "validation_errors": result.validation_errors,
+        }
+
+    async def _checkpoint(self, job_id: str, result: ImportResult, rows_processed: int):
+        """Commit progress and renew the lease; raises if the job was cancelled or taken over"""
+        job = await self.jobs.find_one_and_update(
+            {"id": job_id, "worker": self.worker_id},
+            {"$set": {
+                **self._counters(result, rows_processed),
+                "lease_until": self._lease(),
+                "updated_at": _now().isoformat(),
+            }},
+            projection={"cancel_requested": 1}, return_document=ReturnDocument.AFTER,
+        )
+        if job is None:
+            raise LeaseLost()
+        if job.get("cancel_requested"):
+            raise JobCancelled()
+
+    async def _finish(self, job: Dict[str, Any], status: str, result: ImportResult, rows_processed: int,
+                      error: Optional[str] = None):
+        now = _now().isoformat()
+        finished = await self.jobs.find_one_and_update({"id": job["id"], "worker": self.worker_id}, {"$set": {
+            **self._counters(result, rows_processed),
+            "status": status,
+            "stopped": job.get("stopped", False),
+            "success": result.success if status == "completed" else False,
+            "error": error,
+            "lease_until": None,
+            "finished_at": now,
+            "updated_at": now,
+        }}, projection={"_id": 0}, return_document=ReturnDocument.AFTER)
+        await self._discard_upload(job["id"])
+        if finished:
+            await self._notify(finished)
+
+    async def _notify(self, job: Dict[str, Any]):
+        if self.on_finish is None:
+            return
+        try:
+            await self.on_finish(job)
+        except Exception as e:
+            logger.error(f"Import job {job['id']} finish hook failed: {e}")
+
+    async def _discard_upload(self, job_id: str):
+        try:
+            await self.uploads.delete(job_id)
+        except gridfs.errors.NoFile:
+            pass
@@ -0,0 +1,348 @@
+"""
+Scheduled spreadsheet imports
+Every active schedule in ``import_schedules`` becomes a cron job of an
+APScheduler ``BackgroundScheduler`` whose jobs persist in MongoDB
+(``import_schedule_jobs``), so next run times survive restarts and runs missed
+while no replica was up are detected and coalesced into one (within
+IMPORT_SCHEDULE_MISFIRE_SECONDS). The job store uses blocking PyMongo calls, so
+the scheduler runs on its own thread and hands each run to the event loop.
+
+Only the replica holding the ``scheduler_locks`` lease runs the scheduler; the
+others keep trying to take the lease over. A run still checks the lease and
+claims itself by atomically advancing the schedule's next_run, so a scheduler
+left running on a replica that lost the lease cannot run it a second time.
+A run downloads the schedule's source_url and submits it as an import job (see
+import_jobs), whose workers bound how many imports run at once; the job's
+duration and row counts are written back to the schedule when it finishes.
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import tempfile
+from datetime import datetime, timedelta, timezone
+from typing import IO, Any, Dict, Optional
+from urllib.parse import urlparse
+
+import httpx
+from apscheduler.events import EVENT_JOB_MISSED
+from apscheduler.jobstores.mongodb import MongoDBJobStore
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.triggers.cron import CronTrigger
+from pymongo import MongoClient
+from pymongo.errors import DuplicateKeyError
+
+from csv_import import SPREADSHEET_FORMATS, CsvImporter, ImportOptions
+from import_jobs import FINISHED_STATES, ImportJobs
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_LOCK = "import_scheduler"
+CONTENT_TYPES = {
+    "text/csv": ".csv",
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet": ".xlsx",
+}
+DOWNLOAD_CHUNK_BYTES = 1024 * 1024
+
+# The scheduler that persisted jobs call back into; set while this replica leads
+_leader: Optional["ImportScheduler"] = None
+
+
+def run_schedule(schedule_id: str):
+    """Job function stored by reference in the persistent job store; called on a scheduler thread"""
+    leader = _leader
+    if leader is not None:
+        asyncio.run_coroutine_threadsafe(leader.run(schedule_id), leader.loop)
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class ImportScheduler:
+    """Runs stored import schedules on the replica holding the scheduler lease"""
+
+    def __init__(self, db, jobs: ImportJobs, importer: CsvImporter, mongo_url: str, db_name: str,
+                 concurrency: int = None, misfire_seconds: int = None, lock_seconds: int = None):
+        self.schedules = db.import_schedules
+        self.locks = db.scheduler_locks
+        self.jobs = jobs
+        self.importer = importer
+        self.mongo_url = mongo_url
+        self.db_name = db_name
+        # Schedules downloading their source at the same time; the import job workers bound the imports
+        self.concurrency = concurrency or int(os.environ.get('IMPORT_SCHEDULE_CONCURRENCY', '2'))
+        self.misfire_seconds = misfire_seconds or int(os.environ.get('IMPORT_SCHEDULE_MISFIRE_SECONDS', '3600'))
+        self.lock_seconds = lock_seconds or int(os.environ.get('IMPORT_SCHEDULER_LOCK_SECONDS', '60'))
+        self.max_bytes = int(os.environ.get('IMPORT_SOURCE_MAX_MB', '200')) * 1024 * 1024
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self.scheduler: Optional[BackgroundScheduler] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._client: Optional[MongoClient] = None
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._task: Optional[asyncio.Task] = None
+        self.runs = 0
+        self.scheduled_jobs = 0
+        self.last_error: Optional[str] = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self.scheduler is not None
+
+    async def start(self):
+        """Compete for the scheduler lease now and every third of its duration"""
+        if self._task and not self._task.done():
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.is_leader:
+            await self._step_down()
+            # Let another replica take over without waiting for the lease to expire
+            await self.locks.delete_one({"_id": SCHEDULER_LOCK, "owner": self.owner})
+        if self._client:
+            self._client.close()
+            self._client = None
+
+    async def _run(self):
+        while True:
+            try:
+                if await self._acquire():
+                    if not self.is_leader:
+                        await self._lead()
+                    await self.sync()
+                elif self.is_leader:
+                    logger.warning("Lost the import scheduler lease; stopping the scheduler")
+                    await self._step_down()
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"Import scheduler failed: {e}")
+            await asyncio.sleep(self.lock_seconds / 3)
+
+    async def _acquire(self) -> bool:
+        """Take or renew the lease; False while another replica holds it"""
+        now = _now()
+        try:
+            await self.locks.update_one(
+                {"_id": SCHEDULER_LOCK, "$or": [{"owner": self.owner}, {"expires_at": {"$lt": now}}]},
+                {"$set": {"owner": self.owner, "expires_at": now + timedelta(seconds=self.lock_seconds)}},
+                upsert=True,
+            )
+            return True
+        except DuplicateKeyError:
+            return False
+
+    async def _lead(self):
+        global _leader
+        if self._client is None:
+            self._client = MongoClient(self.mongo_url)
+        scheduler = BackgroundScheduler(
+            jobstores={"default": MongoDBJobStore(
+                database=self.db_name, collection="import_schedule_jobs", client=self._client
+            )},
+            job_defaults={"coalesce": True, "max_instances": 1, "misfire_grace_time": self.misfire_seconds},
+            timezone=timezone.utc,
+        )
+        scheduler.add_listener(self._missed, EVENT_JOB_MISSED)
+        self.loop = asyncio.get_running_loop()
+        # Set first: runs missed while no replica led are fired as soon as the scheduler starts
+        _leader = self
+        try:
+            # Starting the job store creates its index
+            await asyncio.to_thread(scheduler.start)
+        except Exception:
+            _leader = None
+            raise
+        self.scheduler = scheduler
+        logger.info(f"Import scheduler running on {self.owner}")
+
+    async def _step_down(self):
+        global _leader
+        scheduler, self.scheduler = self.scheduler, None
+        if _leader is self:
+            _leader = None
+        # Waits for the scheduler thread to finish what it is processing
+        await asyncio.to_thread(scheduler.shutdown, wait=False)
+
+    async def sync(self):
+        """Make the scheduler's jobs match the active schedules and publish their next runs"""
+        if not self.is_leader:
+            return
+        schedules = {
+            schedule["id"]: schedule
+            async for schedule in self.schedules.find(
+                {"is_active": True}, {"_id": 0, "id": 1, "cron_expression": 1, "next_run": 1}
+            )
+        }
+        scheduler = self.scheduler
+        # Job store calls block on PyMongo, so they run off the event loop
+        for job in await asyncio.to_thread(scheduler.get_jobs):
+            if job.id not in schedules:
+                await asyncio.to_thread(job.remove)
+
+        for schedule_id, schedule in schedules.items():
+            try:
+                trigger = CronTrigger.from_crontab(schedule["cron_expression"], timezone=timezone.utc)
+            except ValueError as e:
+                logger.warning(f"Skipping import schedule {schedule_id}: {e}")
+                continue
+            job = await asyncio.to_thread(scheduler.get_job, schedule_id)
+            # An unchanged job keeps its persisted next run time, so missed runs are still noticed
+            if job is None or str(job.trigger) != str(trigger):
+                job = await asyncio.to_thread(
+                    scheduler.add_job, run_schedule, trigger, args=[schedule_id], id=schedule_id,
+                    replace_existing=True,
+                )
+            next_run = job.next_run_time.isoformat() if job.next_run_time else None
+            if next_run != schedule.get("next_run"):
+                await self.schedules.update_one({"id": schedule_id}, {"$set": {"next_run": next_run}})
+        self.scheduled_jobs = len(schedules)
+
+    def _missed(self, event):
+        """Listener called on the scheduler thread"""
+        logger.warning(f"Import schedule {event.job_id} missed its run at {event.scheduled_run_time}")
+        asyncio.run_coroutine_threadsafe(self._record_missed(event.job_id, event.scheduled_run_time), self.loop)
+
+    async def _record_missed(self, schedule_id: str, scheduled_run_time: datetime):
+        await self.schedules.update_one(
+            {"id": schedule_id},
+            {"$set": {"last_missed_run": scheduled_run_time.isoformat()}, "$inc": {"missed_runs": 1}},
+        )
+
+    async def run(self, schedule_id: str):
+        """Download a schedule's source and queue its import"""
+        async with self._semaphore:
+            # A scheduler thread left over from a lost lease may still fire
+            if not await self._holds_lease():
+                return
+            schedule = await self.schedules.find_one({"id": schedule_id, "is_active": True}, {"_id": 0})
+            if not schedule:
+                return
+            started = _now()
+            if not await self._claim(schedule, started):
+                logger.info(f"Import schedule {schedule_id} was already run for {schedule.get('next_run')}")
+                return
+            # last_run identifies this run; the job's outcome is only recorded against it
+            this_run = {"id": schedule_id, "last_run": started.isoformat()}
+            self.runs += 1
+
+            try:
+                previous = await self.jobs.get(schedule["last_job_id"]) if schedule.get("last_job_id") else None
+                if previous and previous["status"] not in FINISHED_STATES:
+                    await self.schedules.update_one(this_run, {"$set": {
+                        "last_status": "skipped", "last_error": "The previous import is still running",
+                    }})
+                    return
+                import_job = await self._submit(schedule, started)
+                # A small import may already have finished and recorded its outcome
+                await self.schedules.update_one(
+                    {**this_run, "last_status": "running"},
+                    {"$set": {"last_job_id": import_job["id"], "last_status": "queued"}},
+                )
+            except Exception as e:
+                logger.error(f"Import schedule {schedule_id} failed: {e}")
+                await self.schedules.update_one(this_run, {"$set": {
+                    "last_status": "failed",
+                    "last_error": str(e),
+                    "last_duration_seconds": round((_now() - started).total_seconds(), 3),
+                }})
+
+    async def _holds_lease(self) -> bool:
+        return await self.locks.find_one(
+            {"_id": SCHEDULER_LOCK, "owner": self.owner, "expires_at": {"$gt": _now()}}, {"_id": 1}
+        ) is not None
+
+    async def _claim(self, schedule: Dict[str, Any], started: datetime) -> bool:
+        """Atomically take the run due at the schedule's next_run by moving next_run past now
+
+        The update only matches while next_run still holds the value read, so of the
+        replicas firing the same run exactly one claims it; a run whose next_run is
+        already in the future has been claimed before.
+        """
+        due = schedule.get("next_run")
+        if due and datetime.fromisoformat(due) > started:
+            return False
+        try:
+            trigger = CronTrigger.from_crontab(schedule["cron_expression"], timezone=timezone.utc)
+            next_fire = trigger.get_next_fire_time(None, started + timedelta(seconds=1))
+        except (KeyError, ValueError):
+            next_fire = None
+        result = await self.schedules.update_one(
+            {"id": schedule["id"], "is_active": True, "next_run": due},
+            {"$set": {
+                "last_run": started.isoformat(),
+                "last_status": "running",
+                "last_error": None,
+                "next_run": next_fire.isoformat() if next_fire else None,
+            }, "$inc": {"run_count": 1}},
+        )
+        return result.matched_count > 0
+
+    async def _submit(self, schedule: Dict[str, Any], started: datetime) -> Dict[str, Any]:
+        if not schedule.get("source_url"):
+            raise ValueError("Schedule has no source_url")
+        options = ImportOptions(mode=schedule.get("mode") or "insert")
+        origin = {"type": "schedule", "schedule_id": schedule["id"], "started_at": started.isoformat()}
+        with tempfile.TemporaryFile() as file:
+            filename = await self._download(schedule["source_url"], file)
+            if not await self._holds_lease():
+                raise RuntimeError("Lost the import scheduler lease before submitting the import")
+            file.seek(0)
+            return await self.jobs.submit(file, filename, schedule["file_type"], options, origin=origin)
+
+    async def _download(self, url: str, file: IO[bytes]) -> str:
+        """Stream ``url`` into ``file``; returns a filename whose extension names the format"""
+        size = 0
+        async with httpx.AsyncClient(timeout=60.0, follow_redirects=True) as http:
+            async with http.stream("GET", url) as response:
+                response.raise_for_status()
+                async for data in response.aiter_bytes(DOWNLOAD_CHUNK_BYTES):
+                    size += len(data)
+                    if size > self.max_bytes:
+                        raise ValueError(f"Source file is larger than {self.max_bytes // (1024 * 1024)}MB")
+                    file.write(data)
+                content_type = response.headers.get("content-type", "").split(";")[0].strip()
+
+        filename = os.path.basename(urlparse(url).path) or "import"
+        if os.path.splitext(filename)[1].lower() not in SPREADSHEET_FORMATS:
+            filename += CONTENT_TYPES.get(content_type, ".csv")
+        return filename
+
+    async def record_job(self, job: Dict[str, Any]):
+        """Write a finished scheduled import's duration and row counts to its schedule"""
+        origin = job.get("origin") or {}
+        if origin.get("type") != "schedule":
+            return
+        finished = datetime.fromisoformat(job.get("finished_at") or _now().isoformat())
+        duration = (finished - datetime.fromisoformat(origin["started_at"])).total_seconds()
+        # The run that submitted the job, or a later one skipped because the job was still running
+        await self.schedules.update_one({
+            "id": origin["schedule_id"],
+            "$or": [{"last_run": origin["started_at"]}, {"last_job_id": job["id"]}],
+        }, {"$set": {
+            "last_job_id": job["id"],
+            "last_status": job["status"],
+            "last_error": job.get("error"),
+            "last_duration_seconds": round(duration, 3),
+            "last_rows_processed": job.get("rows_processed", 0),
+            "last_imported_count": job.get("imported_count", 0),
+            "last_updated_count": job.get("updated_count", 0),
+            "last_error_count": job.get("error_count", 0),
+        }})
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "leader": self.is_leader,
+            "owner": self.owner,
+            "scheduled_jobs": self.scheduled_jobs if self.scheduler else 0,
+            "runs": self.runs,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,364 @@
+"""
+Declarative MongoDB index registry
+Every index the API relies on is declared here once. At startup the registry
+creates what is missing in the background, and the admin report compares the declared indexes
+with what exists, how often each one is used and how representative queries
+are planned.
+"""
+
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+
+class IndexSpec(BaseModel):
+    collection: str
+    keys: List[Tuple[str, Any]]
+    unique: bool = False
+    sparse: bool = False
+    # Created by another component (e.g. the analytics TTL index); only validated here
+    managed_externally: bool = False
+    purpose: str = ""
+
+    @property
+    def name(self) -> str:
+        """Default MongoDB index name, so existing indexes are recognised"""
+        return "_".join(f"{field}_{direction}" for field, direction in self.keys)
+
+
+class QueryProbe(BaseModel):
+    """A representative API query whose plan is shown in the index report"""
+    name: str
+    collection: str
+    filter: Dict[str, Any] = {}
+    sort: Optional[List[Tuple[str, int]]] = None
+    limit: int = 50
+
+
+TEXT_FIELDS = [("title", "text"), ("description", "text"), ("content", "text"), ("keywords", "text")]
+
+INDEXES: List[IndexSpec] = [
+    # Users
+    IndexSpec(collection="users", keys=[("id", 1)], unique=True, purpose="user lookup by id"),
+    IndexSpec(collection="users", keys=[("username", 1)], unique=True, purpose="login and duplicate check"),
+    IndexSpec(collection="users", keys=[("email", 1)], unique=True, purpose="duplicate email check"),
+    IndexSpec(collection="users", keys=[("created_at", -1)], purpose="user list ordering"),
+
+    # CRM contacts
+    IndexSpec(collection="contacts", keys=[("id", 1)], unique=True, purpose="contact lookup by id"),
+    IndexSpec(collection="contacts", keys=[("email", 1)], purpose="contact lookup and import dedup by email"),
+    IndexSpec(collection="contacts", keys=[("created_at", -1)], purpose="contact list ordering"),
+    IndexSpec(collection="contacts", keys=[("contact_type", 1), ("created_at", -1)], purpose="contact list by type"),
+
+    # CRM visitors
+    IndexSpec(collection="visitors", keys=[("id", 1)], unique=True, purpose="visitor lookup by id"),
+    IndexSpec(collection="visitors", keys=[("date_iso", -1)], purpose="visitor list and date-range exports"),
+    IndexSpec(collection="visitors", keys=[("country", 1), ("date_iso", -1)], purpose="visitor filter by country"),
+    IndexSpec(collection="visitors", keys=[("program", 1), ("date_iso", -1)], purpose="visitor filter by program"),
+    IndexSpec(collection="visitors", keys=[("source", 1), ("date_iso", -1)], purpose="visitor filter by source"),
+    IndexSpec(collection="visitors", keys=[("email", 1), ("date_iso", 1)], purpose="CSV upsert by natural key"),
+
+    # CRM donations
+    IndexSpec(collection="donations", keys=[("id", 1)], unique=True, purpose="donation lookup by id"),
+    IndexSpec(collection="donations", keys=[("date_iso", -1)], purpose="donation list and date-range exports"),
+    IndexSpec(collection="donations", keys=[("created_at", -1)], purpose="monthly donation totals"),
+    IndexSpec(collection="donations", keys=[("project_code", 1), ("date_iso", -1)], purpose="project donations"),
+    IndexSpec(collection="donations", keys=[("receipt_no", 1)], purpose="CSV upsert by natural key"),
+
+    # Other CSV import targets, looked up by natural key in upsert mode (csv_import.NATURAL_KEYS)
+    IndexSpec(collection="finance", keys=[("reference", 1)], purpose="CSV upsert by natural key"),
+    IndexSpec(collection="tasks_reminders", keys=[("agency", 1), ("due_date_iso", 1), ("description_short", 1)],
+              purpose="CSV upsert by natural key"),
+    IndexSpec(collection="users_roles", keys=[("email", 1)], purpose="CSV upsert by natural key"),
+    IndexSpec(collection="invoices", keys=[("receipt_no", 1)], purpose="CSV upsert by natural key"),
+
+    IndexSpec(collection="major_gift_pledges", keys=[("created_at", -1)], purpose="monthly pledge totals"),
+
+    # Projects
+    IndexSpec(collection="projects", keys=[("project_code", 1)], unique=True, purpose="project lookup by code"),
+    IndexSpec(collection="projects", keys=[("created_at", -1)], purpose="project list ordering"),
+    IndexSpec(collection="projects", keys=[("status", 1), ("created_at", -1)], purpose="project filter by status"),
+
+    # Podcasts
+    IndexSpec(collection="podcast_series", keys=[("id", 1)], unique=True, purpose="series lookup by id"),
+    IndexSpec(collection="podcast_series", keys=[("slug", 1)], unique=True, purpose="series lookup by slug"),
+    IndexSpec(collection="podcast_episodes", keys=[("id", 1)], unique=True, purpose="episode lookup by id"),
+    IndexSpec(collection="podcast_episodes", keys=[("slug", 1)], unique=True, purpose="episode lookup by slug"),
+    IndexSpec(collection="podcast_episodes", keys=[("date_gmt_iso", -1)], purpose="episode list and RSS feed"),
+    IndexSpec(collection="podcast_episodes", keys=[("seriesId", 1), ("date_gmt_iso", -1)], purpose="episodes by series"),
+
+    # Church partners
+    IndexSpec(collection="church_partners", keys=[("id", 1)], unique=True, purpose="partner lookup by id"),
+    IndexSpec(collection="church_partners", keys=[("isPublished", 1), ("country", 1), ("city", 1)],
+              purpose="published partner filter by country/city"),
+
+    # Programs
+    IndexSpec(collection="programs", keys=TEXT_FIELDS, purpose="program text search"),
+    IndexSpec(collection="programs", keys=[("day_of_week", 1), ("start_time", 1)], purpose="weekly schedule"),
+    IndexSpec(collection="ai_programs", keys=TEXT_FIELDS, purpose="AI program text search"),
+    IndexSpec(collection="ai_programs", keys=[("id", 1)], unique=True, purpose="AI program lookup by id"),
+    IndexSpec(collection="ai_programs", keys=[("date_aired", -1)], purpose="AI program list ordering"),
+
+    # Content and scheduling
+    IndexSpec(collection="impact_stories", keys=[("created_at", -1)], purpose="impact story list ordering"),
+    IndexSpec(collection="news_updates", keys=[("is_published", 1), ("created_at", -1)], purpose="published news"),
+    IndexSpec(collection="import_schedules", keys=[("id", 1)], unique=True, purpose="schedule lookup by id"),
+    IndexSpec(collection="import_jobs", keys=[("id", 1)], unique=True, purpose="import progress lookup by id"),
+    IndexSpec(collection="import_jobs", keys=[("status", 1), ("created_at", 1)], purpose="import job claim queue"),
+
+    # Website analytics
+    IndexSpec(collection="visitor_analytics", keys=[("timestamp", 1)], managed_externally=True,
+              purpose="retention TTL and recent visitors (analytics_retention)"),
+    IndexSpec(collection="visitor_analytics", keys=[("timestamp", 1), ("ip_address", 1)],
+              purpose="rollup backfill"),
+    IndexSpec(collection="click_analytics", keys=[("timestamp", 1)], managed_externally=True,
+              purpose="retention TTL and recent clicks (analytics_retention)"),
+
+    # Project file index (project_files)
+    IndexSpec(collection="project_files", keys=[("file_id", 1)], unique=True, purpose="file lookup and sync upserts"),
+    IndexSpec(collection="project_files", keys=[("project_code", 1), ("uploaded_at", -1), ("file_id", -1)],
+              purpose="paginated file list per project"),
+    IndexSpec(collection="project_files", keys=[("project_code", 1), ("category", 1), ("uploaded_at", -1), ("file_id", -1)],
+              purpose="paginated file list filtered by category"),
+    IndexSpec(collection="project_files", keys=[("project_code", 1), ("path_lower", 1)],
+              purpose="apply storage deletions by path"),
+
+    # Receipts and reports per project
+    IndexSpec(collection="project_receipts", keys=[("receipt_id", 1)], unique=True, purpose="receipt lookup by id"),
+    IndexSpec(collection="project_receipts", keys=[("project_code", 1), ("date", -1)],
+              purpose="receipts per project by date"),
+    IndexSpec(collection="project_receipts", keys=[("project_code", 1), ("category", 1)],
+              purpose="expense totals per category"),
+    IndexSpec(collection="project_reports", keys=[("report_id", 1)], unique=True, purpose="report lookup by id"),
+    IndexSpec(collection="project_reports", keys=[("project_code", 1), ("generated_at", -1)],
+              purpose="reports per project, newest first"),
+    IndexSpec(collection="project_file_cursors", keys=[("project_code", 1)], unique=True,
+              purpose="storage change cursor per project"),
+
+    # Weather coverage locations and snapshots
+    IndexSpec(collection="weather_locations", keys=[("id", 1)], unique=True, purpose="location lookup by id"),
+    IndexSpec(collection="weather_locations", keys=[("name", 1)], unique=True, purpose="one location per name"),
+    IndexSpec(collection="weather_snapshots", keys=[("location", 1), ("fetched_at", -1)], managed_externally=True,
+              purpose="latest snapshot per location (weather_service)"),
+    IndexSpec(collection="weather_snapshots", keys=[("fetched_at", 1)], managed_externally=True,
+              purpose="snapshot retention TTL (weather_service)"),
+
+    # Responsive image manifests (image_pipeline)
+    IndexSpec(collection="image_manifests", keys=[("content_hash", 1)], unique=True,
+              purpose="one manifest per image content"),
+    IndexSpec(collection="image_manifests", keys=[("sources", 1)], purpose="manifest lookup by source URL"),
+]
+
+QUERY_PROBES: List[QueryProbe] = [
+    QueryProbe(name="user_by_username", collection="users", filter={"username": "admin"}),
+    QueryProbe(name="contact_by_email", collection="contacts", filter={"email": "someone@example.org"}),
+    QueryProbe(name="contacts_by_type", collection="contacts", filter={"contact_type": "donor"},
+               sort=[("created_at", -1)]),
+    QueryProbe(name="visitors_by_month", collection="visitors",
+               filter={"date_iso": {"$gte": "2025-01-01", "$lt": "2025-02-01"}}, sort=[("date_iso", -1)]),
+    QueryProbe(name="visitors_by_country", collection="visitors", filter={"country": "Liberia"},
+               sort=[("date_iso", -1)]),
+    QueryProbe(name="donations_by_project", collection="donations", filter={"project_code": "KIOO-001"},
+               sort=[("date_iso", -1)]),
+    QueryProbe(name="donations_by_month", collection="donations",
+               filter={"date_iso": {"$gte": "2025-01-01", "$lt": "2025-02-01"}}, sort=[("date_iso", -1)]),
+    QueryProbe(name="project_by_code", collection="projects", filter={"project_code": "KIOO-001"}),
+    QueryProbe(name="projects_by_status", collection="projects", filter={"status": "active"},
+               sort=[("created_at", -1)]),
+    QueryProbe(name="episode_by_slug", collection="podcast_episodes", filter={"slug": "episode"}),
+    QueryProbe(name="episodes_by_series", collection="podcast_episodes", filter={"seriesId": "series"},
+               sort=[("date_gmt_iso", -1)]),
+    QueryProbe(name="published_partners", collection="church_partners",
+               filter={"isPublished": True, "country": "Liberia"}),
+    QueryProbe(name="weekly_schedule", collection="programs", sort=[("day_of_week", 1), ("start_time", 1)]),
+    QueryProbe(name="ai_programs_recent", collection="ai_programs", sort=[("date_aired", -1)]),
+    QueryProbe(name="recent_page_visits", collection="visitor_analytics", sort=[("timestamp", -1)]),
+    QueryProbe(name="latest_weather_snapshot", collection="weather_snapshots",
+               filter={"location": "Foya, Liberia"}, sort=[("fetched_at", -1)], limit=1),
+    QueryProbe(name="project_files_page", collection="project_files",
+               filter={"project_code": "KIOO-001", "category": "receipt"},
+               sort=[("uploaded_at", -1), ("file_id", -1)]),
+    QueryProbe(name="project_receipts_by_date", collection="project_receipts",
+               filter={"project_code": "KIOO-001"}, sort=[("date", -1)]),
+    QueryProbe(name="image_manifest_by_source", collection="image_manifests",
+               filter={"sources": "https://example.org/photo.jpg"}, limit=1),
+]
+
+
+def _plan_summary(plan: Dict[str, Any]) -> Tuple[List[str], List[str]]:
+    """Stages and index names of a winning plan, outermost stage first"""
+    stages, indexes = [], []
+    pending = [plan]
+    while pending:
+        node = pending.pop(0)
+        stages.append(node.get("stage", "?"))
+        if node.get("indexName"):
+            indexes.append(node["indexName"])
+        if "inputStage" in node:
+            pending.append(node["inputStage"])
+        pending.extend(node.get("inputStages", []))
+    return stages, indexes
+
+
+class IndexRegistry:
+    """Create, validate and report on the declared indexes"""
+
+    def __init__(self, db, indexes: List[IndexSpec] = None, probes: List[QueryProbe] = None):
+        self.db = db
+        self.indexes = indexes if indexes is not None else INDEXES
+        self.probes = probes if probes is not None else QUERY_PROBES
+        self.last_ensure: Dict[str, Any] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def collections(self) -> List[str]:
+        return sorted({spec.collection for spec in self.indexes})
+
+    async def ensure_all(self, timeout_per_index: float = 10.0) -> Dict[str, Any]:
+        """Create every declared index; failures are collected instead of raised"""
+        created, failed = [], {}
+        for spec in self.indexes:
+            if spec.managed_externally:
+                continue
+            options = {"name": spec.name}
+            if spec.unique:
+                options["unique"] = True
+            if spec.sparse:
+                options["sparse"] = True
+            try:
+                await asyncio.wait_for(
+                    self.db[spec.collection].create_index(spec.keys, **options),
+                    timeout=timeout_per_index,
+                )
+                created.append(f"{spec.collection}.{spec.name}")
+            except Exception as e:
+                # e.g. duplicate values blocking a unique index
+                failed[f"{spec.collection}.{spec.name}"] = str(e)
+                logger.warning(f"Failed to create index {spec.collection}.{spec.name}: {e}")
+        self.last_ensure = {"ensured": len(created), "failed": failed}
+        return self.last_ensure
+
+    async def start(self):
+        """Create the declared indexes in the background so startup does not wait on slow builds"""
+        if self._task and not self._task.done():
+            return
+        self._task = asyncio.create_task(self._ensure_in_background())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _ensure_in_background(self):
+        self.last_ensure = {"running": True}
+        try:
+            result = await self.ensure_all()
+        except Exception as e:
+            self.last_ensure = {"error": str(e)}
+            logger.error(f"Creating declared indexes failed: {e}")
+            return
+        if result["failed"]:
+            logger.warning(f"Failed to create {len(result['failed'])} declared indexes")
+        logger.info(f"Ensured {result['ensured']} declared indexes")
+
+    async def validate(self) -> Dict[str, Dict[str, List[str]]]:
+        """Per collection: declared indexes that are missing or differ, and undeclared extras"""
+        result = {}
+        for collection in self.collections:
+            existing = await self.db[collection].index_information()
+            declared = {spec.name: spec for spec in self.indexes if spec.collection == collection}
+            missing, mismatched = [], []
+            for name, spec in declared.items():
+                info = existing.get(name)
+                if info is None:
+                    missing.append(name)
+                elif bool(info.get("unique")) != spec.unique:
+                    mismatched.append(name)
+            undeclared = [name for name in existing if name != "_id_" and name not in declared]
+            result[collection] = {"missing": missing, "mismatched": mismatched, "undeclared": undeclared}
+        return result
+
+    async def usage(self, collection: str) -> Dict[str, int]:
+        """Index access counts since the server last restarted ($indexStats)"""
+        stats = await self.db[collection].aggregate([{"$indexStats": {}}]).to_list(None)
+        return {entry["name"]: int(entry.get("accesses", {}).get("ops", 0)) for entry in stats}
+
+    async def sizes(self, collection: str) -> Dict[str, Any]:
+        stats = await self.db.command("collStats", collection)
+        return {
+            "documents": stats.get("count", 0),
+            "data_size_bytes": stats.get("size", 0),
+            "total_index_size_bytes": stats.get("totalIndexSize", 0),
+            "index_sizes_bytes": stats.get("indexSizes", {}),
+        }
+
+    async def explain(self, probe: QueryProbe, verbosity: str = "queryPlanner") -> Dict[str, Any]:
+        command: Dict[str, Any] = {"find": probe.collection, "filter": probe.filter, "limit": probe.limit}
+        if probe.sort:
+            command["sort"] = dict(probe.sort)
+        explained = await self.db.command("explain", command, verbosity=verbosity)
+        winning = explained.get("queryPlanner", {}).get("winningPlan", {})
+        # Slot-based engine plans nest the classic plan under queryPlan
+        stages, indexes = _plan_summary(winning.get("queryPlan", winning))
+        summary = {
+            "query": probe.name,
+            "collection": probe.collection,
+            "stages": stages,
+            "indexes": indexes,
+            "collection_scan": "COLLSCAN" in stages,
+            "in_memory_sort": "SORT" in stages,
+        }
+        execution = explained.get("executionStats")
+        if execution:
+            summary.update({
+                "returned": execution.get("nReturned"),
+                "keys_examined": execution.get("totalKeysExamined"),
+                "docs_examined": execution.get("totalDocsExamined"),
+                "execution_ms": execution.get("executionTimeMillis"),
+            })
+        return summary
+
+    async def report(self, execution_stats: bool = False) -> Dict[str, Any]:
+        """Index sizes, usage, validation problems and query plans for the admin endpoint"""
+        validation = await self.validate()
+        collections = {}
+        unused = []
+        for collection in self.collections:
+            entry: Dict[str, Any] = dict(validation[collection])
+            try:
+                entry.update(await self.sizes(collection))
+            except Exception as e:
+                entry["size_error"] = str(e)
+            try:
+                entry["usage"] = await self.usage(collection)
+                unused.extend(
+                    f"{collection}.{name}" for name, ops in entry["usage"].items() if ops == 0 and name != "_id_"
+                )
+            except Exception as e:
+                entry["usage_error"] = str(e)
+            collections[collection] = entry
+
+        verbosity = "executionStats" if execution_stats else "queryPlanner"
+        plans = []
+        for probe in self.probes:
+            try:
+                plans.append(await self.explain(probe, verbosity))
+            except Exception as e:
+                plans.append({"query": probe.name, "collection": probe.collection, "error": str(e)})
+
+        return {
+            "missing": [f"{c}.{n}" for c, v in validation.items() for n in v["missing"]],
+            "unused_since_restart": unused,
+            "last_ensure": self.last_ensure,
+            "collections": collections,
+            "query_plans": plans,
+        }
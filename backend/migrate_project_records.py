@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Move the embedded ``files``, ``receipts`` and ``reports`` arrays out of project
+documents into the ``project_files``, ``project_receipts`` and ``project_reports``
+collections, keyed by project_code.
+
+Safe to run more than once: records are upserted by their ids without
+overwriting existing ones, and a project's arrays are only removed after all of
+its records were written. Records without an id get a deterministic one. The
+API also migrates a project on its first read (``migrate_project``), so its
+records are served before this has been run.
+
+    python migrate_project_records.py [--dry-run]
+"""
+
+import argparse
+import asyncio
+import os
+import uuid
+from pathlib import Path
+from typing import Any, Dict
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from project_files import iso_utc
+
+# Embedded array -> (collection, id field)
+EMBEDDED_RECORDS = {
+    "files": ("project_files", "file_id"),
+    "receipts": ("project_receipts", "receipt_id"),
+    "reports": ("project_reports", "report_id"),
+}
+# Projects that still have any embedded array, and the fields needed to move them
+EMBEDDED_QUERY = {"$or": [{field: {"$exists": True}} for field in EMBEDDED_RECORDS]}
+EMBEDDED_PROJECTION = {"project_code": 1, **{field: 1 for field in EMBEDDED_RECORDS}}
+
+
+def _child_document(field: str, project_code: str, record: Dict[str, Any]) -> Dict[str, Any]:
+    document = {**record, "project_code": project_code}
+    if field == "files":
+        document["path_lower"] = record.get("file_path", "").lower()
+        document["uploaded_at"] = iso_utc(record.get("uploaded_at"))
+    return document
+
+
+async def migrate_project(db, project: Dict[str, Any], dry_run: bool = False) -> Dict[str, int]:
+    """Copy one project's embedded records into their collections and drop its arrays"""
+    project_code = project["project_code"]
+    counts = {}
+    for field, (collection, id_field) in EMBEDDED_RECORDS.items():
+        records = []
+        for index, record in enumerate(project.get(field) or []):
+            if not record.get(id_field):
+                # Stable across re-runs, so an interrupted migration does not duplicate it
+                record = {**record, id_field: str(uuid.uuid5(uuid.NAMESPACE_URL, f"{project_code}/{field}/{index}"))}
+            records.append(record)
+        counts[field] = len(records)
+        if records and not dry_run:
+            try:
+                await db[collection].bulk_write([
+                    UpdateOne(
+                        {id_field: record[id_field]},
+                        {"$setOnInsert": _child_document(field, project_code, record)},
+                        upsert=True,
+                    )
+                    for record in records
+                ], ordered=False)
+            except BulkWriteError as e:
+                # Another migration of the same project inserted these records first
+                if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                    raise
+    if not dry_run:
+        await db.projects.update_one(
+            {"_id": project["_id"]}, {"$unset": {field: "" for field in EMBEDDED_RECORDS}}
+        )
+    return counts
+
+
+async def migrate_project_records(db, dry_run: bool = False) -> Dict[str, int]:
+    """Copy embedded records into their collections and drop the arrays; returns counts"""
+    counts = {"projects": 0, **{field: 0 for field in EMBEDDED_RECORDS}, "skipped_projects": 0}
+    async for project in db.projects.find(EMBEDDED_QUERY, EMBEDDED_PROJECTION):
+        if not project.get("project_code"):
+            counts["skipped_projects"] += 1
+            continue
+        for field, count in (await migrate_project(db, project, dry_run=dry_run)).items():
+            counts[field] += count
+        counts["projects"] += 1
+    return counts
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--dry-run", action="store_true", help="count records without writing anything")
+    args = parser.parse_args()
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    try:
+        counts = await migrate_project_records(client[os.environ['DB_NAME']], dry_run=args.dry_run)
+        prefix = "Would migrate" if args.dry_run else "Migrated"
+        print(f"{prefix} {counts['projects']} projects: {counts['files']} files, "
+              f"{counts['receipts']} receipts, {counts['reports']} reports "
+              f"({counts['skipped_projects']} projects without a project_code left as they are)")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
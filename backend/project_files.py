@@ -0,0 +1,220 @@
+"""
+Project file metadata index
+One document per stored file in ``project_files``, kept in sync with the file
+storage through change cursors (Dropbox ``list_folder/continue``) saved per project
+in ``project_file_cursors``. Listing is a paginated, filtered database query, so
+browsing a project with thousands of files never touches the storage API or loads
+more than one page.
+"""
+
+import asyncio
+import base64
+import json
+import logging
+import mimetypes
+import os
+import re
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Tuple
+
+from pymongo import DeleteMany, UpdateOne
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CATEGORY = "documents"
+
+# Fields that describe the stored object and are refreshed on every sync
+STORAGE_FIELDS = ("filename", "file_path", "file_size", "content_hash", "server_modified")
+
+
+class InvalidCursor(ValueError):
+    """A pagination cursor that was not produced by ``ProjectFileIndex.list``"""
+
+
+def iso_utc(value: Optional[str]) -> Optional[str]:
+    """ISO timestamp in UTC with an explicit offset, so strings sort chronologically"""
+    if not value:
+        return value
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc).isoformat()
+
+
+def encode_cursor(uploaded_at: str, file_id: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([uploaded_at, file_id]).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        uploaded_at, file_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return str(uploaded_at), str(file_id)
+    except Exception:
+        raise InvalidCursor("Invalid pagination cursor")
+
+
+class ProjectFileIndex:
+    """File metadata per project, synced from storage and queried page by page"""
+
+    def __init__(self, db, storage=None, sync_minutes: float = None):
+        self.db = db
+        self.files = db.project_files
+        self.cursors = db.project_file_cursors
+        # Set once the storage is configured; without it the index only holds uploads
+        self.storage = storage
+        self.sync_minutes = sync_minutes or float(os.environ.get('PROJECT_FILE_SYNC_MINUTES', '15'))
+        self._task: Optional[asyncio.Task] = None
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self.syncs = 0
+        self.last_error: Optional[str] = None
+
+    @staticmethod
+    def folder(project_code: str) -> str:
+        return f"/projects/{project_code}"
+
+    def _category(self, project_code: str, file_path: str) -> str:
+        # /projects/<code>/<category>/<filename>; files directly in the project folder have none
+        relative = file_path[len(self.folder(project_code)) + 1:]
+        return relative.split("/", 1)[0] if "/" in relative else DEFAULT_CATEGORY
+
+    async def record_upload(self, project_code: str, file_record: Dict[str, Any]):
+        """Add a file uploaded through the API, with its description and content type"""
+        document = {
+            **file_record,
+            "project_code": project_code,
+            "path_lower": file_record["file_path"].lower(),
+            "uploaded_at": iso_utc(file_record.get("uploaded_at")),
+        }
+        await self.files.update_one({"file_id": file_record["file_id"]}, {"$set": document}, upsert=True)
+
+    async def get(self, project_code: str, file_id: str) -> Optional[Dict[str, Any]]:
+        return await self.files.find_one({"project_code": project_code, "file_id": file_id}, {"_id": 0})
+
+    async def list(self, project_code: str, category: Optional[str] = None, limit: int = 50,
+                   cursor: Optional[str] = None) -> Dict[str, Any]:
+        """Newest first; ``next_cursor`` continues after the last file of this page"""
+        query: Dict[str, Any] = {"project_code": project_code}
+        if category:
+            query["category"] = category
+        total = await self.files.count_documents(query)
+
+        if cursor:
+            uploaded_at, file_id = decode_cursor(cursor)
+            query["$or"] = [
+                {"uploaded_at": {"$lt": uploaded_at}},
+                {"uploaded_at": uploaded_at, "file_id": {"$lt": file_id}},
+            ]
+        files = await self.files.find(query, {"_id": 0, "path_lower": 0}).sort(
+            [("uploaded_at", -1), ("file_id", -1)]
+        ).limit(limit + 1).to_list(limit + 1)
+
+        next_cursor = None
+        if len(files) > limit:
+            files = files[:limit]
+            next_cursor = encode_cursor(files[-1]["uploaded_at"], files[-1]["file_id"])
+        return {"files": files, "total_files": total, "next_cursor": next_cursor}
+
+    async def categories(self, project_code: str) -> Dict[str, int]:
+        pipeline = [
+            {"$match": {"project_code": project_code}},
+            {"$group": {"_id": "$category", "count": {"$sum": 1}}},
+        ]
+        return {row["_id"]: row["count"] async for row in self.files.aggregate(pipeline)}
+
+    async def sync(self, project_code: str) -> Dict[str, Any]:
+        """Apply storage changes since the project's saved cursor"""
+        if self.storage is None:
+            raise RuntimeError("No file storage configured")
+        lock = self._locks.setdefault(project_code, asyncio.Lock())
+        async with lock:
+            state = await self.cursors.find_one({"project_code": project_code}) or {}
+            changes = await self.storage.list_changes(self.folder(project_code), state.get("cursor"))
+
+            now = datetime.now(timezone.utc).isoformat()
+            operations = []
+            for entry in changes["entries"]:
+                info = {field: entry.get(field) for field in STORAGE_FIELDS}
+                info["server_modified"] = iso_utc(info["server_modified"])
+                operations.append(UpdateOne(
+                    {"file_id": entry["file_id"]},
+                    {
+                        "$set": {**info, "project_code": project_code, "path_lower": entry["file_path"].lower(),
+                                 "synced_at": now},
+                        # Uploads through the API already carry these; files added in storage directly do not
+                        "$setOnInsert": {
+                            "category": self._category(project_code, entry["file_path"]),
+                            "content_type": mimetypes.guess_type(entry["filename"])[0] or "application/octet-stream",
+                            "uploaded_at": info["server_modified"] or now,
+                            "description": None,
+                        },
+                    },
+                    upsert=True,
+                ))
+            for path in changes["deleted"]:
+                # A deleted folder removes everything below it
+                operations.append(DeleteMany({"project_code": project_code, "$or": [
+                    {"path_lower": path}, {"path_lower": {"$regex": f"^{re.escape(path)}/"}},
+                ]}))
+            if changes["reset"]:
+                seen = [entry["file_id"] for entry in changes["entries"]]
+                operations.append(DeleteMany({"project_code": project_code, "file_id": {"$nin": seen}}))
+            if operations:
+                await self.files.bulk_write(operations, ordered=True)
+
+            await self.cursors.update_one(
+                {"project_code": project_code},
+                {"$set": {"cursor": changes["cursor"], "synced_at": now}},
+                upsert=True,
+            )
+            self.syncs += 1
+            return {
+                "project_id": project_code,
+                "updated": len(changes["entries"]),
+                "deleted": len(changes["deleted"]),
+                "full_listing": changes["reset"],
+            }
+
+    async def sync_all(self) -> Dict[str, Any]:
+        results = {}
+        async for project in self.db.projects.find({}, {"project_code": 1}):
+            project_code = project.get("project_code")
+            if not project_code:
+                continue
+            try:
+                results[project_code] = await self.sync(project_code)
+            except Exception as e:
+                self.last_error = f"{project_code}: {e}"
+                logger.warning(f"Project file sync failed for {project_code}: {e}")
+        return results
+
+    async def start(self):
+        """Sync every project now and then every ``sync_minutes``"""
+        if self.storage is None or (self._task and not self._task.done()):
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.sync_all()
+            except Exception as e:
+                logger.error(f"Project file sync failed: {e}")
+            await asyncio.sleep(self.sync_minutes * 60)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": bool(self._task and not self._task.done()),
+            "sync_minutes": self.sync_minutes,
+            "syncs": self.syncs,
+            "last_error": self.last_error,
+        }
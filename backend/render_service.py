@@ -0,0 +1,198 @@
+"""
+Process-pool render service
+CPU-bound work (PDF rasterization, ReportLab/DOCX/HTML reports, XLSX exports)
+runs in a bounded pool of worker processes so it never blocks the event loop.
+Jobs wait for a free worker in priority order, the number of waiting jobs is
+capped, and a job that overruns its timeout fails on its own: its pool takes
+no new jobs and its workers are killed once the pool's other jobs have finished.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Lower values run first
+PRIORITY_INTERACTIVE = 0  # a user is waiting on the page, e.g. previews
+PRIORITY_EXPORT = 1       # downloads and reports requested by admins
+PRIORITY_BACKGROUND = 2   # scheduled or pre-rendering work
+
+
+class RenderQueueFull(Exception):
+    """More jobs are waiting than ``max_pending`` allows"""
+
+
+class RenderTimeout(Exception):
+    """A job did not finish within its timeout"""
+
+
+class RenderService:
+    """Run picklable top-level functions in worker processes with priorities and limits"""
+
+    def __init__(self, max_workers: int = None, max_pending: int = None, default_timeout: float = None):
+        self.max_workers = max_workers if max_workers is not None else int(
+            os.environ.get('RENDER_WORKERS', str(min(4, os.cpu_count() or 1)))
+        )
+        self.max_pending = max_pending or int(os.environ.get('RENDER_MAX_PENDING', '32'))
+        self.default_timeout = default_timeout or float(os.environ.get('RENDER_TIMEOUT_SECONDS', '120'))
+        # Forking the multi-threaded server could copy a lock held by another thread into the worker
+        default_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        self.start_method = os.environ.get('RENDER_START_METHOD', default_method)
+
+        self._pool: Optional[ProcessPoolExecutor] = None
+        # Jobs still awaited per pool, and pools that take no new jobs because one overran
+        self._jobs: Dict[ProcessPoolExecutor, int] = {}
+        self._retiring: List[ProcessPoolExecutor] = []
+        self._running = 0
+        self._waiting: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+
+        self.completed = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.rejected = 0
+        self.pool_restarts = 0
+        self.busy_seconds = 0.0
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # Workers are started once and reused; the server module is guarded by ``__main__``
+            # so a worker importing it does not start another server
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers, mp_context=multiprocessing.get_context(self.start_method)
+            )
+            self._jobs[self._pool] = 0
+        return self._pool
+
+    def _retire_pool(self, pool: ProcessPoolExecutor):
+        """Send new jobs to a fresh pool; the old one's workers are killed once its other jobs finish"""
+        if pool is None or pool in self._retiring:
+            return
+        if self._pool is pool:
+            self._pool = None
+            self.pool_restarts += 1
+        self._retiring.append(pool)
+
+    def _reap(self, pool: ProcessPoolExecutor):
+        """Kill a retired pool's workers, the only way to stop a runaway job, when nothing awaits it"""
+        if pool not in self._retiring or self._jobs.get(pool):
+            return
+        self._retiring.remove(pool)
+        self._jobs.pop(pool, None)
+        _terminate(pool)
+
+    async def _acquire(self, priority: int):
+        if self._running < max(self.max_workers, 1) and not self._waiting:
+            self._running += 1
+            return
+        if len(self._waiting) >= self.max_pending:
+            self.rejected += 1
+            raise RenderQueueFull(f"{len(self._waiting)} render jobs already waiting")
+        slot = asyncio.get_running_loop().create_future()
+        entry = (priority, next(self._sequence), slot)
+        heapq.heappush(self._waiting, entry)
+        try:
+            await slot
+        except asyncio.CancelledError:
+            if slot.done() and not slot.cancelled():
+                # The slot was handed over just as we were cancelled; pass it on
+                self._release()
+            else:
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+            raise
+
+    def _release(self):
+        while self._waiting:
+            _, _, slot = heapq.heappop(self._waiting)
+            if not slot.done():
+                # The slot moves straight to the next job, so _running is unchanged
+                slot.set_result(None)
+                return
+        self._running -= 1
+
+    async def run(self, func: Callable, *args, priority: int = PRIORITY_EXPORT,
+                  timeout: Optional[float] = None, **kwargs) -> Any:
+        """Run ``func(*args, **kwargs)`` in a worker process and return its result"""
+        await self._acquire(priority)
+        started = time.perf_counter()
+        pool = None
+        try:
+            if self.max_workers == 0:
+                # Pool disabled (e.g. single-core hosts): still keep the work off the event loop
+                future = asyncio.ensure_future(asyncio.to_thread(func, *args, **kwargs))
+            else:
+                pool = self._executor()
+                self._jobs[pool] += 1
+                future = asyncio.get_running_loop().run_in_executor(pool, _call, func, args, kwargs)
+            try:
+                result = await asyncio.wait_for(future, timeout or self.default_timeout)
+            except asyncio.TimeoutError:
+                self.timed_out += 1
+                # Only this job fails; the pool's other jobs run to completion first
+                self._retire_pool(pool)
+                raise RenderTimeout(f"{getattr(func, '__name__', func)} exceeded {timeout or self.default_timeout}s")
+            except BrokenProcessPool:
+                # A worker died (e.g. out of memory); start a fresh pool for the next job
+                self._retire_pool(pool)
+                raise
+            finally:
+                if pool is not None:
+                    self._jobs[pool] -= 1
+                    self._reap(pool)
+            self.completed += 1
+            return result
+        except (RenderTimeout, asyncio.CancelledError):
+            raise
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.busy_seconds += time.perf_counter() - started
+            self._release()
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+        for pool in self._retiring:
+            _terminate(pool)
+        self._retiring.clear()
+        self._jobs.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_workers": self.max_workers,
+            "max_pending": self.max_pending,
+            "start_method": self.start_method,
+            "default_timeout": self.default_timeout,
+            "running": self._running,
+            "waiting": len(self._waiting),
+            "completed": self.completed,
+            "failed": self.failed,
+            "timed_out": self.timed_out,
+            "rejected": self.rejected,
+            "pool_restarts": self.pool_restarts,
+            "retiring_pools": len(self._retiring),
+            "busy_seconds": round(self.busy_seconds, 2),
+        }
+
+
+def _call(func: Callable, args: tuple, kwargs: dict) -> Any:
+    return func(*args, **kwargs)
+
+
+def _terminate(pool: ProcessPoolExecutor):
+    processes = list((getattr(pool, "_processes", None) or {}).values())
+    pool.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
@@ -0,0 +1,387 @@
+"""
+CPU-bound render functions
+PDF rasterization, image resizing, ReportLab/python-docx/Jinja2 reports and
+openpyxl workbooks. Everything here is a plain top-level function taking and
+returning picklable values, so the render service can run it in a worker
+process. This module must not import server.py.
+"""
+
+import io
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence
+
+import fitz  # PyMuPDF
+import openpyxl
+from docx import Document
+from jinja2 import Template
+from openpyxl.styles import Alignment, Font, PatternFill
+from PIL import Image, ImageOps
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.units import inch
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+
+def pdf_thumbnails(pdf_bytes: bytes, max_pages: int = 3, size: Sequence[int] = (400, 300)) -> List[bytes]:
+    """Generate thumbnail images from PDF pages."""
+    thumbnails = []
+
+    # Open PDF from bytes
+    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+    try:
+        # Set matrix for high quality output (300 DPI)
+        mat = fitz.Matrix(2.0, 2.0)  # 2x scale for better quality
+
+        for page_num in range(min(len(doc), max_pages)):
+            # Create pixmap with high quality
+            pix = doc[page_num].get_pixmap(matrix=mat, alpha=False)
+
+            # Convert to PIL Image for thumbnail processing
+            img = Image.open(io.BytesIO(pix.tobytes("png")))
+
+            # Create thumbnail while maintaining aspect ratio
+            img.thumbnail(tuple(size), Image.Resampling.LANCZOS)
+
+            # Convert back to bytes
+            thumbnail_bytes = io.BytesIO()
+            img.save(thumbnail_bytes, format='PNG', optimize=True, quality=90)
+            thumbnails.append(thumbnail_bytes.getvalue())
+    finally:
+        doc.close()
+
+    return thumbnails
+
+
+def placeholder_images(_content: Optional[bytes] = None, count: int = 3) -> List[bytes]:
+    """Plain grey 400x300 placeholder slides"""
+    placeholders = []
+    for _ in range(count):
+        placeholder_img = Image.new('RGB', (400, 300), color=(240, 240, 240))
+        placeholder_bytes = io.BytesIO()
+        placeholder_img.save(placeholder_bytes, format='PNG', optimize=True)
+        placeholders.append(placeholder_bytes.getvalue())
+    return placeholders
+
+
+def responsive_variants(image_bytes: bytes, widths: Sequence[int], formats: Sequence[str],
+                        quality: int = 80) -> Dict[str, Any]:
+    """Resize an image to each width (never upscaling) and encode it in every format
+
+    ``jpeg`` falls back to ``png`` for images with transparency.
+    """
+    img = Image.open(io.BytesIO(image_bytes))
+    img = ImageOps.exif_transpose(img)
+    has_alpha = img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
+    img = img.convert("RGBA" if has_alpha else "RGB")
+
+    targets = sorted({width for width in widths if width < img.width} | {min(img.width, max(widths))})
+    variants = []
+    # Largest first, each step resized from the previous one, which is much faster than from the original
+    source = img
+    for width in reversed(targets):
+        height = max(1, round(img.height * width / img.width))
+        if source.width != width:
+            source = source.resize((width, height), Image.Resampling.LANCZOS)
+        for image_format in formats:
+            if image_format == "jpeg" and has_alpha:
+                image_format = "png"
+            output = io.BytesIO()
+            if image_format == "jpeg":
+                source.save(output, format="JPEG", quality=quality, optimize=True, progressive=True)
+            elif image_format == "png":
+                source.save(output, format="PNG", optimize=True)
+            else:
+                source.save(output, format=image_format.upper(), quality=quality)
+            variants.append({"format": image_format, "width": width, "height": height, "data": output.getvalue()})
+
+    return {"width": img.width, "height": img.height, "has_alpha": has_alpha, "variants": variants[::-1]}
+
+
+def xlsx_workbook(title: str, headers: Sequence[str], rows: Sequence[Sequence[Any]]) -> bytes:
+    """Single-sheet workbook with a styled header row and auto-sized columns"""
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = title
+    ws.append(list(headers))
+
+    # Style headers
+    header_font = Font(bold=True, color="FFFFFF")
+    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+    for col_num, _ in enumerate(headers, 1):
+        cell = ws.cell(row=1, column=col_num)
+        cell.font = header_font
+        cell.fill = header_fill
+        cell.alignment = Alignment(horizontal="center")
+
+    widths = [len(str(header)) for header in headers]
+    for row in rows:
+        ws.append(list(row))
+        for index, value in enumerate(row):
+            widths[index] = max(widths[index], len(str(value)))
+
+    # Auto-adjust column widths
+    for index, width in enumerate(widths, 1):
+        ws.column_dimensions[openpyxl.utils.get_column_letter(index)].width = min(width + 2, 50)
+
+    output = io.BytesIO()
+    wb.save(output)
+    return output.getvalue()
+
+
+def project_report_pdf(filepath: str, project_data: Dict[str, Any], receipts: List[Dict[str, Any]],
+                       ai_insights: Dict[str, Any]) -> str:
+    """Generate PDF report using ReportLab"""
+    # Create PDF document
+    doc = SimpleDocTemplate(filepath, pagesize=letter)
+    styles = getSampleStyleSheet()
+    story = []
+
+    # Title
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=20,
+        spaceAfter=30,
+        alignment=1  # Center alignment
+    )
+    story.append(Paragraph(f"Project Report: {project_data.get('name', 'Unknown')}", title_style))
+    story.append(Spacer(1, 20))
+
+    # Project Overview
+    story.append(Paragraph("Project Overview", styles['Heading2']))
+    project_info = [
+        ['Project Code:', project_data.get('project_code', 'N/A')],
+        ['Status:', project_data.get('status', 'N/A')],
+        ['Manager:', project_data.get('manager', 'N/A')],
+        ['Budget:', f"{project_data.get('budget_amount', 0)} {project_data.get('budget_currency', 'USD')}"],
+        ['Start Date:', project_data.get('start_date_iso', 'N/A')],
+        ['End Date:', project_data.get('end_date_iso', 'N/A')],
+    ]
+
+    project_table = Table(project_info, colWidths=[2*inch, 4*inch])
+    project_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (0, -1), colors.lightgrey),
+        ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 0), (-1, -1), 10),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
+        ('BACKGROUND', (1, 0), (1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ]))
+    story.append(project_table)
+    story.append(Spacer(1, 20))
+
+    # AI Insights
+    if ai_insights.get('executive_summary'):
+        story.append(Paragraph("Executive Summary", styles['Heading2']))
+        story.append(Paragraph(ai_insights['executive_summary'], styles['Normal']))
+        story.append(Spacer(1, 15))
+
+    # Financial Analysis
+    if receipts:
+        story.append(Paragraph("Financial Analysis", styles['Heading2']))
+        total_expenses = sum(r.get('total_amount', 0) for r in receipts)
+        story.append(Paragraph(f"Total Expenses: {total_expenses} {project_data.get('budget_currency', 'USD')}", styles['Normal']))
+        story.append(Paragraph(f"Number of Receipts: {len(receipts)}", styles['Normal']))
+        story.append(Spacer(1, 15))
+
+        # Receipt summary table
+        receipt_data = [['Date', 'Vendor', 'Amount', 'Category']]
+        for receipt in receipts[:10]:  # Limit to first 10 receipts
+            receipt_data.append([
+                receipt.get('date', 'N/A'),
+                receipt.get('vendor', 'N/A')[:30],  # Truncate long names
+                f"{receipt.get('total_amount', 0)} {receipt.get('currency', 'USD')}",
+                receipt.get('category', 'N/A')
+            ])
+
+        receipt_table = Table(receipt_data, colWidths=[1.2*inch, 2*inch, 1.3*inch, 1.5*inch])
+        receipt_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 10),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black)
+        ]))
+        story.append(receipt_table)
+
+    # Build PDF
+    doc.build(story)
+    return filepath
+
+
+def project_report_docx(filepath: str, project_data: Dict[str, Any], receipts: List[Dict[str, Any]],
+                        ai_insights: Dict[str, Any]) -> str:
+    """Generate DOCX report using python-docx"""
+    doc = Document()
+
+    # Add title
+    title = doc.add_heading(f"Project Report: {project_data.get('name', 'Unknown')}", 0)
+    title.alignment = 1  # Center alignment
+
+    # Project Overview
+    doc.add_heading('Project Overview', level=1)
+    overview_table = doc.add_table(rows=6, cols=2)
+    overview_table.style = 'Light Shading Accent 1'
+
+    cells = overview_table.rows
+    cells[0].cells[0].text = 'Project Code:'
+    cells[0].cells[1].text = project_data.get('project_code', 'N/A')
+    cells[1].cells[0].text = 'Status:'
+    cells[1].cells[1].text = project_data.get('status', 'N/A')
+    cells[2].cells[0].text = 'Manager:'
+    cells[2].cells[1].text = project_data.get('manager', 'N/A')
+    cells[3].cells[0].text = 'Budget:'
+    cells[3].cells[1].text = f"{project_data.get('budget_amount', 0)} {project_data.get('budget_currency', 'USD')}"
+    cells[4].cells[0].text = 'Start Date:'
+    cells[4].cells[1].text = project_data.get('start_date_iso', 'N/A')
+    cells[5].cells[0].text = 'End Date:'
+    cells[5].cells[1].text = project_data.get('end_date_iso', 'N/A')
+
+    # AI Insights
+    if ai_insights.get('executive_summary'):
+        doc.add_heading('Executive Summary', level=1)
+        doc.add_paragraph(ai_insights['executive_summary'])
+
+    # Financial Analysis
+    if receipts:
+        doc.add_heading('Financial Analysis', level=1)
+        total_expenses = sum(r.get('total_amount', 0) for r in receipts)
+        doc.add_paragraph(f"Total Expenses: {total_expenses} {project_data.get('budget_currency', 'USD')}")
+        doc.add_paragraph(f"Number of Receipts: {len(receipts)}")
+
+        # Receipt summary table
+        receipt_table = doc.add_table(rows=1, cols=4)
+        receipt_table.style = 'Light Grid Accent 1'
+        hdr_cells = receipt_table.rows[0].cells
+        hdr_cells[0].text = 'Date'
+        hdr_cells[1].text = 'Vendor'
+        hdr_cells[2].text = 'Amount'
+        hdr_cells[3].text = 'Category'
+
+        for receipt in receipts[:10]:  # Limit to first 10 receipts
+            row_cells = receipt_table.add_row().cells
+            row_cells[0].text = receipt.get('date', 'N/A')
+            row_cells[1].text = receipt.get('vendor', 'N/A')[:30]
+            row_cells[2].text = f"{receipt.get('total_amount', 0)} {receipt.get('currency', 'USD')}"
+            row_cells[3].text = receipt.get('category', 'N/A')
+
+    # Save document
+    doc.save(filepath)
+    return filepath
+
+
+PROJECT_REPORT_HTML = """
+<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Project Report: {{ project.name }}</title>
+    <style>
+        body { font-family: Arial, sans-serif; margin: 40px; line-height: 1.6; }
+        .header { text-align: center; border-bottom: 2px solid #333; padding-bottom: 20px; margin-bottom: 30px; }
+        .section { margin-bottom: 30px; }
+        h1 { color: #2c3e50; font-size: 28px; }
+        h2 { color: #34495e; font-size: 22px; border-bottom: 1px solid #bdc3c7; padding-bottom: 5px; }
+        table { width: 100%; border-collapse: collapse; margin: 15px 0; }
+        th, td { border: 1px solid #ddd; padding: 12px; text-align: left; }
+        th { background-color: #f2f2f2; font-weight: bold; }
+        .overview-table { max-width: 600px; }
+        .financial-summary { background-color: #e8f5e8; padding: 15px; border-radius: 5px; }
+        .ai-insights { background-color: #f0f8ff; padding: 15px; border-radius: 5px; border-left: 4px solid #0066cc; }
+        .receipt-row:nth-child(even) { background-color: #f9f9f9; }
+        .amount { font-weight: bold; color: #27ae60; }
+        .date { color: #7f8c8d; }
+    </style>
+</head>
+<body>
+    <div class="header">
+        <h1>Project Report: {{ project.name }}</h1>
+        <p class="date">Generated on {{ generated_date }}</p>
+    </div>
+
+    <div class="section">
+        <h2>Project Overview</h2>
+        <table class="overview-table">
+            <tr><th>Project Code</th><td>{{ project.project_code }}</td></tr>
+            <tr><th>Status</th><td>{{ project.status }}</td></tr>
+            <tr><th>Manager</th><td>{{ project.manager or 'N/A' }}</td></tr>
+            <tr><th>Budget</th><td>{{ project.budget_amount or 0 }} {{ project.budget_currency }}</td></tr>
+            <tr><th>Start Date</th><td>{{ project.start_date_iso or 'N/A' }}</td></tr>
+            <tr><th>End Date</th><td>{{ project.end_date_iso or 'N/A' }}</td></tr>
+        </table>
+    </div>
+
+    {% if ai_insights.executive_summary %}
+    <div class="section">
+        <h2>Executive Summary</h2>
+        <div class="ai-insights">
+            <p>{{ ai_insights.executive_summary }}</p>
+        </div>
+    </div>
+    {% endif %}
+
+    {% if receipts %}
+    <div class="section">
+        <h2>Financial Analysis</h2>
+        <div class="financial-summary">
+            <p><strong>Total Expenses:</strong> <span class="amount">{{ total_expenses }} {{ project.budget_currency }}</span></p>
+            <p><strong>Number of Receipts:</strong> {{ receipts|length }}</p>
+        </div>
+
+        <h3>Receipt Summary</h3>
+        <table>
+            <thead>
+                <tr>
+                    <th>Date</th>
+                    <th>Vendor</th>
+                    <th>Amount</th>
+                    <th>Category</th>
+                </tr>
+            </thead>
+            <tbody>
+                {% for receipt in receipts[:10] %}
+                <tr class="receipt-row">
+                    <td class="date">{{ receipt.date or 'N/A' }}</td>
+                    <td>{{ receipt.vendor or 'N/A' }}</td>
+                    <td class="amount">{{ receipt.total_amount or 0 }} {{ receipt.currency or 'USD' }}</td>
+                    <td>{{ receipt.category or 'N/A' }}</td>
+                </tr>
+                {% endfor %}
+            </tbody>
+        </table>
+    </div>
+    {% endif %}
+
+    <div class="section">
+        <h2>Report Information</h2>
+        <p><em>This report was generated automatically by the Kioo Radio CRM system.</em></p>
+    </div>
+</body>
+</html>
+"""
+
+
+def project_report_html(filepath: str, project_data: Dict[str, Any], receipts: List[Dict[str, Any]],
+                        ai_insights: Dict[str, Any]) -> str:
+    """Generate HTML report using Jinja2"""
+    template = Template(PROJECT_REPORT_HTML)
+    total_expenses = sum(r.get('total_amount', 0) for r in receipts)
+
+    html_content = template.render(
+        project=project_data,
+        receipts=receipts,
+        ai_insights=ai_insights,
+        total_expenses=total_expenses,
+        generated_date=datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    )
+
+    with open(filepath, 'w', encoding='utf-8') as f:
+        f.write(html_content)
+    return filepath
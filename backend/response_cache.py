@@ -0,0 +1,371 @@
+"""
+Response cache for public read endpoints
+Rendered bodies are cached per route and query parameters in a pluggable
+backend (in-process LRU by default, MongoDB when several workers must share
+invalidations) and dropped whenever a write hits the matching path prefix.
+Each entry carries an ETag and Last-Modified so pollers can be answered
+with 304 Not Modified, and keeps its compressed variants so hot payloads
+are encoded once.
+"""
+
+import asyncio
+import functools
+import hashlib
+import inspect
+import json
+import logging
+import os
+import time
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from enum import Enum
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+from compression import choose_encoding, compress, weaken_etag
+
+logger = logging.getLogger(__name__)
+
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+# Extra keyword argument injected into cached endpoints to read conditional headers
+REQUEST_PARAM = "_response_cache_request"
+
+
+class CachedResponse:
+    """A rendered response body with its validators"""
+
+    __slots__ = ("body", "media_type", "etag", "last_modified", "encoded")
+
+    def __init__(self, body: bytes, media_type: str, etag: str, last_modified: datetime):
+        self.body = body
+        self.media_type = media_type
+        self.etag = etag
+        self.last_modified = last_modified
+        # Compressed variants, built on first use and reused while the entry lives
+        self.encoded: Dict[str, bytes] = {}
+
+
+class CacheBackend:
+    """Storage interface for cached responses"""
+
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        raise NotImplementedError
+
+    async def set(self, key: str, namespace: str, entry: CachedResponse, ttl_seconds: float):
+        raise NotImplementedError
+
+    async def invalidate(self, namespace: str):
+        raise NotImplementedError
+
+    async def size(self) -> int:
+        return 0
+
+
+class MemoryCacheBackend(CacheBackend):
+    """Per-process LRU; invalidations only reach the worker that handled the write"""
+
+    def __init__(self, max_entries: int = 1000):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, Tuple[float, str, CachedResponse]]" = OrderedDict()
+
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, _, entry = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return entry
+
+    async def set(self, key: str, namespace: str, entry: CachedResponse, ttl_seconds: float):
+        self._data[key] = (time.monotonic() + ttl_seconds, namespace, entry)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    async def invalidate(self, namespace: str):
+        for key in [key for key, item in self._data.items() if item[1] == namespace]:
+            del self._data[key]
+
+    async def size(self) -> int:
+        return len(self._data)
+
+
+class MongoCacheBackend(CacheBackend):
+    """Shared cache in a MongoDB collection so every worker sees the same invalidations"""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def ensure_indexes(self):
+        await self.collection.create_index("namespace")
+        await self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        document = await self.collection.find_one(
+            {"_id": key, "expires_at": {"$gt": datetime.now(timezone.utc)}}
+        )
+        if not document:
+            return None
+        last_modified = document["last_modified"]
+        if last_modified.tzinfo is None:
+            last_modified = last_modified.replace(tzinfo=timezone.utc)
+        return CachedResponse(bytes(document["body"]), document["media_type"], document["etag"], last_modified)
+
+    async def set(self, key: str, namespace: str, entry: CachedResponse, ttl_seconds: float):
+        await self.collection.replace_one(
+            {"_id": key},
+            {
+                "namespace": namespace,
+                "body": entry.body,
+                "media_type": entry.media_type,
+                "etag": entry.etag,
+                "last_modified": entry.last_modified,
+                "expires_at": datetime.now(timezone.utc) + timedelta(seconds=ttl_seconds),
+            },
+            upsert=True,
+        )
+
+    async def invalidate(self, namespace: str):
+        await self.collection.delete_many({"namespace": namespace})
+
+    async def size(self) -> int:
+        return await self.collection.estimated_document_count()
+
+
+def _key_part(value: Any) -> Any:
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return str(value)
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    """Weak comparison as used for If-None-Match"""
+    if header.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def is_not_modified(request: Request, etag: str, last_modified: datetime) -> bool:
+    """Evaluate If-None-Match, falling back to If-Modified-Since when it is absent"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        # HTTP dates have one-second resolution
+        return last_modified.replace(microsecond=0) <= since
+    return False
+
+
+class ResponseCache:
+    """Decorator-based cache keyed by route and query parameters"""
+
+    def __init__(self, backend: Optional[CacheBackend] = None, default_ttl: float = None):
+        max_entries = int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', '1000'))
+        self.backend = backend or MemoryCacheBackend(max_entries)
+        self.default_ttl = default_ttl or float(os.environ.get('RESPONSE_CACHE_TTL_SECONDS', '300'))
+        # namespace -> path prefixes whose writes invalidate it
+        self.watched: Dict[str, Tuple[str, ...]] = {}
+        # Bumped on invalidation so a miss computed before a write is not stored after it
+        self._generations: Dict[str, int] = defaultdict(int)
+        self._inflight: Dict[str, asyncio.Future] = {}
+        # Last ETag seen per key, so an identical rebuild keeps its Last-Modified
+        self._validators: "OrderedDict[str, Tuple[str, datetime]]" = OrderedDict()
+        self._max_validators = max_entries * 4
+        self.hits: Dict[str, int] = defaultdict(int)
+        self.misses: Dict[str, int] = defaultdict(int)
+        self.not_modified: Dict[str, int] = defaultdict(int)
+        self.invalidations: Dict[str, int] = defaultdict(int)
+        self.errors = 0
+
+    @staticmethod
+    def make_key(namespace: str, route: str, params: Dict[str, Any]) -> str:
+        parts = json.dumps(sorted((name, _key_part(value)) for name, value in params.items()))
+        return f"{namespace}:{route}:{parts}"
+
+    def cached(
+        self,
+        namespace: str,
+        invalidate_on: Iterable[str],
+        ttl: Optional[float] = None,
+        cache_control: Optional[str] = None,
+    ) -> Callable:
+        """Cache an endpoint's response; writes under ``invalidate_on`` prefixes clear it
+
+        Responses carry ETag/Last-Modified (and ``cache_control`` when given) and
+        matching conditional requests get a 304 without running the handler.
+        """
+        self.watched[namespace] = tuple(dict.fromkeys(self.watched.get(namespace, ()) + tuple(invalidate_on)))
+        ttl = ttl or self.default_ttl
+
+        def decorator(func: Callable) -> Callable:
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                request: Optional[Request] = kwargs.pop(REQUEST_PARAM, None)
+                key = self.make_key(namespace, func.__name__, kwargs)
+
+                entry = await self._read(key)
+                if entry is not None:
+                    self.hits[namespace] += 1
+                    return self._respond(namespace, entry, request, cache_control)
+                self.misses[namespace] += 1
+
+                # Concurrent misses for the same key share one handler call
+                pending = self._inflight.get(key)
+                if pending is not None:
+                    entry = await asyncio.shield(pending)
+                    if entry is not None:
+                        return self._respond(namespace, entry, request, cache_control)
+                    # The first call failed or was not cacheable; run the handler directly
+                    return await func(*args, **kwargs)
+
+                future = asyncio.get_running_loop().create_future()
+                self._inflight[key] = future
+                generation = self._generations[namespace]
+                try:
+                    result = await func(*args, **kwargs)
+                    if isinstance(result, Response):
+                        # Only plain 200 bodies are cacheable (not streams or errors)
+                        if result.status_code != 200 or getattr(result, "body", None) is None:
+                            return result
+                        body, media_type = bytes(result.body), result.media_type or "application/octet-stream"
+                    else:
+                        body = json.dumps(
+                            jsonable_encoder(result), ensure_ascii=False, allow_nan=False, separators=(",", ":")
+                        ).encode("utf-8")
+                        media_type = "application/json"
+                    entry = self._build_entry(key, body, media_type)
+                    future.set_result(entry)
+                    if generation == self._generations[namespace]:
+                        await self._write(key, namespace, entry, ttl)
+                    return self._respond(namespace, entry, request, cache_control)
+                finally:
+                    if not future.done():
+                        future.set_result(None)
+                    del self._inflight[key]
+
+            # Ask FastAPI for the Request without changing the endpoint's own parameters
+            signature = inspect.signature(func)
+            wrapper.__signature__ = signature.replace(parameters=[
+                *signature.parameters.values(),
+                inspect.Parameter(REQUEST_PARAM, inspect.Parameter.KEYWORD_ONLY, annotation=Request),
+            ])
+            return wrapper
+
+        return decorator
+
+    def _build_entry(self, key: str, body: bytes, media_type: str) -> CachedResponse:
+        etag = f'"{hashlib.sha1(body).hexdigest()}"'
+        previous = self._validators.get(key)
+        if previous and previous[0] == etag:
+            last_modified = previous[1]
+        else:
+            last_modified = datetime.now(timezone.utc).replace(microsecond=0)
+        self._validators[key] = (etag, last_modified)
+        self._validators.move_to_end(key)
+        while len(self._validators) > self._max_validators:
+            self._validators.popitem(last=False)
+        return CachedResponse(body, media_type, etag, last_modified)
+
+    def _respond(
+        self, namespace: str, entry: CachedResponse, request: Optional[Request], cache_control: Optional[str]
+    ) -> Response:
+        headers = {"ETag": entry.etag, "Last-Modified": format_datetime(entry.last_modified, usegmt=True)}
+        if cache_control:
+            headers["Cache-Control"] = cache_control
+        encoding = None
+        if request is not None:
+            encoding = choose_encoding(request.headers.get("accept-encoding"), entry.media_type, len(entry.body))
+        if encoding:
+            headers["ETag"] = weaken_etag(entry.etag)
+            headers["Vary"] = "Accept-Encoding"
+        if request is not None and is_not_modified(request, entry.etag, entry.last_modified):
+            self.not_modified[namespace] += 1
+            return Response(status_code=304, headers=headers)
+        if not encoding:
+            return Response(content=entry.body, media_type=entry.media_type, headers=headers)
+
+        body = entry.encoded.get(encoding)
+        if body is None:
+            body = entry.encoded[encoding] = compress(entry.body, encoding)
+        headers["Content-Encoding"] = encoding
+        return Response(content=body, media_type=entry.media_type, headers=headers)
+
+    async def _read(self, key: str) -> Optional[CachedResponse]:
+        try:
+            return await self.backend.get(key)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Response cache read failed: {e}")
+            return None
+
+    async def _write(self, key: str, namespace: str, entry: CachedResponse, ttl: float):
+        try:
+            await self.backend.set(key, namespace, entry, ttl)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Response cache write failed: {e}")
+
+    async def invalidate(self, namespace: str):
+        self._generations[namespace] += 1
+        self.invalidations[namespace] += 1
+        try:
+            await self.backend.invalidate(namespace)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Response cache invalidation failed for {namespace}: {e}")
+
+    async def invalidate_path(self, path: str) -> List[str]:
+        """Invalidate every namespace watching a prefix of ``path``"""
+        namespaces = [
+            namespace for namespace, prefixes in self.watched.items()
+            if any(path == prefix or path.startswith(prefix.rstrip("/") + "/") for prefix in prefixes)
+        ]
+        for namespace in namespaces:
+            await self.invalidate(namespace)
+        return namespaces
+
+    async def stats(self) -> Dict[str, Any]:
+        try:
+            entries = await self.backend.size()
+        except Exception:
+            entries = None
+        namespaces = {}
+        for namespace in self.watched:
+            hits, misses = self.hits[namespace], self.misses[namespace]
+            namespaces[namespace] = {
+                "hits": hits,
+                "misses": misses,
+                "hit_ratio": round(hits / (hits + misses), 3) if hits + misses else None,
+                "not_modified": self.not_modified[namespace],
+                "invalidations": self.invalidations[namespace],
+            }
+        return {
+            "backend": type(self.backend).__name__,
+            "default_ttl_seconds": self.default_ttl,
+            "entries": entries,
+            "errors": self.errors,
+            "namespaces": namespaces,
+        }
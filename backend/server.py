@@ -1,4 +1,4 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Response, Form, Depends, File, UploadFile
+from fastapi import FastAPI, APIRouter, HTTPException, Request, Response, Form, Depends, File, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from fastapi.responses import JSONResponse, HTMLResponse, StreamingResponse
@@ -6,49 +6,55 @@ from dotenv import load_dotenv
 from motor.motor_asyncio import AsyncIOMotorClient
 from pathlib import Path
 from pydantic import BaseModel, Field, EmailStr
-from typing import List, Optional, Dict, Any, Union
+from typing import List, Optional, Dict, Any, Union, AsyncIterator
 import uuid
 import os
+import functools
 import json
 import secrets
-import httpx
 import logging
+import asyncio
 from datetime import datetime, time, date, timezone, timedelta
 from enum import Enum
 
 # New imports for document processing
-import fitz  # PyMuPDF
-import io
-from PIL import Image
 import aiohttp
-import aiofiles
-import hashlib
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import pandas as pd
 import csv
 from io import StringIO
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
-import openpyxl
-from openpyxl.styles import Font, PatternFill, Alignment
-from io import BytesIO
 
 # Enhanced CRM Projects imports
-import dropbox
 from openai import OpenAI
 import base64
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, PageBreak
-from reportlab.lib.units import inch
-from docx import Document
-from docx.shared import Inches
-from jinja2 import Template
 import matplotlib.pyplot as plt
 
+from analytics_ingest import AnalyticsIngestQueue
+from geo_resolver import GeoResolver
+from analytics_rollups import AnalyticsRollups, HOURLY, DAILY
+from analytics_retention import AnalyticsRetention
+from index_registry import IndexRegistry
+from response_cache import ResponseCache, MongoCacheBackend, WRITE_METHODS
+from csv_import import CsvImporter, ImportOptions, ImportResult, validate_csv_data
+from import_jobs import FINISHED_STATES, ImportJobs
+from import_schedules import ImportScheduler
+from compression import CompressionMiddleware, PrecompressedStaticFiles
+from document_previews import DocumentPreviewCache, PreviewSource
+from file_storage import (
+    CachedStorage, DropboxStorage, LocalStorage, RangeNotSatisfiable, S3Storage, parse_byte_range
+)
+from image_pipeline import ImagePipeline
+from project_files import InvalidCursor, ProjectFileIndex
+from migrate_project_records import EMBEDDED_PROJECTION, EMBEDDED_QUERY, migrate_project
+from render_service import RenderService, RenderQueueFull, RenderTimeout, PRIORITY_BACKGROUND
+import renderers
+from weather_service import (
+    WeatherService, build_current_weather, build_farmer_weather, build_weather_forecast
+)
+
 # ClickUp CRM Integration
 try:
     from clickup_routes import clickup_router
@@ -116,6 +122,22 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress JSON/XML/CSV responses above per-type size thresholds (brotli when the client accepts it)
+app.add_middleware(CompressionMiddleware)
+
+# Public read endpoints cache their rendered responses; writes to the same paths invalidate them.
+# Set RESPONSE_CACHE_BACKEND=mongo when running several workers so invalidations are shared.
+response_cache = ResponseCache(
+    MongoCacheBackend(db.response_cache) if os.environ.get('RESPONSE_CACHE_BACKEND') == 'mongo' else None
+)
+
+@app.middleware("http")
+async def invalidate_response_cache(request: Request, call_next):
+    response = await call_next(request)
+    if request.method in WRITE_METHODS and response.status_code < 400:
+        await response_cache.invalidate_path(request.url.path)
+    return response
+
 # Simple health check endpoint (no dependencies)
 @app.get("/")
 async def root():
@@ -194,9 +216,12 @@ async def get_server_time():
             "error": "Timezone conversion failed, using UTC"
         }
 
-# Serve static files for thumbnails
-from fastapi.staticfiles import StaticFiles
-app.mount("/api/static", StaticFiles(directory=ROOT_DIR / "static"), name="static")
+# Serve static files for thumbnails; compressible files are served from pre-compressed copies
+app.mount(
+    "/api/static",
+    PrecompressedStaticFiles(directory=ROOT_DIR / "static", compressed_dir=CACHE_DIR / "static_compressed"),
+    name="static"
+)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -243,16 +268,40 @@ class DayOfWeek(str, Enum):
 
 # Service Classes for Enhanced CRM Projects
 class DropboxFileManager:
-    """Service class for Dropbox file operations"""
+    """Service class for project file operations
+
+    Files live in Dropbox by default; FILE_STORAGE_BACKEND=local or s3 swaps the
+    storage, and FILE_CACHE_MAX_MB keeps hot files in a local disk cache.
+    """
     
     def __init__(self):
-        self.access_token = os.getenv('DROPBOX_ACCESS_TOKEN')
-        if not self.access_token:
-            raise ValueError("DROPBOX_ACCESS_TOKEN not found in environment variables")
-        self.client = dropbox.Dropbox(self.access_token)
+        backend = os.getenv('FILE_STORAGE_BACKEND', 'dropbox')
+        if backend == 'local':
+            storage = LocalStorage(os.getenv('FILE_STORAGE_DIR', str(ROOT_DIR / "storage")))
+        elif backend == 's3':
+            bucket = os.getenv('S3_BUCKET')
+            if not bucket:
+                raise ValueError("S3_BUCKET not found in environment variables")
+            storage = S3Storage(
+                bucket,
+                prefix=os.getenv('S3_PREFIX', ''),
+                endpoint_url=os.getenv('S3_ENDPOINT_URL') or None,
+                region=os.getenv('S3_REGION') or None
+            )
+        else:
+            self.access_token = os.getenv('DROPBOX_ACCESS_TOKEN')
+            if not self.access_token:
+                raise ValueError("DROPBOX_ACCESS_TOKEN not found in environment variables")
+            # SDK calls run on the adapter's own threads, never on the event loop
+            storage = DropboxStorage(self.access_token)
+        
+        cache_mb = int(os.getenv('FILE_CACHE_MAX_MB', '512'))
+        if cache_mb > 0 and backend != 'local':
+            storage = CachedStorage(storage, CACHE_DIR / "files", max_bytes=cache_mb * 1024 * 1024)
+        self.storage = storage
     
-    async def upload_file(self, file_content: bytes, project_id: str, filename: str, category: str = None) -> Dict[str, Any]:
-        """Upload file to Dropbox organized by project"""
+    async def upload_file(self, file_content: Union[bytes, UploadFile], project_id: str, filename: str, category: str = None) -> Dict[str, Any]:
+        """Upload file organized by project; UploadFiles are streamed in chunks"""
         try:
             # Organize files by project and category
             if category:
@@ -260,61 +309,47 @@ class DropboxFileManager:
             else:
                 dropbox_path = f"/projects/{project_id}/{filename}"
             
-            # Upload file
-            result = self.client.files_upload(
-                file_content,
-                dropbox_path,
-                mode=dropbox.files.WriteMode('add'),
-                autorename=True
-            )
-            
-            return {
-                'file_id': result.id,
-                'filename': result.name,
-                'file_path': result.path_display,
-                'file_size': result.size,
-                'content_hash': result.content_hash,
-                'server_modified': result.server_modified.isoformat()
-            }
+            return await self.storage.upload(dropbox_path, file_content)
         except Exception as e:
-            logger.error(f"Dropbox upload error: {e}")
+            logger.error(f"File upload error ({self.storage.name}): {e}")
             raise HTTPException(status_code=500, detail=f"File upload failed: {str(e)}")
     
     async def download_file(self, file_path: str) -> tuple[bytes, Dict[str, Any]]:
-        """Download file from Dropbox"""
+        """Download file into memory (prefer stream_file for responses)"""
         try:
-            metadata, response = self.client.files_download(file_path)
-            return response.content, {
-                'filename': metadata.name,
-                'size': metadata.size,
-                'modified': metadata.server_modified.isoformat()
+            content, metadata = await self.storage.download(file_path)
+            return content, {
+                'filename': metadata['filename'],
+                'size': metadata['file_size'],
+                'modified': metadata['server_modified']
             }
         except Exception as e:
-            logger.error(f"Dropbox download error: {e}")
+            logger.error(f"File download error ({self.storage.name}): {e}")
             raise HTTPException(status_code=500, detail=f"File download failed: {str(e)}")
     
+    async def stat_file(self, file_path: str) -> Dict[str, Any]:
+        return await self.storage.stat(file_path)
+    
+    def stream_file(self, file_path: str, start: int = 0, end: Optional[int] = None) -> AsyncIterator[bytes]:
+        """Stream a file (or an inclusive byte range of it) chunk by chunk"""
+        return self.storage.stream(file_path, start, end)
+    
     async def list_project_files(self, project_id: str) -> List[Dict[str, Any]]:
         """List all files for a project"""
         try:
-            project_path = f"/projects/{project_id}"
-            result = self.client.files_list_folder(project_path)
-            
-            files = []
-            for entry in result.entries:
-                if isinstance(entry, dropbox.files.FileMetadata):
-                    files.append({
-                        'file_id': entry.id,
-                        'filename': entry.name,
-                        'file_path': entry.path_display,
-                        'file_size': entry.size,
-                        'modified': entry.server_modified.isoformat()
-                    })
-            
-            return files
-        except dropbox.exceptions.ApiError as e:
-            if e.error.is_path_not_found():
-                return []  # Project folder doesn't exist yet
-            logger.error(f"Dropbox list error: {e}")
+            files = await self.storage.list_folder(f"/projects/{project_id}")
+            return [
+                {
+                    'file_id': entry['file_id'],
+                    'filename': entry['filename'],
+                    'file_path': entry['file_path'],
+                    'file_size': entry['file_size'],
+                    'modified': entry['server_modified']
+                }
+                for entry in files
+            ]
+        except Exception as e:
+            logger.error(f"File list error ({self.storage.name}): {e}")
             raise HTTPException(status_code=500, detail=f"File listing failed: {str(e)}")
 
 class AIReceiptAnalyzer:
@@ -500,293 +535,51 @@ class ReportGenerator:
                 "error": str(e)
             }
     
-    async def generate_pdf_report(self, project_data: Dict[str, Any], receipts: List[Dict[str, Any]], 
-                                ai_insights: Dict[str, Any], report_type: str = "complete") -> str:
-        """Generate PDF report using ReportLab"""
+    async def _render_report(self, renderer, extension: str, label: str, project_data: Dict[str, Any],
+                             receipts: List[Dict[str, Any]], ai_insights: Dict[str, Any]) -> str:
+        """Render a report file in the render pool so it does not block the event loop"""
         try:
             # Create temporary file
-            filename = f"project_report_{project_data.get('project_code', 'unknown')}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
+            filename = f"project_report_{project_data.get('project_code', 'unknown')}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
             filepath = self.temp_dir / filename
-            
-            # Create PDF document
-            doc = SimpleDocTemplate(str(filepath), pagesize=letter)
-            styles = getSampleStyleSheet()
-            story = []
-            
-            # Title
-            title_style = ParagraphStyle(
-                'CustomTitle',
-                parent=styles['Heading1'],
-                fontSize=20,
-                spaceAfter=30,
-                alignment=1  # Center alignment
-            )
-            story.append(Paragraph(f"Project Report: {project_data.get('name', 'Unknown')}", title_style))
-            story.append(Spacer(1, 20))
-            
-            # Project Overview
-            story.append(Paragraph("Project Overview", styles['Heading2']))
-            project_info = [
-                ['Project Code:', project_data.get('project_code', 'N/A')],
-                ['Status:', project_data.get('status', 'N/A')],
-                ['Manager:', project_data.get('manager', 'N/A')],
-                ['Budget:', f"{project_data.get('budget_amount', 0)} {project_data.get('budget_currency', 'USD')}"],
-                ['Start Date:', project_data.get('start_date_iso', 'N/A')],
-                ['End Date:', project_data.get('end_date_iso', 'N/A')],
-            ]
-            
-            project_table = Table(project_info, colWidths=[2*inch, 4*inch])
-            project_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (0, -1), colors.lightgrey),
-                ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-                ('FONTSIZE', (0, 0), (-1, -1), 10),
-                ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
-                ('BACKGROUND', (1, 0), (1, -1), colors.beige),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black)
-            ]))
-            story.append(project_table)
-            story.append(Spacer(1, 20))
-            
-            # AI Insights
-            if ai_insights.get('executive_summary'):
-                story.append(Paragraph("Executive Summary", styles['Heading2']))
-                story.append(Paragraph(ai_insights['executive_summary'], styles['Normal']))
-                story.append(Spacer(1, 15))
-            
-            # Financial Analysis
-            if receipts:
-                story.append(Paragraph("Financial Analysis", styles['Heading2']))
-                total_expenses = sum(r.get('total_amount', 0) for r in receipts)
-                story.append(Paragraph(f"Total Expenses: {total_expenses} {project_data.get('budget_currency', 'USD')}", styles['Normal']))
-                story.append(Paragraph(f"Number of Receipts: {len(receipts)}", styles['Normal']))
-                story.append(Spacer(1, 15))
-                
-                # Receipt summary table
-                receipt_data = [['Date', 'Vendor', 'Amount', 'Category']]
-                for receipt in receipts[:10]:  # Limit to first 10 receipts
-                    receipt_data.append([
-                        receipt.get('date', 'N/A'),
-                        receipt.get('vendor', 'N/A')[:30],  # Truncate long names
-                        f"{receipt.get('total_amount', 0)} {receipt.get('currency', 'USD')}",
-                        receipt.get('category', 'N/A')
-                    ])
-                
-                receipt_table = Table(receipt_data, colWidths=[1.2*inch, 2*inch, 1.3*inch, 1.5*inch])
-                receipt_table.setStyle(TableStyle([
-                    ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-                    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                    ('FONTSIZE', (0, 0), (-1, 0), 10),
-                    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                    ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-                    ('GRID', (0, 0), (-1, -1), 1, colors.black)
-                ]))
-                story.append(receipt_table)
-            
-            # Build PDF
-            doc.build(story)
-            
-            return str(filepath)
-            
+            return await render_service.run(renderer, str(filepath), project_data, receipts, ai_insights)
+        except RenderQueueFull:
+            raise HTTPException(status_code=503, detail="Report rendering is busy, please try again shortly")
+        except RenderTimeout:
+            raise HTTPException(status_code=504, detail=f"{label} generation took too long")
         except Exception as e:
-            logger.error(f"PDF generation error: {e}")
-            raise HTTPException(status_code=500, detail=f"PDF generation failed: {str(e)}")
+            logger.error(f"{label} generation error: {e}")
+            raise HTTPException(status_code=500, detail=f"{label} generation failed: {str(e)}")
+    
+    async def generate_pdf_report(self, project_data: Dict[str, Any], receipts: List[Dict[str, Any]], 
+                                ai_insights: Dict[str, Any], report_type: str = "complete") -> str:
+        """Generate PDF report using ReportLab"""
+        return await self._render_report(renderers.project_report_pdf, "pdf", "PDF", project_data, receipts, ai_insights)
     
     async def generate_docx_report(self, project_data: Dict[str, Any], receipts: List[Dict[str, Any]], 
                                  ai_insights: Dict[str, Any], report_type: str = "complete") -> str:
         """Generate DOCX report using python-docx"""
-        try:
-            # Create temporary file
-            filename = f"project_report_{project_data.get('project_code', 'unknown')}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.docx"
-            filepath = self.temp_dir / filename
-            
-            # Create document
-            doc = Document()
-            
-            # Add title
-            title = doc.add_heading(f"Project Report: {project_data.get('name', 'Unknown')}", 0)
-            title.alignment = 1  # Center alignment
-            
-            # Project Overview
-            doc.add_heading('Project Overview', level=1)
-            overview_table = doc.add_table(rows=6, cols=2)
-            overview_table.style = 'Light Shading Accent 1'
-            
-            cells = overview_table.rows
-            cells[0].cells[0].text = 'Project Code:'
-            cells[0].cells[1].text = project_data.get('project_code', 'N/A')
-            cells[1].cells[0].text = 'Status:'
-            cells[1].cells[1].text = project_data.get('status', 'N/A')
-            cells[2].cells[0].text = 'Manager:'
-            cells[2].cells[1].text = project_data.get('manager', 'N/A')
-            cells[3].cells[0].text = 'Budget:'
-            cells[3].cells[1].text = f"{project_data.get('budget_amount', 0)} {project_data.get('budget_currency', 'USD')}"
-            cells[4].cells[0].text = 'Start Date:'
-            cells[4].cells[1].text = project_data.get('start_date_iso', 'N/A')
-            cells[5].cells[0].text = 'End Date:'
-            cells[5].cells[1].text = project_data.get('end_date_iso', 'N/A')
-            
-            # AI Insights
-            if ai_insights.get('executive_summary'):
-                doc.add_heading('Executive Summary', level=1)
-                doc.add_paragraph(ai_insights['executive_summary'])
-            
-            # Financial Analysis
-            if receipts:
-                doc.add_heading('Financial Analysis', level=1)
-                total_expenses = sum(r.get('total_amount', 0) for r in receipts)
-                doc.add_paragraph(f"Total Expenses: {total_expenses} {project_data.get('budget_currency', 'USD')}")
-                doc.add_paragraph(f"Number of Receipts: {len(receipts)}")
-                
-                # Receipt summary table
-                receipt_table = doc.add_table(rows=1, cols=4)
-                receipt_table.style = 'Light Grid Accent 1'
-                hdr_cells = receipt_table.rows[0].cells
-                hdr_cells[0].text = 'Date'
-                hdr_cells[1].text = 'Vendor'
-                hdr_cells[2].text = 'Amount'
-                hdr_cells[3].text = 'Category'
-                
-                for receipt in receipts[:10]:  # Limit to first 10 receipts
-                    row_cells = receipt_table.add_row().cells
-                    row_cells[0].text = receipt.get('date', 'N/A')
-                    row_cells[1].text = receipt.get('vendor', 'N/A')[:30]
-                    row_cells[2].text = f"{receipt.get('total_amount', 0)} {receipt.get('currency', 'USD')}"
-                    row_cells[3].text = receipt.get('category', 'N/A')
-            
-            # Save document
-            doc.save(str(filepath))
-            
-            return str(filepath)
-            
-        except Exception as e:
-            logger.error(f"DOCX generation error: {e}")
-            raise HTTPException(status_code=500, detail=f"DOCX generation failed: {str(e)}")
+        return await self._render_report(renderers.project_report_docx, "docx", "DOCX", project_data, receipts, ai_insights)
     
     async def generate_html_report(self, project_data: Dict[str, Any], receipts: List[Dict[str, Any]], 
                                  ai_insights: Dict[str, Any], report_type: str = "complete") -> str:
         """Generate HTML report using Jinja2"""
-        try:
-            # Create temporary file
-            filename = f"project_report_{project_data.get('project_code', 'unknown')}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.html"
-            filepath = self.temp_dir / filename
-            
-            # HTML template
-            html_template = """
-            <!DOCTYPE html>
-            <html lang="en">
-            <head>
-                <meta charset="UTF-8">
-                <meta name="viewport" content="width=device-width, initial-scale=1.0">
-                <title>Project Report: {{ project.name }}</title>
-                <style>
-                    body { font-family: Arial, sans-serif; margin: 40px; line-height: 1.6; }
-                    .header { text-align: center; border-bottom: 2px solid #333; padding-bottom: 20px; margin-bottom: 30px; }
-                    .section { margin-bottom: 30px; }
-                    h1 { color: #2c3e50; font-size: 28px; }
-                    h2 { color: #34495e; font-size: 22px; border-bottom: 1px solid #bdc3c7; padding-bottom: 5px; }
-                    table { width: 100%; border-collapse: collapse; margin: 15px 0; }
-                    th, td { border: 1px solid #ddd; padding: 12px; text-align: left; }
-                    th { background-color: #f2f2f2; font-weight: bold; }
-                    .overview-table { max-width: 600px; }
-                    .financial-summary { background-color: #e8f5e8; padding: 15px; border-radius: 5px; }
-                    .ai-insights { background-color: #f0f8ff; padding: 15px; border-radius: 5px; border-left: 4px solid #0066cc; }
-                    .receipt-row:nth-child(even) { background-color: #f9f9f9; }
-                    .amount { font-weight: bold; color: #27ae60; }
-                    .date { color: #7f8c8d; }
-                </style>
-            </head>
-            <body>
-                <div class="header">
-                    <h1>Project Report: {{ project.name }}</h1>
-                    <p class="date">Generated on {{ generated_date }}</p>
-                </div>
-                
-                <div class="section">
-                    <h2>Project Overview</h2>
-                    <table class="overview-table">
-                        <tr><th>Project Code</th><td>{{ project.project_code }}</td></tr>
-                        <tr><th>Status</th><td>{{ project.status }}</td></tr>
-                        <tr><th>Manager</th><td>{{ project.manager or 'N/A' }}</td></tr>
-                        <tr><th>Budget</th><td>{{ project.budget_amount or 0 }} {{ project.budget_currency }}</td></tr>
-                        <tr><th>Start Date</th><td>{{ project.start_date_iso or 'N/A' }}</td></tr>
-                        <tr><th>End Date</th><td>{{ project.end_date_iso or 'N/A' }}</td></tr>
-                    </table>
-                </div>
-                
-                {% if ai_insights.executive_summary %}
-                <div class="section">
-                    <h2>Executive Summary</h2>
-                    <div class="ai-insights">
-                        <p>{{ ai_insights.executive_summary }}</p>
-                    </div>
-                </div>
-                {% endif %}
-                
-                {% if receipts %}
-                <div class="section">
-                    <h2>Financial Analysis</h2>
-                    <div class="financial-summary">
-                        <p><strong>Total Expenses:</strong> <span class="amount">{{ total_expenses }} {{ project.budget_currency }}</span></p>
-                        <p><strong>Number of Receipts:</strong> {{ receipts|length }}</p>
-                    </div>
-                    
-                    <h3>Receipt Summary</h3>
-                    <table>
-                        <thead>
-                            <tr>
-                                <th>Date</th>
-                                <th>Vendor</th>
-                                <th>Amount</th>
-                                <th>Category</th>
-                            </tr>
-                        </thead>
-                        <tbody>
-                            {% for receipt in receipts[:10] %}
-                            <tr class="receipt-row">
-                                <td class="date">{{ receipt.date or 'N/A' }}</td>
-                                <td>{{ receipt.vendor or 'N/A' }}</td>
-                                <td class="amount">{{ receipt.total_amount or 0 }} {{ receipt.currency or 'USD' }}</td>
-                                <td>{{ receipt.category or 'N/A' }}</td>
-                            </tr>
-                            {% endfor %}
-                        </tbody>
-                    </table>
-                </div>
-                {% endif %}
-                
-                <div class="section">
-                    <h2>Report Information</h2>
-                    <p><em>This report was generated automatically by the Kioo Radio CRM system.</em></p>
-                </div>
-            </body>
-            </html>
-            """
-            
-            # Render template
-            template = Template(html_template)
-            total_expenses = sum(r.get('total_amount', 0) for r in receipts)
-            
-            html_content = template.render(
-                project=project_data,
-                receipts=receipts,
-                ai_insights=ai_insights,
-                total_expenses=total_expenses,
-                generated_date=datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            )
-            
-            # Save HTML file
-            with open(filepath, 'w', encoding='utf-8') as f:
-                f.write(html_content)
-            
-            return str(filepath)
-            
-        except Exception as e:
-            logger.error(f"HTML generation error: {e}")
-            raise HTTPException(status_code=500, detail=f"HTML generation failed: {str(e)}")
+        return await self._render_report(renderers.project_report_html, "html", "HTML", project_data, receipts, ai_insights)
+
+# CPU-bound rendering (reports, exports, previews) runs in worker processes
+render_service = RenderService()
+
+async def render_workbook(title: str, headers: List[str], rows: List[List[Any]]) -> bytes:
+    """Build an XLSX export in the render pool; a busy pool or an overrunning job become 503/504"""
+    try:
+        return await render_service.run(renderers.xlsx_workbook, title, headers, rows)
+    except RenderQueueFull:
+        raise HTTPException(status_code=503, detail="Export rendering is busy, please try again shortly")
+    except RenderTimeout:
+        raise HTTPException(status_code=504, detail="Export took too long to render")
+
+# Project uploads are streamed to Dropbox in chunks, so this only bounds storage use
+PROJECT_UPLOAD_MAX_MB = int(os.environ.get('PROJECT_UPLOAD_MAX_MB', '100'))
 
 # Initialize services (conditionally to avoid startup errors)
 try:
@@ -796,6 +589,21 @@ except Exception as e:
     logger.warning(f"Failed to initialize Dropbox manager: {e}")
     dropbox_manager = None
 
+# File metadata per project, kept in sync with storage so listings are database queries
+project_files = ProjectFileIndex(db, storage=dropbox_manager.storage if dropbox_manager else None)
+
+# Projects known to have no embedded files/receipts/reports arrays left (see migrate_project_records)
+migrated_projects = set()
+
+async def migrate_embedded_records(project_code: str):
+    """Move a project's records still embedded in its document into their collections before they are read"""
+    if project_code in migrated_projects:
+        return
+    project = await db.projects.find_one({'project_code': project_code, **EMBEDDED_QUERY}, EMBEDDED_PROJECTION)
+    if project:
+        await migrate_project(db, project)
+    migrated_projects.add(project_code)
+
 try:
     ai_analyzer = AIReceiptAnalyzer()
     logger.info("AI receipt analyzer initialized successfully")
@@ -1450,6 +1258,9 @@ class AboutPageSettings(BaseModel):
     # Preview image URLs (generated dynamically)
     radioProjectPreviewImages: List[str] = []
     maruRadioProposalPreviewImages: List[str] = []
+    # Responsive <picture> data (srcset per format) for the same previews
+    radioProjectPreviewPictures: List[dict] = []
+    maruRadioProposalPreviewPictures: List[dict] = []
 
 # Document processing functions
 async def download_file_from_url(url: str, timeout: int = 30) -> bytes:
@@ -1467,116 +1278,36 @@ async def download_file_from_url(url: str, timeout: int = 30) -> bytes:
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Download failed: {str(e)}")
 
-def generate_pdf_thumbnails(pdf_bytes: bytes, max_pages: int = 3) -> List[bytes]:
-    """Generate thumbnail images from PDF pages."""
-    thumbnails = []
-    
-    try:
-        # Open PDF from bytes
-        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-        
-        # Set matrix for high quality output (300 DPI)
-        mat = fitz.Matrix(2.0, 2.0)  # 2x scale for better quality
-        
-        page_count = min(len(doc), max_pages)
-        
-        for page_num in range(page_count):
-            page = doc[page_num]
-            
-            # Create pixmap with high quality
-            pix = page.get_pixmap(matrix=mat, alpha=False)
-            
-            # Convert to PIL Image for thumbnail processing
-            img_data = pix.tobytes("png")
-            img = Image.open(io.BytesIO(img_data))
-            
-            # Create thumbnail while maintaining aspect ratio
-            img.thumbnail((400, 300), Image.Resampling.LANCZOS)
-            
-            # Convert back to bytes
-            thumbnail_bytes = io.BytesIO()
-            img.save(thumbnail_bytes, format='PNG', optimize=True, quality=90)
-            thumbnails.append(thumbnail_bytes.getvalue())
-        
-        doc.close()
-        
-    except Exception as e:
-        print(f"Error generating PDF thumbnails: {e}")
-        
-    return thumbnails
+# Multi-width WebP/AVIF variants of previews and partner photos, content-addressed
+image_pipeline = ImagePipeline(
+    db,
+    output_dir=THUMBNAILS_DIR / "responsive",
+    url_prefix="/api/static/thumbnails/responsive",
+    run=functools.partial(render_service.run, priority=PRIORITY_BACKGROUND),
+)
 
-async def generate_document_previews():
-    """Generate preview images for both documents."""
-    try:
-        # Generate cache keys
-        ppt_cache_key = hashlib.md5("radio_project_ppt".encode()).hexdigest()
-        pdf_cache_key = hashlib.md5("maru_radio_proposal_pdf".encode()).hexdigest()
-        
-        preview_urls = {
-            "radioProjectPreviewImages": [],
-            "maruRadioProposalPreviewImages": []
-        }
-        
-        # Process PDF document
-        try:
-            pdf_url = "https://customer-assets.emergentagent.com/job_radio-geo-detect/artifacts/r6bt039z_maru_radio_proposal.PDF"
-            pdf_bytes = await download_file_from_url(pdf_url)
-            pdf_thumbnails = generate_pdf_thumbnails(pdf_bytes, max_pages=3)
-            
-            for i, thumbnail_data in enumerate(pdf_thumbnails):
-                filename = f"pdf_{pdf_cache_key}_page_{i+1}.png"
-                filepath = THUMBNAILS_DIR / filename
-                
-                # Save thumbnail
-                async with aiofiles.open(filepath, 'wb') as f:
-                    await f.write(thumbnail_data)
-                
-                preview_urls["maruRadioProposalPreviewImages"].append(f"/api/static/thumbnails/{filename}")
-                
-        except Exception as e:
-            print(f"Error processing PDF: {e}")
-        
-        # For PowerPoint, we'll create a placeholder preview for now
-        # since Aspose.Slides requires a license
-        try:
-            # Create placeholder preview images for PowerPoint
-            for i in range(3):
-                placeholder_img = Image.new('RGB', (400, 300), color=(240, 240, 240))
-                # Add text to placeholder
-                filename = f"ppt_{ppt_cache_key}_slide_{i+1}.png"
-                filepath = THUMBNAILS_DIR / filename
-                
-                placeholder_img.save(filepath, format='PNG', optimize=True)
-                preview_urls["radioProjectPreviewImages"].append(f"/api/static/thumbnails/{filename}")
-                
-        except Exception as e:
-            print(f"Error creating PowerPoint placeholders: {e}")
-        
-        return preview_urls
-        
-    except Exception as e:
-        print(f"Error in generate_document_previews: {e}")
-        return {
-            "radioProjectPreviewImages": [],
-            "maruRadioProposalPreviewImages": []
-        }
-    wire: dict = {
-        "beneficiaryName": "VOX Liberia",
-        "beneficiaryAddress": "C/O Galcom International, P.O. Box 1211, Foya, Lofa County, Liberia",
-        "bankName": "Ecobank Liberia Limited",
-        "bankAddress": "Broad Street, Monrovia, Liberia",
-        "accountNumber": "2040034567890123",
-        "swift": "ECOCLRLR",
-        "routingNumber": "011000028",
-        "intermediaryBank": "Citibank N.A. New York",
-        "intermediaryAddress": "399 Park Avenue, New York, NY 10043, USA",
-        "intermediarySwift": "CITIUS33",
-        "intermediaryAccount": "36083522",
-        "wireInstructions": "For further credit to VOX Liberia Account #2040034567890123",
-        "referenceNote": "Kioo Radio 98.1 FM Major Gift",
-        "contactEmail": "info@kiooradio.org",
-        "contactPhone": "+231 77 838 3703"
-    }
+# Document previews are rendered once in the background and looked up from a manifest
+document_previews = DocumentPreviewCache(
+    manifest_path=CACHE_DIR / "document_previews.json",
+    output_dir=THUMBNAILS_DIR,
+    url_prefix="/api/static/thumbnails",
+    run=functools.partial(render_service.run, priority=PRIORITY_BACKGROUND),
+    pipeline=image_pipeline,
+)
+document_previews.register(PreviewSource(
+    field="maruRadioProposalPreviewImages",
+    url=AboutPageSettings().maruRadioProposalPdfUrl,
+    render=renderers.pdf_thumbnails,
+    # Rendered large enough for the widest responsive variant worth sending to a phone
+    render_kwargs={"max_pages": 3, "size": (960, 720)},
+    prefix="pdf",
+))
+# Placeholder slides for the PowerPoint, since Aspose.Slides requires a license
+document_previews.register(PreviewSource(
+    field="radioProjectPreviewImages",
+    render=renderers.placeholder_images,
+    prefix="ppt",
+))
 
 class NewsletterSignup(BaseModel):
     email: str
@@ -1599,6 +1330,8 @@ class ChurchPartner(BaseModel):
     consentToDisplayContact: bool = False
     notes: Optional[str] = None
     photoUrl: Optional[str] = None
+    # Responsive variants of photoUrl, filled in by the image pipeline
+    photoPicture: Optional[dict] = None
     isPublished: bool = True
     sortOrder: Optional[int] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
@@ -1732,49 +1465,46 @@ async def send_simple_email(to_email: str, subject: str, body: str):
         logging.error(f"Failed to send email: {e}")
         return False
 
+geo_resolver = GeoResolver(db)
+
 async def get_ip_location(ip_address: str):
-    """Get location information from IP address using ipapi.co"""
-    try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(f"https://ipapi.co/{ip_address}/json/")
-            if response.status_code == 200:
-                data = response.json()
-                return {
-                    "country": data.get("country_name"),
-                    "city": data.get("city"),
-                    "region": data.get("region"),
-                    "latitude": data.get("latitude"),
-                    "longitude": data.get("longitude")
-                }
-    except Exception as e:
-        logging.error(f"Failed to get IP location: {e}")
-    
-    return {"country": "Unknown", "city": "Unknown"}
+    """Get location information from IP address (memory, offline DB, Mongo cache, then ipapi.co)"""
+    return await geo_resolver.resolve(ip_address)
+
+# Hourly/daily rollups are folded in as each batch is written
+analytics_rollups = AnalyticsRollups(db)
+
+# Batched ingestion for tracking beacons; geolocation is resolved by the flush worker
+analytics_ingest = AnalyticsIngestQueue(db, geo_lookup=get_ip_location, on_flush=analytics_rollups.apply)
+
+# Declared indexes for the API's collections, created at startup
+index_registry = IndexRegistry(db)
+
+# Raw events past the retention window are archived to gzip'd JSONL under CACHE_DIR
+analytics_retention = AnalyticsRetention(db, archive_dir=CACHE_DIR / "analytics_archive")
+# Archiving never deletes events the rollup backfill has not read yet
+analytics_retention.retain_since = analytics_rollups.retained_since
 
 # Visitor tracking endpoints
 @api_router.post("/track-visitor")
 async def track_visitor(visitor_data: dict):
-    """Track visitor page visits with IP geolocation"""
+    """Track visitor page visits; location is filled in asynchronously"""
     try:
         # Get client IP address (in production, handle proxies properly)
         client_ip = visitor_data.get("client_ip", "127.0.0.1")
         
-        # Get location data
-        location_data = await get_ip_location(client_ip)
-        
         # Create visitor record
         visitor_record = VisitorAnalytics(
             ip_address=client_ip,
-            country=location_data.get("country"),
-            city=location_data.get("city"),
             page_url=visitor_data.get("page_url", ""),
             user_agent=visitor_data.get("user_agent", ""),
             referrer=visitor_data.get("referrer"),
             timestamp=datetime.now(timezone.utc)
         )
         
-        # Store in database
-        await db.visitor_analytics.insert_one(visitor_record.dict())
+        # Queue for batched insert
+        if not analytics_ingest.submit("visitor_analytics", visitor_record.dict(), enrich_ip=client_ip):
+            return {"status": "error", "message": "Tracking queue is full"}
         
         return {"status": "success", "message": "Visitor tracked successfully"}
     except Exception as e:
@@ -1797,70 +1527,71 @@ async def track_click(click_data: dict):
             "timestamp": datetime.now(timezone.utc)
         }
         
-        # Store in database
-        await db.click_analytics.insert_one(click_record)
+        # Queue for batched insert
+        if not analytics_ingest.submit("click_analytics", click_record):
+            return {"status": "error", "message": "Tracking queue is full"}
         
         return {"status": "success", "message": "Click tracked successfully"}
     except Exception as e:
         logging.error(f"Failed to track click: {e}")
         return {"status": "error", "message": "Failed to track click"}
 
+@api_router.get("/visitors/ingest-stats")
+async def get_ingest_stats(credentials: HTTPBasicCredentials = Depends(authenticate_admin)):
+    """Get queue depth and flush latency counters for the tracking pipeline"""
+    return {**analytics_ingest.stats(), "geolocation": geo_resolver.stats()}
+
+@api_router.get("/visitors/retention")
+async def get_retention_status(credentials: HTTPBasicCredentials = Depends(authenticate_admin)):
+    """Get the raw analytics retention policy and archiver status"""
+    return analytics_retention.stats()
+
+@api_router.post("/visitors/retention/run")
+async def run_retention(credentials: HTTPBasicCredentials = Depends(authenticate_admin)):
+    """Archive and delete expired raw analytics events now"""
+    try:
+        archived = await analytics_retention.archive_expired()
+        if archived is None:
+            return {"status": "skipped", "message": "Another replica is archiving analytics events"}
+        return {"status": "success", "archived": archived}
+    except Exception as e:
+        logger.error(f"Error archiving analytics events: {e}")
+        raise HTTPException(status_code=500, detail="Failed to archive analytics events")
+
 # Visitor analytics dashboard endpoints (protected)
 @api_router.get("/visitors/management-stats")
 async def get_visitor_stats(credentials: HTTPBasicCredentials = Depends(authenticate_admin)):
-    """Get visitor statistics for the analytics dashboard"""
+    """Get visitor statistics for the analytics dashboard from the hourly/daily rollups"""
     try:
-        # Get total visitors
-        total_visitors = await db.visitor_analytics.count_documents({})
-        
-        # Get unique visitors (by IP)
-        unique_visitors = len(await db.visitor_analytics.distinct("ip_address"))
-        
-        # Get visitors today
-        today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
-        visitors_today = await db.visitor_analytics.count_documents({
-            "timestamp": {"$gte": today}
-        })
-        
-        # Get top countries
-        top_countries_pipeline = [
-            {"$group": {"_id": "$country", "count": {"$sum": 1}}},
-            {"$sort": {"count": -1}},
-            {"$limit": 10}
-        ]
-        top_countries = await db.visitor_analytics.aggregate(top_countries_pipeline).to_list(10)
-        
-        # Get top pages
-        top_pages_pipeline = [
-            {"$group": {"_id": "$page_url", "count": {"$sum": 1}}},
-            {"$sort": {"count": -1}},
-            {"$limit": 10}
-        ]
-        top_pages = await db.visitor_analytics.aggregate(top_pages_pipeline).to_list(10)
+        now = datetime.now(timezone.utc)
+        today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        current_hour = now.replace(minute=0, second=0, microsecond=0)
+        window_start = current_hour - timedelta(hours=23)
+        
+        # One document per day of history plus one per hour of the chart window
+        daily_docs, hourly_docs = await asyncio.gather(
+            analytics_rollups.fetch(DAILY, datetime(1970, 1, 1, tzinfo=timezone.utc)),
+            analytics_rollups.fetch(HOURLY, window_start)
+        )
+        summary = analytics_rollups.summarize(daily_docs)
+        visitors_today = sum(doc.get("visits", 0) for doc in daily_docs if doc["_id"] == today.strftime("%Y-%m-%d"))
         
-        # Get hourly traffic (last 24 hours)
+        # Fill the 24 hourly slots, oldest to newest, including empty hours
+        hourly_counts = {doc["_id"]: doc.get("visits", 0) for doc in hourly_docs}
         hourly_traffic = []
         for i in range(24):
-            hour_start = datetime.now(timezone.utc) - timedelta(hours=i+1)
-            hour_end = datetime.now(timezone.utc) - timedelta(hours=i)
-            
-            count = await db.visitor_analytics.count_documents({
-                "timestamp": {"$gte": hour_start, "$lt": hour_end}
-            })
-            
+            hour_start = window_start + timedelta(hours=i)
             hourly_traffic.append({
                 "hour": hour_start.strftime("%H:00"),
-                "count": count
+                "count": hourly_counts.get(hour_start.strftime("%Y-%m-%dT%H"), 0)
             })
         
-        hourly_traffic.reverse()  # Show oldest to newest
-        
         return {
-            "total_visitors": total_visitors,
-            "unique_visitors": unique_visitors,
+            "total_visitors": summary["visits"],
+            "unique_visitors": summary["unique_visitors"],
             "visitors_today": visitors_today,
-            "top_countries": top_countries,
-            "top_pages": top_pages,
+            "top_countries": summary["top_countries"],
+            "top_pages": summary["top_pages"],
             "hourly_traffic": hourly_traffic
         }
     except Exception as e:
@@ -1889,13 +1620,9 @@ async def get_recent_visitors(credentials: HTTPBasicCredentials = Depends(authen
 async def get_click_analytics(credentials: HTTPBasicCredentials = Depends(authenticate_admin)):
     """Get click analytics data"""
     try:
-        # Get most clicked elements
-        click_pipeline = [
-            {"$group": {"_id": "$element_type", "count": {"$sum": 1}}},
-            {"$sort": {"count": -1}},
-            {"$limit": 10}
-        ]
-        click_stats = await db.click_analytics.aggregate(click_pipeline).to_list(10)
+        # Get most clicked elements from the daily rollups
+        daily_docs = await analytics_rollups.fetch(DAILY, datetime(1970, 1, 1, tzinfo=timezone.utc))
+        click_stats = analytics_rollups.summarize(daily_docs)["top_element_types"]
         
         # Get recent clicks
         recent_clicks = await db.click_analytics.find().sort("timestamp", -1).limit(20).to_list(20)
@@ -2018,6 +1745,7 @@ async def create_program(program: ProgramCreate):
     return program_obj
 
 @api_router.get("/programs", response_model=List[Program])
+@response_cache.cached("programs", invalidate_on=["/api/programs"])
 async def get_programs(language: Optional[ProgramLanguage] = None, day: Optional[DayOfWeek] = None):
     filter_dict = {}
     if language:
@@ -2060,6 +1788,7 @@ async def get_programs(language: Optional[ProgramLanguage] = None, day: Optional
     return converted_programs
 
 @api_router.get("/programs/schedule")
+@response_cache.cached("programs", invalidate_on=["/api/programs"], cache_control="public, max-age=300")
 async def get_schedule():
     programs = await db.programs.find().sort([("day_of_week", 1), ("start_time", 1)]).to_list(1000)
     
@@ -2107,6 +1836,7 @@ async def create_impact_story(story: ImpactStoryCreate):
     return story_obj
 
 @api_router.get("/impact-stories", response_model=List[ImpactStory])
+@response_cache.cached("impact_stories", invalidate_on=["/api/impact-stories"])
 async def get_impact_stories(featured_only: bool = False):
     filter_dict = {}
     if featured_only:
@@ -2239,12 +1969,9 @@ async def newsletter_signup(signup: NewsletterSignupCreate):
 
 # Church Partners endpoints
 @api_router.get("/church-partners")
+@response_cache.cached("church_partners", invalidate_on=["/api/church-partners"], cache_control="public, max-age=300")
 async def get_church_partners(country: Optional[str] = None, city: Optional[str] = None, published_only: bool = True):
     try:
-        # Test database connection
-        total_count = await db.church_partners.count_documents({})
-        print(f"Total partners in DB: {total_count}")
-        
         query = {}
         if country:
             query["country"] = country
@@ -2253,10 +1980,7 @@ async def get_church_partners(country: Optional[str] = None, city: Optional[str]
         if published_only:
             query["isPublished"] = True
         
-        print(f"Query: {query}")  # Debug
-        
         partners = await db.church_partners.find(query).to_list(1000)
-        print(f"Found {len(partners)} partners")  # Debug
         
         # Sort by sortOrder if provided, then by pastorName
         def sort_key(partner):
@@ -2280,8 +2004,26 @@ async def get_church_partners(country: Optional[str] = None, city: Optional[str]
         
         return result
     except Exception as e:
-        print(f"Error in get_church_partners: {e}")
-        return []
+        # Raised rather than answered with an empty list, which would be cached
+        logger.error(f"Error fetching church partners: {e}")
+        raise HTTPException(status_code=500, detail="Failed to fetch church partners")
+
+async def process_partner_photo(partner_id: str, photo_url: Optional[str]):
+    """Generate responsive variants of a partner photo and attach them to the partner"""
+    try:
+        picture = None
+        if photo_url and photo_url.startswith(("http://", "https://")):
+            picture = image_pipeline.picture(await image_pipeline.from_url(photo_url))
+        # Skip if the photo was changed again while this one was processing
+        result = await db.church_partners.update_one(
+            {"id": partner_id, "photoUrl": photo_url}, {"$set": {"photoPicture": picture}}
+        )
+        if result.modified_count:
+            await response_cache.invalidate("church_partners")
+        return picture
+    except Exception as e:
+        logger.warning(f"Failed to process photo for church partner {partner_id}: {e}")
+        return None
 
 @api_router.post("/church-partners", response_model=ChurchPartner)
 async def create_church_partner(partner: ChurchPartnerCreate):
@@ -2327,12 +2069,15 @@ async def get_about_page_settings():
         # Get base settings
         settings = AboutPageSettings()
         
-        # Generate document previews
-        preview_urls = await generate_document_previews()
+        # Previews come from the manifest; the background worker renders them
+        preview_urls = document_previews.previews()
         
         # Update settings with preview images
         settings.radioProjectPreviewImages = preview_urls["radioProjectPreviewImages"]
         settings.maruRadioProposalPreviewImages = preview_urls["maruRadioProposalPreviewImages"]
+        preview_pictures = document_previews.pictures()
+        settings.radioProjectPreviewPictures = preview_pictures["radioProjectPreviewImages"]
+        settings.maruRadioProposalPreviewPictures = preview_pictures["maruRadioProposalPreviewImages"]
         
         return settings
     except Exception as e:
@@ -2341,6 +2086,85 @@ async def get_about_page_settings():
         settings = AboutPageSettings()
         return settings
 
+@api_router.get("/dashboard/document-previews")
+async def get_document_preview_status(admin: str = Depends(authenticate_admin)):
+    """Document preview manifest and worker status"""
+    return document_previews.stats()
+
+class ResponsiveImageRequest(BaseModel):
+    url: str
+
+@api_router.get("/images/{content_hash}")
+async def get_responsive_image(content_hash: str):
+    """Responsive variants of a processed image with srcset strings per format"""
+    manifest = await image_pipeline.get(content_hash)
+    if not manifest:
+        raise HTTPException(status_code=404, detail="Image not found")
+    return {**manifest, "picture": image_pipeline.picture(manifest)}
+
+@api_router.post("/images/responsive")
+async def create_responsive_image(request: ResponsiveImageRequest, admin: str = Depends(authenticate_admin)):
+    """Download an image and generate its responsive variants"""
+    if not request.url.startswith(("http://", "https://")):
+        raise HTTPException(status_code=400, detail="Image URL must be http(s)")
+    try:
+        manifest = await image_pipeline.from_url(request.url)
+        return {**manifest, "picture": image_pipeline.picture(manifest)}
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Failed to process image {request.url}: {e}")
+        raise HTTPException(status_code=500, detail="Failed to process image")
+
+@api_router.post("/images/church-partners/refresh")
+async def refresh_church_partner_photos(admin: str = Depends(authenticate_admin)):
+    """Generate responsive variants for every church partner photo that lacks them
+
+    Photos are only fetched from here, behind admin auth: new and edited partners
+    are picked up on the next refresh because the replacement drops photoPicture.
+    """
+    try:
+        partners = await db.church_partners.find(
+            {"photoUrl": {"$nin": [None, ""]}, "photoPicture": None}, {"id": 1, "photoUrl": 1}
+        ).to_list(1000)
+        processed = 0
+        for partner in partners:
+            if await process_partner_photo(partner["id"], partner["photoUrl"]):
+                processed += 1
+        return {"candidates": len(partners), "processed": processed, **image_pipeline.stats()}
+    except Exception as e:
+        logger.error(f"Failed to refresh church partner photos: {e}")
+        raise HTTPException(status_code=500, detail="Failed to refresh church partner photos")
+
+@api_router.get("/dashboard/file-storage")
+async def get_file_storage_stats(admin: str = Depends(authenticate_admin)):
+    """Project file storage backend and disk cache hit rates"""
+    if not dropbox_manager:
+        return {"backend": None}
+    storage = dropbox_manager.storage
+    return storage.stats() if isinstance(storage, CachedStorage) else {"backend": storage.name}
+
+@api_router.get("/dashboard/render-stats")
+async def get_render_stats(admin: str = Depends(authenticate_admin)):
+    """Render pool utilisation, queue depth and failures"""
+    return render_service.stats()
+
+@api_router.get("/dashboard/import-scheduler")
+async def get_import_scheduler_stats(admin: str = Depends(authenticate_admin)):
+    """Whether this replica runs the import schedules, and how many it ran"""
+    return import_scheduler.stats()
+
+@api_router.post("/dashboard/document-previews/refresh")
+async def refresh_document_previews(force: bool = False, admin: str = Depends(authenticate_admin)):
+    """Revalidate preview sources now, re-rendering changed ones (or all with force)"""
+    try:
+        return {"results": await document_previews.refresh_all(force=force), **document_previews.stats()}
+    except Exception as e:
+        logger.error(f"Failed to refresh document previews: {e}")
+        raise HTTPException(status_code=500, detail="Failed to refresh document previews")
+
 @api_router.put("/about-page-settings")
 async def update_about_page_settings(settings: AboutPageSettings):
     """Update About page settings (admin only in real app)"""
@@ -2567,242 +2391,132 @@ class CallLog(BaseModel):
     category: str  # Testimony, Question, Complaint, Prayer Request
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
+# Weather coverage location models
+class WeatherLocation(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    name: str
+    lat: float = Field(ge=-90, le=90)
+    lon: float = Field(ge=-180, le=180)
+    active: bool = True
+    sort_order: int = 0
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+class WeatherLocationCreate(BaseModel):
+    name: str
+    lat: float = Field(ge=-90, le=90)
+    lon: float = Field(ge=-180, le=180)
+    active: bool = True
+    sort_order: int = 0
+
+class WeatherLocationUpdate(BaseModel):
+    name: Optional[str] = None
+    lat: Optional[float] = Field(None, ge=-90, le=90)
+    lon: Optional[float] = Field(None, ge=-180, le=180)
+    active: Optional[bool] = None
+    sort_order: Optional[int] = None
+
+# Open-Meteo data for all coverage locations, shared by the three weather endpoints;
+# refreshed in the background and persisted so bulletins never wait on the API
+weather_service = WeatherService(db)
+
+# Weather coverage location registry
+@api_router.get("/weather/locations", response_model=List[WeatherLocation])
+async def get_weather_locations(admin: str = Depends(authenticate_admin)):
+    """List weather coverage locations, including inactive ones"""
+    try:
+        await weather_service.load_locations()
+        return await db.weather_locations.find({}, {"_id": 0}).sort([("sort_order", 1), ("name", 1)]).to_list(None)
+    except Exception as e:
+        logger.error(f"Failed to get weather locations: {e}")
+        raise HTTPException(status_code=500, detail="Failed to get weather locations")
+
+@api_router.post("/weather/locations", response_model=WeatherLocation)
+async def create_weather_location(location: WeatherLocationCreate, admin: str = Depends(authenticate_admin)):
+    """Add a weather coverage location"""
+    try:
+        await weather_service.load_locations()
+        if await db.weather_locations.find_one({"name": location.name}):
+            raise HTTPException(status_code=400, detail="Weather location with this name already exists")
+        location_obj = WeatherLocation(**location.dict())
+        await db.weather_locations.insert_one(location_obj.dict())
+        await weather_service.load_locations()
+        return location_obj
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to create weather location: {e}")
+        raise HTTPException(status_code=500, detail="Failed to create weather location")
+
+@api_router.put("/weather/locations/{location_id}", response_model=WeatherLocation)
+async def update_weather_location(
+    location_id: str, location_update: WeatherLocationUpdate, admin: str = Depends(authenticate_admin)
+):
+    """Update a weather coverage location"""
+    try:
+        existing = await db.weather_locations.find_one({"id": location_id})
+        if not existing:
+            raise HTTPException(status_code=404, detail="Weather location not found")
+        update_data = location_update.dict(exclude_unset=True)
+        if "name" in update_data and update_data["name"] != existing["name"]:
+            if await db.weather_locations.find_one({"name": update_data["name"], "id": {"$ne": location_id}}):
+                raise HTTPException(status_code=400, detail="Weather location with this name already exists")
+        update_data["updated_at"] = datetime.now(timezone.utc)
+        await db.weather_locations.update_one({"id": location_id}, {"$set": update_data})
+        await weather_service.load_locations()
+        return await db.weather_locations.find_one({"id": location_id}, {"_id": 0})
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to update weather location: {e}")
+        raise HTTPException(status_code=500, detail="Failed to update weather location")
+
+@api_router.delete("/weather/locations/{location_id}")
+async def delete_weather_location(location_id: str, admin: str = Depends(authenticate_admin)):
+    """Remove a weather coverage location"""
+    try:
+        result = await db.weather_locations.delete_one({"id": location_id})
+        if result.deleted_count == 0:
+            raise HTTPException(status_code=404, detail="Weather location not found")
+        await weather_service.load_locations()
+        return {"message": "Weather location deleted successfully"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to delete weather location: {e}")
+        raise HTTPException(status_code=500, detail="Failed to delete weather location")
+
 # Dashboard endpoints
 @api_router.get("/dashboard/weather")
 async def get_dashboard_weather():
     """Get weather data for broadcast areas using Open-Meteo API"""
     try:
-        import aiohttp
-        
-        # City coordinates
-        cities = {
-            "Foya, Liberia": {"lat": 8.3580, "lon": -10.2049},
-            "Koindu, Sierra Leone": {"lat": 8.2804, "lon": -10.6514},
-            "Guéckédou, Guinea": {"lat": 8.5674, "lon": -10.1330},
-            "Kissidougou, Guinea": {"lat": 9.1885, "lon": -10.0996}
-        }
-        
-        weather_data = {}
-        
-        async with aiohttp.ClientSession() as session:
-            for city_name, coords in cities.items():
-                try:
-                    # Open-Meteo API call
-                    url = f"https://api.open-meteo.com/v1/forecast?latitude={coords['lat']}&longitude={coords['lon']}&current_weather=true&timezone=GMT"
-                    
-                    async with session.get(url, timeout=10) as response:
-                        if response.status == 200:
-                            data = await response.json()
-                            current = data.get("current_weather", {})
-                            
-                            # Map weather codes to conditions (WMO Weather interpretation codes)
-                            weather_code = current.get("weathercode", 0)
-                            condition_map = {
-                                0: "Clear sky", 1: "Mainly clear", 2: "Partly cloudy", 3: "Overcast",
-                                45: "Fog", 48: "Depositing rime fog", 51: "Light drizzle", 53: "Moderate drizzle",
-                                55: "Dense drizzle", 56: "Light freezing drizzle", 57: "Dense freezing drizzle",
-                                61: "Slight rain", 63: "Moderate rain", 65: "Heavy rain", 66: "Light freezing rain",
-                                67: "Heavy freezing rain", 71: "Slight snow", 73: "Moderate snow", 75: "Heavy snow",
-                                77: "Snow grains", 80: "Slight rain showers", 81: "Moderate rain showers",
-                                82: "Violent rain showers", 85: "Slight snow showers", 86: "Heavy snow showers",
-                                95: "Thunderstorm", 96: "Thunderstorm with hail", 99: "Thunderstorm with heavy hail"
-                            }
-                            
-                            condition = condition_map.get(weather_code, "Unknown")
-                            temperature = round(current.get("temperature", 0))
-                            
-                            weather_data[city_name] = {
-                                "temperature": temperature,
-                                "condition": condition,
-                                "updated": datetime.utcnow().strftime("%Y-%m-%d %H:%M")
-                            }
-                        else:
-                            # Fallback data if API fails
-                            weather_data[city_name] = {
-                                "temperature": "N/A",
-                                "condition": "Weather unavailable",
-                                "updated": datetime.utcnow().strftime("%Y-%m-%d %H:%M")
-                            }
-                except Exception as city_error:
-                    print(f"Error fetching weather for {city_name}: {city_error}")
-                    # Fallback data for this city
-                    weather_data[city_name] = {
-                        "temperature": "N/A",
-                        "condition": "Weather unavailable",
-                        "updated": datetime.utcnow().strftime("%Y-%m-%d %H:%M")
-                    }
-        
-        return weather_data
+        return await weather_service.render("current", build_current_weather)
     except Exception as e:
         print(f"Error fetching weather data: {e}")
-        # Return fallback data for all cities
-        fallback_data = {}
-        cities = ["Foya, Liberia", "Koindu, Sierra Leone", "Guéckédou, Guinea", "Kissidougou, Guinea"]
-        for city in cities:
-            fallback_data[city] = {
-                "temperature": "N/A",
-                "condition": "Weather unavailable", 
-                "updated": datetime.utcnow().strftime("%Y-%m-%d %H:%M")
-            }
-        return fallback_data
+        return build_current_weather({location["name"]: None for location in weather_service.locations})
 
 @api_router.get("/dashboard/farmer-weather")
 async def get_farmer_weather():
-    """Get comprehensive farmer-focused weather data for 4 broadcast locations"""
+    """Get comprehensive farmer-focused weather data for broadcast and partner locations"""
     try:
-        import aiohttp
-        import asyncio
-        from datetime import datetime, timezone, timedelta
-        
-        # Fixed coverage locations
-        locations = [
-            {"name": "Foya, Liberia", "lat": 8.3580, "lon": -10.2049},
-            {"name": "Koindu, Sierra Leone", "lat": 8.2804, "lon": -10.6514}, 
-            {"name": "Guéckédou, Guinea", "lat": 8.5674, "lon": -10.1330},
-            {"name": "Kissidougou, Guinea", "lat": 9.1855, "lon": -10.0991}
-        ]
-        
-        weather_data = []
-        
-        async with aiohttp.ClientSession() as session:
-            for location in locations:
-                try:
-                    # Open-Meteo API call for comprehensive weather data
-                    url = f"https://api.open-meteo.com/v1/forecast"
-                    params = {
-                        "latitude": location["lat"],
-                        "longitude": location["lon"],
-                        "current": "temperature_2m,relative_humidity_2m,precipitation,weather_code,cloud_cover,wind_speed_10m",
-                        "hourly": "temperature_2m,precipitation_probability,precipitation,weather_code",
-                        "daily": "precipitation_probability_max,precipitation_sum",
-                        "timezone": "UTC",
-                        "forecast_days": 3,
-                        "forecast_hours": 72
-                    }
-                    
-                    async with session.get(url, params=params, timeout=10) as response:
-                        if response.status == 200:
-                            data = await response.json()
-                            
-                            # Extract current conditions
-                            current = data.get("current", {})
-                            current_time = current.get("time", datetime.now(timezone.utc).isoformat())
-                            
-                            # Format current conditions
-                            now = {
-                                "tempC": round(current.get("temperature_2m", 0), 1),
-                                "humidityPct": round(current.get("relative_humidity_2m", 0)),
-                                "windKph": round(current.get("wind_speed_10m", 0) * 3.6, 1),  # Convert m/s to km/h
-                                "cloudPct": round(current.get("cloud_cover", 0)),
-                                "rainProbPct": 0,  # Not available in current, will estimate from hourly
-                                "rainMmHr": round(current.get("precipitation", 0), 2)
-                            }
-                            
-                            # Extract hourly data (next 72 hours)
-                            hourly_data = data.get("hourly", {})
-                            hourly_times = hourly_data.get("time", [])
-                            hourly_temps = hourly_data.get("temperature_2m", [])
-                            hourly_rain_prob = hourly_data.get("precipitation_probability", [])
-                            hourly_rain_mm = hourly_data.get("precipitation", [])
-                            
-                            hourly = []
-                            for i in range(min(72, len(hourly_times))):  # Limit to 72 hours
-                                hourly.append({
-                                    "timeIsoUTC": hourly_times[i],
-                                    "tempC": round(hourly_temps[i] if i < len(hourly_temps) else 0, 1),
-                                    "rainProbPct": round(hourly_rain_prob[i] if i < len(hourly_rain_prob) else 0),
-                                    "rainMmHr": round(hourly_rain_mm[i] if i < len(hourly_rain_mm) else 0, 2)
-                                })
-                            
-                            # Update current rain probability from first hourly value
-                            if hourly and len(hourly) > 0:
-                                now["rainProbPct"] = hourly[0]["rainProbPct"]
-                            
-                            # Extract daily data (next 3 days)
-                            daily_data = data.get("daily", {})
-                            daily_times = daily_data.get("time", [])
-                            daily_rain_prob_max = daily_data.get("precipitation_probability_max", [])
-                            daily_rain_sum = daily_data.get("precipitation_sum", [])
-                            
-                            daily = []
-                            for i in range(min(3, len(daily_times))):  # Limit to 3 days
-                                # Convert date string to ISO format
-                                date_str = daily_times[i]
-                                if isinstance(date_str, str) and len(date_str) == 10:  # YYYY-MM-DD format
-                                    date_iso = f"{date_str}T00:00:00Z"
-                                else:
-                                    date_iso = date_str
-                                
-                                daily.append({
-                                    "dateIsoUTC": date_iso,
-                                    "rainProbMaxPct": round(daily_rain_prob_max[i] if i < len(daily_rain_prob_max) else 0),
-                                    "rainSumMm": round(daily_rain_sum[i] if i < len(daily_rain_sum) else 0, 1)
-                                })
-                            
-                            # Add location data in required format
-                            location_weather = {
-                                "location": location["name"],
-                                "now": now,
-                                "hourly": hourly,
-                                "daily": daily
-                            }
-                            
-                            weather_data.append(location_weather)
-                            logger.info(f"Successfully fetched farmer weather for {location['name']}")
-                            
-                        else:
-                            logger.warning(f"Failed to fetch weather for {location['name']}: HTTP {response.status}")
-                            # Add fallback data
-                            weather_data.append({
-                                "location": location["name"],
-                                "now": {
-                                    "tempC": 0,
-                                    "humidityPct": 0,
-                                    "windKph": 0,
-                                    "cloudPct": 0,
-                                    "rainProbPct": 0,
-                                    "rainMmHr": 0
-                                },
-                                "hourly": [],
-                                "daily": []
-                            })
-                            
-                except Exception as e:
-                    logger.error(f"Error fetching weather for {location['name']}: {e}")
-                    # Add fallback data for this location
-                    weather_data.append({
-                        "location": location["name"],
-                        "now": {
-                            "tempC": 0,
-                            "humidityPct": 0,
-                            "windKph": 0,
-                            "cloudPct": 0,
-                            "rainProbPct": 0,
-                            "rainMmHr": 0
-                        },
-                        "hourly": [],
-                        "daily": []
-                    })
-        
+        locations = await weather_service.render("farmer", build_farmer_weather)
+        ages = [entry["ageMinutes"] for entry in locations if "ageMinutes" in entry]
         return {
-            "locations": weather_data,
+            "locations": locations,
             "updated": datetime.now(timezone.utc).isoformat(),
-            "cache_duration_minutes": 15,
+            "snapshot_age_minutes": max(ages) if ages else None,
+            "cache_duration_minutes": weather_service.ttl_minutes,
             "timezone": "UTC"
         }
         
     except Exception as e:
         logger.error(f"Farmer weather endpoint error: {e}")
         # Return fallback structure
-        fallback_locations = [
-            "Foya, Liberia", "Koindu, Sierra Leone", 
-            "Guéckédou, Guinea", "Kissidougou, Guinea"
-        ]
-        
         fallback_data = []
-        for loc_name in fallback_locations:
+        for location in weather_service.locations:
             fallback_data.append({
-                "location": loc_name,
+                "location": location["name"],
                 "now": {
                     "tempC": 25,
                     "humidityPct": 75,
@@ -2818,7 +2532,7 @@ async def get_farmer_weather():
         return {
             "locations": fallback_data,
             "updated": datetime.now(timezone.utc).isoformat(),
-            "cache_duration_minutes": 15,
+            "cache_duration_minutes": weather_service.ttl_minutes,
             "timezone": "UTC",
             "error": "Using fallback data"
         }
@@ -2827,99 +2541,10 @@ async def get_farmer_weather():
 async def get_dashboard_weather_forecast():
     """Get 2-day weather forecast for broadcast areas using Open-Meteo API"""
     try:
-        import aiohttp
-        
-        # City coordinates - same as current weather
-        cities = {
-            "Foya, Liberia": {"lat": 8.3580, "lon": -10.2049},
-            "Koindu, Sierra Leone": {"lat": 8.2804, "lon": -10.6514},
-            "Guéckédou, Guinea": {"lat": 8.5674, "lon": -10.1330},
-            "Kissidougou, Guinea": {"lat": 9.1885, "lon": -10.0996}
-        }
-        
-        forecast_data = {}
-        
-        async with aiohttp.ClientSession() as session:
-            for city_name, coords in cities.items():
-                try:
-                    # Open-Meteo API call for 2-day forecast
-                    url = f"https://api.open-meteo.com/v1/forecast?latitude={coords['lat']}&longitude={coords['lon']}&daily=temperature_2m_max,temperature_2m_min,weathercode&timezone=GMT&forecast_days=3"
-                    
-                    async with session.get(url, timeout=10) as response:
-                        if response.status == 200:
-                            data = await response.json()
-                            daily = data.get("daily", {})
-                            dates = daily.get("time", [])
-                            temp_max = daily.get("temperature_2m_max", [])
-                            temp_min = daily.get("temperature_2m_min", [])
-                            weather_codes = daily.get("weathercode", [])
-                            
-                            # Map weather codes to conditions (WMO Weather interpretation codes)
-                            condition_map = {
-                                0: "Clear sky", 1: "Mainly clear", 2: "Partly cloudy", 3: "Overcast",
-                                45: "Fog", 48: "Depositing rime fog", 51: "Light drizzle", 53: "Moderate drizzle",
-                                55: "Dense drizzle", 56: "Light freezing drizzle", 57: "Dense freezing drizzle",
-                                61: "Slight rain", 63: "Moderate rain", 65: "Heavy rain", 66: "Light freezing rain",
-                                67: "Heavy freezing rain", 71: "Slight snow", 73: "Moderate snow", 75: "Heavy snow",
-                                77: "Snow grains", 80: "Slight rain showers", 81: "Moderate rain showers",
-                                82: "Violent rain showers", 85: "Slight snow showers", 86: "Heavy snow showers",
-                                95: "Thunderstorm", 96: "Thunderstorm with hail", 99: "Thunderstorm with heavy hail"
-                            }
-                            
-                            # Get today's current weather and next 2 days forecast
-                            forecast_days = []
-                            for i in range(min(3, len(dates))):  # Today + 2 days
-                                condition = condition_map.get(weather_codes[i] if i < len(weather_codes) else 0, "Unknown")
-                                forecast_days.append({
-                                    "date": dates[i],
-                                    "temp_max": round(temp_max[i]) if i < len(temp_max) else "N/A",
-                                    "temp_min": round(temp_min[i]) if i < len(temp_min) else "N/A",
-                                    "condition": condition,
-                                    "day_label": "Today" if i == 0 else f"Day +{i}"
-                                })
-                            
-                            forecast_data[city_name] = {
-                                "forecast": forecast_days,
-                                "updated": datetime.utcnow().strftime("%Y-%m-%d %H:%M")
-                            }
-                        else:
-                            # Fallback data if API fails
-                            forecast_data[city_name] = {
-                                "forecast": [
-                                    {"date": "N/A", "temp_max": "N/A", "temp_min": "N/A", "condition": "Weather unavailable", "day_label": "Today"},
-                                    {"date": "N/A", "temp_max": "N/A", "temp_min": "N/A", "condition": "Weather unavailable", "day_label": "Day +1"},
-                                    {"date": "N/A", "temp_max": "N/A", "temp_min": "N/A", "condition": "Weather unavailable", "day_label": "Day +2"}
-                                ],
-                                "updated": datetime.utcnow().strftime("%Y-%m-%d %H:%M")
-                            }
-                except Exception as city_error:
-                    print(f"Error fetching weather forecast for {city_name}: {city_error}")
-                    # Fallback data for this city
-                    forecast_data[city_name] = {
-                        "forecast": [
-                            {"date": "N/A", "temp_max": "N/A", "temp_min": "N/A", "condition": "Weather unavailable", "day_label": "Today"},
-                            {"date": "N/A", "temp_max": "N/A", "temp_min": "N/A", "condition": "Weather unavailable", "day_label": "Day +1"},
-                            {"date": "N/A", "temp_max": "N/A", "temp_min": "N/A", "condition": "Weather unavailable", "day_label": "Day +2"}
-                        ],
-                        "updated": datetime.utcnow().strftime("%Y-%m-%d %H:%M")
-                    }
-        
-        return forecast_data
+        return await weather_service.render("forecast", build_weather_forecast)
     except Exception as e:
         print(f"Error fetching weather forecast data: {e}")
-        # Return fallback data for all cities
-        fallback_data = {}
-        cities = ["Foya, Liberia", "Koindu, Sierra Leone", "Guéckédou, Guinea", "Kissidougou, Guinea"]
-        for city in cities:
-            fallback_data[city] = {
-                "forecast": [
-                    {"date": "N/A", "temp_max": "N/A", "temp_min": "N/A", "condition": "Weather unavailable", "day_label": "Today"},
-                    {"date": "N/A", "temp_max": "N/A", "temp_min": "N/A", "condition": "Weather unavailable", "day_label": "Day +1"},
-                    {"date": "N/A", "temp_max": "N/A", "temp_min": "N/A", "condition": "Weather unavailable", "day_label": "Day +2"}
-                ],
-                "updated": datetime.utcnow().strftime("%Y-%m-%d %H:%M")
-            }
-        return fallback_data
+        return build_weather_forecast({location["name"]: None for location in weather_service.locations})
 
 @api_router.get("/dashboard/schedule")
 async def get_dashboard_schedule():
@@ -3248,6 +2873,10 @@ class ProjectRecord(BaseModel):
     tags: Optional[str] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+# Files, receipts and reports live in child collections (see migrate_project_records.py);
+# never load arrays left on documents that have not been migrated yet
+PROJECT_PROJECTION = {'files': 0, 'receipts': 0, 'reports': 0}
+
 class FinanceRecord(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     date_iso: str  # YYYY-MM-DD format
@@ -3312,24 +2941,31 @@ class StoryRecord(BaseModel):
     publish_url: Optional[str] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
-# CSV Import Response Models
-class ImportResult(BaseModel):
-    success: bool
-    imported_count: int
-    error_count: int
-    errors: List[str] = []
-    validation_errors: List[str] = []
-
+# CSV Import Response Models (ImportResult lives in csv_import)
 class ImportSchedule(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     name: str
     file_type: str  # visitors, donations, projects, etc.
     cron_expression: str  # e.g., "0 6 * * *" for daily at 6am
     source_url: Optional[str] = None  # for recurring imports from URLs
+    mode: str = "insert"  # insert/upsert
     last_run: Optional[datetime] = None
     next_run: Optional[datetime] = None
     is_active: bool = True
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    # Outcome of the latest run, written by the import scheduler
+    last_status: Optional[str] = None  # running/queued/skipped/completed/failed/cancelled
+    last_error: Optional[str] = None
+    last_job_id: Optional[str] = None
+    last_duration_seconds: Optional[float] = None
+    last_rows_processed: Optional[int] = None
+    last_imported_count: Optional[int] = None
+    last_updated_count: Optional[int] = None
+    last_error_count: Optional[int] = None
+    run_count: int = 0
+    # Runs missed while no replica was running the scheduler, beyond the misfire grace time
+    missed_runs: int = 0
+    last_missed_run: Optional[datetime] = None
 
 # CRM endpoints with authentication
 security = HTTPBasic()
@@ -3619,147 +3255,53 @@ async def import_contacts_from_sources(admin: str = Depends(authenticate_admin))
         raise HTTPException(status_code=500, detail="Failed to import contacts")
 
 # CSV Import Helper Functions
-def validate_csv_data(df: pd.DataFrame, file_type: str) -> List[str]:
-    """Validate CSV data and return list of errors"""
-    errors = []
-    
-    # Define required fields for each file type
-    required_fields = {
-        'visitors': ['name', 'email'],
-        'donations': ['donor_name', 'amount', 'amount_currency'],
-        'projects': ['project_code', 'name'],
-        'finance': ['type', 'category', 'amount', 'amount_currency'],
-        'tasks_reminders': ['due_date_iso', 'agency', 'description_short'],
-        'users_roles': ['name', 'role', 'email'],
-        'invoices': ['donor_name', 'amount', 'amount_currency'],
-        'stories': ['name_or_anonymous', 'story_text']
-    }
-    
-    # Check required fields
-    if file_type in required_fields:
-        for field in required_fields[file_type]:
-            if field not in df.columns:
-                errors.append(f"Missing required field: {field}")
-    
-    # Validate data types and formats
-    for index, row in df.iterrows():
-        row_num = index + 2  # +2 for header and 0-based indexing
-        
-        # Validate email format
-        if 'email' in row and pd.notna(row['email']):
-            if '@' not in str(row['email']):
-                errors.append(f"Row {row_num}: Invalid email format: {row['email']}")
-        
-        # Validate date format (ISO dates should be YYYY-MM-DD)
-        date_fields = ['date_iso', 'start_date_iso', 'end_date_iso', 'due_date_iso']
-        for date_field in date_fields:
-            if date_field in row and pd.notna(row[date_field]):
-                try:
-                    datetime.strptime(str(row[date_field]), '%Y-%m-%d')
-                except ValueError:
-                    errors.append(f"Row {row_num}: Invalid date format in {date_field}: {row[date_field]}. Expected YYYY-MM-DD")
-        
-        # Validate currency codes
-        if 'amount_currency' in row and pd.notna(row['amount_currency']):
-            if str(row['amount_currency']).upper() not in ['USD', 'LRD']:
-                errors.append(f"Row {row_num}: Invalid currency code: {row['amount_currency']}. Must be USD or LRD")
-        
-        # Validate amounts are numeric
-        if 'amount' in row and pd.notna(row['amount']):
-            try:
-                float(row['amount'])
-            except ValueError:
-                errors.append(f"Row {row_num}: Amount must be numeric: {row['amount']}")
-        
-        # Validate Y/N fields
-        yn_fields = ['consent_y_n', 'anonymous_y_n', 'approved_y_n']
-        for yn_field in yn_fields:
-            if yn_field in row and pd.notna(row[yn_field]):
-                if str(row[yn_field]).upper() not in ['Y', 'N']:
-                    errors.append(f"Row {row_num}: {yn_field} must be Y or N: {row[yn_field]}")
-    
-    return errors
+CSV_IMPORT_MODELS = {
+    'visitors': VisitorRecord,
+    'donations': DonationRecord,
+    'projects': ProjectRecord,
+    'finance': FinanceRecord,
+    'tasks_reminders': TaskReminderRecord,
+    'users_roles': UserRoleRecord,
+    'invoices': InvoiceRecord,
+    'stories': StoryRecord
+}
+
+csv_importer = CsvImporter(db, CSV_IMPORT_MODELS)
+import_jobs = ImportJobs(db, csv_importer)
+import_scheduler = ImportScheduler(db, import_jobs, csv_importer, mongo_url, db_name)
+import_jobs.on_finish = import_scheduler.record_job
+
+def _import_options(file_type: str, mode: str, ordered: bool, batch_size: Optional[int]) -> ImportOptions:
+    """Import options from form fields; HTTP 400 for anything the importer rejects"""
+    valid_types = list(CSV_IMPORT_MODELS)
+    if file_type not in valid_types:
+        raise HTTPException(status_code=400, detail=f"Invalid file type. Must be one of: {', '.join(valid_types)}")
+    options = ImportOptions(mode=mode, ordered=ordered)
+    if batch_size is not None:
+        options.batch_size = batch_size
+    try:
+        csv_importer.check(file_type, options)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return options
 
-async def process_csv_import(df: pd.DataFrame, file_type: str) -> ImportResult:
-    """Process CSV data and import into appropriate collection"""
-    imported_count = 0
-    error_count = 0
-    errors = []
-    
+async def process_csv_import(df: pd.DataFrame, file_type: str, options: Optional[ImportOptions] = None) -> ImportResult:
+    """Process CSV data and import into appropriate collection in batches"""
     try:
-        collection_map = {
-            'visitors': db.visitors,
-            'donations': db.donations,
-            'projects': db.projects,
-            'finance': db.finance,
-            'tasks_reminders': db.tasks_reminders,
-            'users_roles': db.users_roles,
-            'invoices': db.invoices,
-            'stories': db.stories
-        }
-        
-        model_map = {
-            'visitors': VisitorRecord,
-            'donations': DonationRecord,
-            'projects': ProjectRecord,
-            'finance': FinanceRecord,
-            'tasks_reminders': TaskReminderRecord,
-            'users_roles': UserRoleRecord,
-            'invoices': InvoiceRecord,
-            'stories': StoryRecord
-        }
-        
-        if file_type not in collection_map:
-            return ImportResult(
-                success=False,
-                imported_count=0,
-                error_count=0,
-                errors=[f"Unsupported file type: {file_type}"]
-            )
-        
-        collection = collection_map[file_type]
-        model_class = model_map[file_type]
-        
-        # Process each row
-        for index, row in df.iterrows():
-            try:
-                # Convert row to dict and handle NaN values
-                row_dict = row.to_dict()
-                for key, value in row_dict.items():
-                    if pd.isna(value):
-                        row_dict[key] = None
-                
-                # Create model instance
-                record = model_class(**row_dict)
-                
-                # Prepare for MongoDB storage
-                record_data = record.dict()
-                for field in ['created_at']:
-                    if field in record_data and record_data[field]:
-                        record_data[field] = record_data[field].isoformat() if isinstance(record_data[field], datetime) else record_data[field]
-                
-                # Insert into database
-                await collection.insert_one(record_data)
-                imported_count += 1
-                
-            except Exception as e:
-                error_count += 1
-                errors.append(f"Row {index + 2}: {str(e)}")
-                logger.error(f"Failed to import row {index + 2}: {e}")
-        
+        return await csv_importer.import_frame(df, file_type, options)
+    except ValueError as e:
         return ImportResult(
-            success=error_count == 0,
-            imported_count=imported_count,
-            error_count=error_count,
-            errors=errors
+            success=False,
+            imported_count=0,
+            error_count=0,
+            errors=[str(e)]
         )
-        
     except Exception as e:
         logger.error(f"Failed to process CSV import: {e}")
         return ImportResult(
             success=False,
-            imported_count=imported_count,
-            error_count=error_count,
+            imported_count=0,
+            error_count=0,
             errors=[f"Import processing error: {str(e)}"]
         )
 
@@ -3768,14 +3310,20 @@ async def process_csv_import(df: pd.DataFrame, file_type: str) -> ImportResult:
 async def import_csv_data(
     file_type: str = Form(...),
     csv_content: str = Form(...),
+    mode: str = Form('insert'),
+    ordered: bool = Form(False),
+    batch_size: Optional[int] = Form(None),
     admin: str = Depends(authenticate_admin)
 ):
-    """Import data from CSV content"""
+    """Import data from CSV content
+
+    mode=upsert updates records matched by their natural key (e.g. receipt_no,
+    project_code, email) instead of inserting duplicates; ordered=true stops at
+    the first failing row.
+    """
     try:
-        # Validate file type
-        valid_types = ['visitors', 'donations', 'projects', 'finance', 'tasks_reminders', 'users_roles', 'invoices', 'stories']
-        if file_type not in valid_types:
-            raise HTTPException(status_code=400, detail=f"Invalid file type. Must be one of: {', '.join(valid_types)}")
+        # Validate file type and import options
+        options = _import_options(file_type, mode, ordered, batch_size)
         
         # Parse CSV content
         try:
@@ -3797,7 +3345,7 @@ async def import_csv_data(
             )
         
         # Process import
-        result = await process_csv_import(df, file_type)
+        result = await process_csv_import(df, file_type, options)
         return result
         
     except HTTPException:
@@ -3806,6 +3354,64 @@ async def import_csv_data(
         logger.error(f"Failed to import CSV data: {e}")
         raise HTTPException(status_code=500, detail="Failed to import CSV data")
 
+@api_router.post("/crm/import-file", status_code=202)
+async def import_file_data(
+    file_type: str = Form(...),
+    file: UploadFile = File(...),
+    mode: str = Form('insert'),
+    ordered: bool = Form(False),
+    batch_size: Optional[int] = Form(None),
+    admin: str = Depends(authenticate_admin)
+):
+    """Queue a CSV or XLSX upload for import in the background
+
+    Rows that fail validation are reported and skipped while the others are
+    imported; poll /crm/import-jobs/{id} for progress.
+    """
+    try:
+        options = _import_options(file_type, mode, ordered, batch_size)
+        try:
+            return await import_jobs.submit(file.file, file.filename, file_type, options)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to queue file import: {e}")
+        raise HTTPException(status_code=500, detail="Failed to queue file import")
+    finally:
+        await file.close()
+
+@api_router.get("/crm/import-jobs/{job_id}")
+async def get_import_job(job_id: str, admin: str = Depends(authenticate_admin)):
+    """State, counters and error samples of an import job"""
+    try:
+        job = await import_jobs.get(job_id)
+        if not job:
+            raise HTTPException(status_code=404, detail="Import job not found")
+        return job
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to get import job: {e}")
+        raise HTTPException(status_code=500, detail="Failed to get import job")
+
+@api_router.post("/crm/import-jobs/{job_id}/cancel")
+async def cancel_import_job(job_id: str, admin: str = Depends(authenticate_admin)):
+    """Cancel a queued import, or stop a running one after its current chunk"""
+    try:
+        job = await import_jobs.cancel(job_id)
+        if not job:
+            raise HTTPException(status_code=404, detail="Import job not found")
+        if job["status"] in FINISHED_STATES and job["status"] != "cancelled":
+            raise HTTPException(status_code=409, detail=f"Import job already {job['status']}")
+        return job
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to cancel import job: {e}")
+        raise HTTPException(status_code=500, detail="Failed to cancel import job")
+
 @api_router.get("/crm/import-history")
 async def get_import_history(admin: str = Depends(authenticate_admin)):
     """Get import history and statistics"""
@@ -3851,6 +3457,10 @@ async def create_import_schedule(schedule: ImportSchedule, admin: str = Depends(
             CronTrigger.from_crontab(schedule.cron_expression)
         except ValueError as e:
             raise HTTPException(status_code=400, detail=f"Invalid cron expression: {str(e)}")
+        try:
+            csv_importer.check(schedule.file_type, ImportOptions(mode=schedule.mode))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
         # Save schedule to database
         schedule_data = schedule.dict()
@@ -3859,6 +3469,8 @@ async def create_import_schedule(schedule: ImportSchedule, admin: str = Depends(
                 schedule_data[field] = schedule_data[field].isoformat() if isinstance(schedule_data[field], datetime) else schedule_data[field]
         
         await db.import_schedules.insert_one(schedule_data)
+        # Picked up at once on the scheduling replica, by the others at their next sync
+        await import_scheduler.sync()
         return schedule
         
     except HTTPException:
@@ -3899,6 +3511,7 @@ async def delete_import_schedule(schedule_id: str, admin: str = Depends(authenti
         result = await db.import_schedules.delete_one({"id": schedule_id})
         if result.deleted_count == 0:
             raise HTTPException(status_code=404, detail="Schedule not found")
+        await import_scheduler.sync()
         return {"message": "Schedule deleted successfully"}
         
     except HTTPException:
@@ -4228,28 +3841,10 @@ async def export_visitors_xlsx(
         # Get all matching visitors
         visitors = await db.visitors.find(filter_dict).sort("date_iso", -1).to_list(10000)
         
-        # Create Excel workbook
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "Visitors"
-        
         # Headers
         headers = ["Date", "Name", "Phone", "Email", "Country", "County/Prefecture", "City/Town", "Program", "Language", "Testimony", "Source", "Consent"]
-        ws.append(headers)
-        
-        # Style headers
-        header_font = Font(bold=True, color="FFFFFF")
-        header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-        
-        for col_num, _ in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col_num)
-            cell.font = header_font
-            cell.fill = header_fill
-            cell.alignment = Alignment(horizontal="center")
-        
-        # Add data
-        for visitor in visitors:
-            row = [
+        rows = [
+            [
                 visitor.get("date_iso", ""),
                 visitor.get("name", ""),
                 visitor.get("phone", ""),
@@ -4263,32 +3858,18 @@ async def export_visitors_xlsx(
                 visitor.get("source", ""),
                 visitor.get("consent_y_n", "")
             ]
-            ws.append(row)
-        
-        # Auto-adjust column widths
-        for column in ws.columns:
-            max_length = 0
-            column_letter = column[0].column_letter
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = min((max_length + 2), 50)
-            ws.column_dimensions[column_letter].width = adjusted_width
+            for visitor in visitors
+        ]
         
-        # Save to BytesIO
-        output = BytesIO()
-        wb.save(output)
-        output.seek(0)
+        # Build the workbook in the render pool so large exports don't block other requests
+        content = await render_workbook("Visitors", headers, rows)
         
         # Generate filename
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f"visitors_export_{timestamp}.xlsx"
         
         return Response(
-            content=output.read(),
+            content=content,
             media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
             headers={"Content-Disposition": f"attachment; filename={filename}"}
         )
@@ -4772,28 +4353,10 @@ async def export_donations_xlsx(
         # Get all matching donations
         donations = await db.donations.find(filter_dict).sort("date_iso", -1).to_list(10000)
         
-        # Create Excel workbook
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "Donations"
-        
         # Headers
         headers = ["Date", "Donor Name", "Phone", "Email", "Country", "Method", "Currency", "Amount", "Project Code", "Note", "Receipt No", "Anonymous"]
-        ws.append(headers)
-        
-        # Style headers
-        header_font = Font(bold=True, color="FFFFFF")
-        header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-        
-        for col_num, _ in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col_num)
-            cell.font = header_font
-            cell.fill = header_fill
-            cell.alignment = Alignment(horizontal="center")
-        
-        # Add data
-        for donation in donations:
-            row = [
+        rows = [
+            [
                 donation.get("date_iso", ""),
                 donation.get("donor_name", ""),
                 donation.get("phone", ""),
@@ -4807,32 +4370,18 @@ async def export_donations_xlsx(
                 donation.get("receipt_no", ""),
                 donation.get("anonymous_y_n", "")
             ]
-            ws.append(row)
-        
-        # Auto-adjust column widths
-        for column in ws.columns:
-            max_length = 0
-            column_letter = column[0].column_letter
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = min((max_length + 2), 50)
-            ws.column_dimensions[column_letter].width = adjusted_width
+            for donation in donations
+        ]
         
-        # Save to BytesIO
-        output = BytesIO()
-        wb.save(output)
-        output.seek(0)
+        # Build the workbook in the render pool so large exports don't block other requests
+        content = await render_workbook("Donations", headers, rows)
         
         # Generate filename
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f"donations_export_{timestamp}.xlsx"
         
         return Response(
-            content=output.read(),
+            content=content,
             media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
             headers={"Content-Disposition": f"attachment; filename={filename}"}
         )
@@ -5068,7 +4617,7 @@ async def get_projects(
             filter_dict["manager"] = manager
         
         # Get projects with pagination
-        projects = await db.projects.find(filter_dict).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
+        projects = await db.projects.find(filter_dict, PROJECT_PROJECTION).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
         
         # Convert MongoDB documents to API format
         result = []
@@ -5149,7 +4698,7 @@ async def create_project(project: ProjectCreate, admin: str = Depends(authentica
 async def get_project(project_code: str, admin: str = Depends(authenticate_admin)):
     """Get a specific project by code"""
     try:
-        project = await db.projects.find_one({"project_code": project_code})
+        project = await db.projects.find_one({"project_code": project_code}, PROJECT_PROJECTION)
         if not project:
             raise HTTPException(status_code=404, detail="Project not found")
         
@@ -5396,28 +4945,10 @@ async def export_projects_xlsx(
         # Get all matching projects
         projects = await db.projects.find(filter_dict).sort("created_at", -1).to_list(10000)
         
-        # Create Excel workbook
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "Projects"
-        
         # Headers
         headers = ["Project Code", "Name", "Description", "Start Date", "End Date", "Status", "Budget Currency", "Budget Amount", "Manager", "Country", "Tags"]
-        ws.append(headers)
-        
-        # Style headers
-        header_font = Font(bold=True, color="FFFFFF")
-        header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-        
-        for col_num, _ in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col_num)
-            cell.font = header_font
-            cell.fill = header_fill
-            cell.alignment = Alignment(horizontal="center")
-        
-        # Add data
-        for project in projects:
-            row = [
+        rows = [
+            [
                 project.get("project_code", ""),
                 project.get("name", ""),
                 project.get("description_short", ""),
@@ -5430,32 +4961,18 @@ async def export_projects_xlsx(
                 project.get("country", ""),
                 project.get("tags", "")
             ]
-            ws.append(row)
-        
-        # Auto-adjust column widths
-        for column in ws.columns:
-            max_length = 0
-            column_letter = column[0].column_letter
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = min((max_length + 2), 50)
-            ws.column_dimensions[column_letter].width = adjusted_width
+            for project in projects
+        ]
         
-        # Save to BytesIO
-        output = BytesIO()
-        wb.save(output)
-        output.seek(0)
+        # Build the workbook in the render pool so large exports don't block other requests
+        content = await render_workbook("Projects", headers, rows)
         
         # Generate filename
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f"projects_export_{timestamp}.xlsx"
         
         return Response(
-            content=output.read(),
+            content=content,
             media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
             headers={"Content-Disposition": f"attachment; filename={filename}"}
         )
@@ -5505,9 +5022,9 @@ async def upload_project_file(
 ):
     """Upload file to project with optional AI analysis for receipts"""
     try:
-        # Validate file size (3MB limit)
-        if file.size and file.size > 3 * 1024 * 1024:
-            raise HTTPException(status_code=413, detail="File size exceeds 3MB limit")
+        # Validate file size; large files are uploaded in chunks, so the cap only guards storage
+        if file.size and file.size > PROJECT_UPLOAD_MAX_MB * 1024 * 1024:
+            raise HTTPException(status_code=413, detail=f"File size exceeds {PROJECT_UPLOAD_MAX_MB}MB limit")
         
         # Validate file type
         allowed_types = [
@@ -5523,16 +5040,19 @@ async def upload_project_file(
         if file.content_type not in allowed_types:
             raise HTTPException(status_code=415, detail=f"Unsupported file type: {file.content_type}")
         
-        # Read file content
-        file_content = await file.read()
-        
         # Check if Dropbox manager is available
         if not dropbox_manager:
             raise HTTPException(status_code=503, detail="File upload service unavailable")
         
+        # Receipt images are also needed in memory for AI analysis; everything else is streamed
+        file_content = None
+        if category == 'receipt' and file.content_type.startswith('image/'):
+            file_content = await file.read()
+            await file.seek(0)
+        
         # Upload to Dropbox
         upload_result = await dropbox_manager.upload_file(
-            file_content=file_content,
+            file_content=file,
             project_id=project_id,
             filename=file.filename,
             category=category or 'documents'
@@ -5551,10 +5071,7 @@ async def upload_project_file(
         }
         
         # Add to project files
-        await db.projects.update_one(
-            {'project_code': project_id},
-            {'$push': {'files': file_record}}
-        )
+        await project_files.record_upload(project_id, file_record)
         
         response_data = {
             'success': True,
@@ -5589,10 +5106,7 @@ async def upload_project_file(
                     }
                     
                     # Add to project receipts
-                    await db.projects.update_one(
-                        {'project_code': project_id},
-                        {'$push': {'receipts': receipt_record}}
-                    )
+                    await db.project_receipts.insert_one({**receipt_record, 'project_code': project_id})
                     
                     response_data['analysis'] = receipt_record
                     response_data['message'] = 'File uploaded and receipt analyzed successfully'
@@ -5613,52 +5127,60 @@ async def upload_project_file(
 async def list_project_files(
     project_id: str,
     category: Optional[str] = None,
+    limit: int = 100,
+    cursor: Optional[str] = None,
     admin: str = Depends(authenticate_admin)
 ):
-    """List all files for a project"""
+    """List a project's files newest first, one page at a time (pass next_cursor to continue)"""
     try:
-        # Get project with files
-        project = await db.projects.find_one({'project_code': project_id})
-        if not project:
+        await migrate_embedded_records(project_id)
+        if not await db.projects.find_one({'project_code': project_id}, {'_id': 1}):
             raise HTTPException(status_code=404, detail="Project not found")
         
-        files = project.get('files', [])
-        
-        # Filter by category if specified
-        if category:
-            files = [f for f in files if f.get('category') == category]
+        # Projects never synced yet are indexed on first view
+        if project_files.storage and not await project_files.cursors.find_one({'project_code': project_id}):
+            await project_files.sync(project_id)
         
+        page = await project_files.list(project_id, category=category, limit=max(1, min(limit, 500)), cursor=cursor)
         return {
             'project_id': project_id,
-            'files': files,
-            'total_files': len(files)
+            **page,
+            'categories': await project_files.categories(project_id)
         }
         
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Failed to list project files: {e}")
         raise HTTPException(status_code=500, detail="Failed to list project files")
 
+@api_router.post("/projects/{project_id}/files/sync")
+async def sync_project_files(project_id: str, admin: str = Depends(authenticate_admin)):
+    """Pull file changes for a project from storage into the file index now"""
+    try:
+        await migrate_embedded_records(project_id)
+        if not project_files.storage:
+            raise HTTPException(status_code=503, detail="File storage service unavailable")
+        return await project_files.sync(project_id)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to sync project files: {e}")
+        raise HTTPException(status_code=500, detail="Failed to sync project files")
+
 @api_router.get("/projects/{project_id}/files/{file_id}/download")
 async def download_project_file(
     project_id: str,
     file_id: str,
+    request: Request,
     admin: str = Depends(authenticate_admin)
 ):
-    """Download a project file from Dropbox"""
+    """Stream a project file from Dropbox, honouring single byte-range requests"""
     try:
-        # Get project and find file
-        project = await db.projects.find_one({'project_code': project_id})
-        if not project:
-            raise HTTPException(status_code=404, detail="Project not found")
-        
-        file_info = None
-        for f in project.get('files', []):
-            if f.get('file_id') == file_id:
-                file_info = f
-                break
-        
+        await migrate_embedded_records(project_id)
+        file_info = await project_files.get(project_id, file_id)
         if not file_info:
             raise HTTPException(status_code=404, detail="File not found")
         
@@ -5666,17 +5188,35 @@ async def download_project_file(
         if not dropbox_manager:
             raise HTTPException(status_code=503, detail="File download service unavailable")
         
-        # Download from Dropbox
-        file_content, metadata = await dropbox_manager.download_file(file_info['file_path'])
+        size = file_info.get('file_size')
+        if size is None:
+            size = (await dropbox_manager.stat_file(file_info['file_path']))['file_size']
         
-        # Create streaming response
+        headers = {
+            'Content-Disposition': f'attachment; filename="{file_info["filename"]}"',
+            'Accept-Ranges': 'bytes'
+        }
+        try:
+            byte_range = parse_byte_range(request.headers.get('range'), size)
+        except RangeNotSatisfiable:
+            raise HTTPException(status_code=416, detail="Requested range not satisfiable",
+                                headers={'Content-Range': f'bytes */{size}'})
+        
+        if byte_range is None:
+            start, end, status_code = 0, None, 200
+            headers['Content-Length'] = str(size)
+        else:
+            start, end = byte_range
+            status_code = 206
+            headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+            headers['Content-Length'] = str(end - start + 1)
+        
+        # Chunks are passed straight through from Dropbox to the client
         return StreamingResponse(
-            io.BytesIO(file_content),
+            dropbox_manager.stream_file(file_info['file_path'], start, end),
+            status_code=status_code,
             media_type=file_info.get('content_type', 'application/octet-stream'),
-            headers={
-                'Content-Disposition': f'attachment; filename="{file_info["filename"]}"',
-                'Content-Length': str(len(file_content))
-            }
+            headers=headers
         )
         
     except HTTPException:
@@ -5685,6 +5225,16 @@ async def download_project_file(
         logger.error(f"Failed to download project file: {e}")
         raise HTTPException(status_code=500, detail="Failed to download project file")
 
+def _receipt_totals_pipeline(project_id: str, group_key: Any) -> List[Dict[str, Any]]:
+    """Sum of receipt amounts per group_key for a project"""
+    return [
+        {'$match': {'project_code': project_id}},
+        {'$group': {
+            '_id': {'$ifNull': [group_key, 'unknown']},
+            'total': {'$sum': {'$ifNull': ['$total_amount', 0]}}
+        }}
+    ]
+
 @api_router.get("/projects/{project_id}/receipts")
 async def get_project_receipts(
     project_id: str,
@@ -5692,25 +5242,25 @@ async def get_project_receipts(
 ):
     """Get all receipt analyses for a project"""
     try:
-        project = await db.projects.find_one({'project_code': project_id})
-        if not project:
+        await migrate_embedded_records(project_id)
+        if not await db.projects.find_one({'project_code': project_id}, {'_id': 1}):
             raise HTTPException(status_code=404, detail="Project not found")
         
-        receipts = project.get('receipts', [])
-        total_expenses = sum(r.get('total_amount', 0) for r in receipts if r.get('total_amount'))
+        receipts = await db.project_receipts.find(
+            {'project_code': project_id}, {'_id': 0, 'project_code': 0}
+        ).sort('date', -1).to_list(10000)
         
         # Group by category
-        expense_categories = {}
-        for receipt in receipts:
-            category = receipt.get('category', 'unknown')
-            amount = receipt.get('total_amount', 0)
-            expense_categories[category] = expense_categories.get(category, 0) + amount
+        expense_categories = {
+            row['_id']: row['total']
+            for row in await db.project_receipts.aggregate(_receipt_totals_pipeline(project_id, '$category')).to_list(1000)
+        }
         
         return {
             'project_id': project_id,
             'receipts': receipts,
             'total_receipts': len(receipts),
-            'total_expenses': total_expenses,
+            'total_expenses': sum(expense_categories.values()),
             'expense_categories': expense_categories
         }
         
@@ -5728,13 +5278,18 @@ async def generate_project_report(
 ):
     """Generate comprehensive project report with AI insights"""
     try:
+        await migrate_embedded_records(project_id)
         # Get project data
-        project = await db.projects.find_one({'project_code': project_id})
+        project = await db.projects.find_one({'project_code': project_id}, PROJECT_PROJECTION)
         if not project:
             raise HTTPException(status_code=404, detail="Project not found")
         
         # Get receipts
-        receipts = project.get('receipts', []) if request.include_receipts else []
+        receipts = []
+        if request.include_receipts:
+            receipts = await db.project_receipts.find(
+                {'project_code': project_id}, {'_id': 0, 'project_code': 0}
+            ).sort('date', 1).to_list(10000)
         
         # Check if report generator is available
         if not report_generator:
@@ -5772,10 +5327,7 @@ async def generate_project_report(
         }
         
         # Add to project reports
-        await db.projects.update_one(
-            {'project_code': project_id},
-            {'$push': {'reports': report_record}}
-        )
+        await db.project_reports.insert_one({**report_record, 'project_code': project_id})
         
         return {
             'success': True,
@@ -5796,11 +5348,13 @@ async def list_project_reports(
 ):
     """List all generated reports for a project"""
     try:
-        project = await db.projects.find_one({'project_code': project_id})
-        if not project:
+        await migrate_embedded_records(project_id)
+        if not await db.projects.find_one({'project_code': project_id}, {'_id': 1}):
             raise HTTPException(status_code=404, detail="Project not found")
         
-        reports = project.get('reports', [])
+        reports = await db.project_reports.find(
+            {'project_code': project_id}, {'_id': 0, 'project_code': 0}
+        ).sort('generated_at', -1).to_list(1000)
         
         return {
             'project_id': project_id,
@@ -5822,17 +5376,8 @@ async def download_project_report(
 ):
     """Download a generated project report"""
     try:
-        # Get project and find report
-        project = await db.projects.find_one({'project_code': project_id})
-        if not project:
-            raise HTTPException(status_code=404, detail="Project not found")
-        
-        report_info = None
-        for r in project.get('reports', []):
-            if r.get('report_id') == report_id:
-                report_info = r
-                break
-        
+        await migrate_embedded_records(project_id)
+        report_info = await db.project_reports.find_one({'project_code': project_id, 'report_id': report_id})
         if not report_info:
             raise HTTPException(status_code=404, detail="Report not found")
         
@@ -5877,40 +5422,44 @@ async def get_project_analytics(
 ):
     """Get comprehensive analytics for a project"""
     try:
-        project = await db.projects.find_one({'project_code': project_id})
+        await migrate_embedded_records(project_id)
+        project = await db.projects.find_one({'project_code': project_id}, PROJECT_PROJECTION)
         if not project:
             raise HTTPException(status_code=404, detail="Project not found")
         
-        files = project.get('files', [])
-        receipts = project.get('receipts', [])
-        reports = project.get('reports', [])
-        
         # File analytics
-        file_categories = {}
-        total_file_size = 0
-        for f in files:
-            category = f.get('category', 'unknown')
-            file_categories[category] = file_categories.get(category, 0) + 1
-            total_file_size += f.get('file_size', 0)
+        file_rows = await db.project_files.aggregate([
+            {'$match': {'project_code': project_id}},
+            {'$group': {'_id': {'$ifNull': ['$category', 'unknown']}, 'count': {'$sum': 1},
+                        'size': {'$sum': {'$ifNull': ['$file_size', 0]}}}}
+        ]).to_list(1000)
+        file_categories = {row['_id']: row['count'] for row in file_rows}
+        total_file_size = sum(row['size'] for row in file_rows)
+        total_files = sum(file_categories.values())
         
         # Expense analytics
-        total_expenses = sum(r.get('total_amount', 0) for r in receipts if r.get('total_amount'))
-        expense_categories = {}
-        expense_by_month = {}
-        
-        for receipt in receipts:
-            category = receipt.get('category', 'unknown')
-            amount = receipt.get('total_amount', 0)
-            expense_categories[category] = expense_categories.get(category, 0) + amount
-            
-            # Group by month
-            if receipt.get('date'):
-                try:
-                    receipt_date = datetime.fromisoformat(receipt['date'])
-                    month_key = receipt_date.strftime('%Y-%m')
-                    expense_by_month[month_key] = expense_by_month.get(month_key, 0) + amount
-                except:
-                    pass
+        expense_categories = {
+            row['_id']: row['total']
+            for row in await db.project_receipts.aggregate(_receipt_totals_pipeline(project_id, '$category')).to_list(1000)
+        }
+        total_expenses = sum(expense_categories.values())
+        total_receipts = await db.project_receipts.count_documents({'project_code': project_id})
+        
+        # Group by month (receipt dates are ISO strings, so the month is the first 7 characters)
+        month_pipeline = _receipt_totals_pipeline(project_id, {'$substr': ['$date', 0, 7]})
+        month_pipeline[0]['$match']['date'] = {'$regex': r'^\d{4}-\d{2}'}
+        expense_by_month = {
+            row['_id']: row['total']
+            for row in await db.project_receipts.aggregate(month_pipeline + [{'$sort': {'_id': 1}}]).to_list(1000)
+        }
+        
+        report_formats = {
+            row['_id']: row['count']
+            for row in await db.project_reports.aggregate([
+                {'$match': {'project_code': project_id}},
+                {'$group': {'_id': '$format', 'count': {'$sum': 1}}}
+            ]).to_list(100)
+        }
         
         # Budget analysis
         budget = project.get('budget_amount', 0)
@@ -5922,14 +5471,14 @@ async def get_project_analytics(
             'project_name': project.get('name'),
             'status': project.get('status'),
             'file_analytics': {
-                'total_files': len(files),
+                'total_files': total_files,
                 'total_size_mb': round(total_file_size / (1024 * 1024), 2),
                 'by_category': file_categories
             },
             'expense_analytics': {
                 'total_expenses': total_expenses,
                 'currency': project.get('budget_currency', 'USD'),
-                'total_receipts': len(receipts),
+                'total_receipts': total_receipts,
                 'by_category': expense_categories,
                 'by_month': expense_by_month
             },
@@ -5940,11 +5489,11 @@ async def get_project_analytics(
                 'budget_used_percentage': round(budget_used_percentage, 2)
             },
             'report_analytics': {
-                'total_reports': len(reports),
+                'total_reports': sum(report_formats.values()),
                 'by_format': {
-                    'pdf': len([r for r in reports if r.get('format') == 'pdf']),
-                    'docx': len([r for r in reports if r.get('format') == 'docx']),
-                    'html': len([r for r in reports if r.get('format') == 'html'])
+                    'pdf': report_formats.get('pdf', 0),
+                    'docx': report_formats.get('docx', 0),
+                    'html': report_formats.get('html', 0)
                 }
             }
         }
@@ -6228,6 +5777,20 @@ class IncomeExpenseData(BaseModel):
     expenses: float
 
 # Dashboard endpoints with authentication
+@api_router.get("/dashboard/indexes")
+async def get_index_report(execution_stats: bool = False, admin: str = Depends(authenticate_admin)):
+    """Get index sizes, missing/unused indexes and query plans for the hot API queries"""
+    try:
+        return await index_registry.report(execution_stats=execution_stats)
+    except Exception as e:
+        logger.error(f"Failed to build index report: {e}")
+        raise HTTPException(status_code=500, detail="Failed to build index report")
+
+@api_router.get("/dashboard/cache-stats")
+async def get_cache_stats(admin: str = Depends(authenticate_admin)):
+    """Get hit/miss counters for the public response cache"""
+    return await response_cache.stats()
+
 @api_router.get("/dashboard/stats")
 async def get_dashboard_stats(admin: str = Depends(authenticate_admin)):
     """Get dashboard statistics"""
@@ -6237,13 +5800,9 @@ async def get_dashboard_stats(admin: str = Depends(authenticate_admin)):
         month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
         next_month = month_start.replace(month=month_start.month + 1) if month_start.month < 12 else month_start.replace(year=month_start.year + 1, month=1)
         
-        # Visitors this month (from visitor analytics)
-        visitors_this_month = await db.visitor_analytics.count_documents({
-            "timestamp": {
-                "$gte": month_start.isoformat(),
-                "$lt": next_month.isoformat()
-            }
-        })
+        # Visitors this month (from the daily visitor rollups)
+        month_rollups = await analytics_rollups.fetch(DAILY, month_start, next_month)
+        visitors_this_month = sum(doc.get("visits", 0) for doc in month_rollups)
         
         # Donations this month (sum from donations collection)
         donations_pipeline = [
@@ -7189,10 +6748,11 @@ class BulkImportRequest(BaseModel):
 
 # Series endpoints
 @api_router.get("/podcast/series")
+@response_cache.cached("podcast", invalidate_on=["/api/podcast"])
 async def get_podcast_series():
     """Get all podcast series"""
     try:
-        series_list = await db.podcast_series.find().to_list(length=None)
+        series_list = await db.podcast_series.find({}, {"_id": 0}).to_list(length=None)
         return {"series": series_list, "total": len(series_list)}
     except Exception as e:
         logger.error(f"Error fetching podcast series: {e}")
@@ -7265,6 +6825,7 @@ async def delete_podcast_series(series_id: str, credentials: HTTPBasicCredential
 
 # Episodes endpoints
 @api_router.get("/podcast/episodes")
+@response_cache.cached("podcast", invalidate_on=["/api/podcast"])
 async def get_podcast_episodes(
     language: Optional[str] = None,
     series_id: Optional[str] = None,
@@ -7279,7 +6840,7 @@ async def get_podcast_episodes(
         if series_id and series_id != 'all':
             query["seriesId"] = series_id
         
-        episodes_list = await db.podcast_episodes.find(query).sort("date_gmt_iso", -1).skip(skip).limit(limit).to_list(length=None)
+        episodes_list = await db.podcast_episodes.find(query, {"_id": 0}).sort("date_gmt_iso", -1).skip(skip).limit(limit).to_list(length=None)
         total_count = await db.podcast_episodes.count_documents(query)
         
         return {
@@ -7442,6 +7003,7 @@ async def bulk_import_episodes(request: BulkImportRequest, credentials: HTTPBasi
 
 # RSS Feed endpoint
 @api_router.get("/podcast/feed.xml")
+@response_cache.cached("podcast", invalidate_on=["/api/podcast"], cache_control="public, max-age=900")
 async def get_podcast_rss_feed():
     """Generate iTunes/Apple Podcasts compatible RSS feed"""
     try:
@@ -7493,8 +7055,12 @@ async def get_podcast_rss_feed():
             <itunes:category text="{escape_xml(series_title)}" />
         </item>""")
         
-        # Build complete RSS
-        current_date = datetime.now(timezone.utc).strftime("%a, %d %b %Y %H:%M:%S +0000")
+        # Build complete RSS; dates follow the newest episode so unchanged feeds keep their ETag
+        try:
+            newest = datetime.fromisoformat(episodes_list[0]["date_gmt_iso"].replace('Z', '+00:00'))
+        except (IndexError, KeyError, AttributeError, ValueError):
+            newest = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        current_date = newest.strftime("%a, %d %b %Y %H:%M:%S +0000")
         
         rss_xml = f"""<?xml version="1.0" encoding="UTF-8"?>
 <rss version="2.0" xmlns:itunes="http://www.itunes.com/dtds/podcast-1.0.dtd">
@@ -7554,31 +7120,37 @@ async def startup_db_client():
         logger.info("Successfully connected to MongoDB")
         print("✅ MongoDB connection established")
         
+        # Start the batched analytics writer; events before now are backfilled into the rollups once
+        rollup_cutoff = datetime.now(timezone.utc)
+        await analytics_ingest.start()
+        await analytics_rollups.start_backfill(until=rollup_cutoff)
+        await analytics_retention.start()
+        
+        # Serve the last persisted weather at once, then keep it fresh in the background
+        await weather_service.start()
+        await document_previews.start()
+        await project_files.start()
+        # Resume imports interrupted by a restart and run queued ones
+        await import_jobs.start()
+        await import_scheduler.start()
+        
+        try:
+            await asyncio.wait_for(geo_resolver.ensure_indexes(), timeout=5.0)
+        except Exception as geo_index_error:
+            logger.warning(f"Failed to create geolocation cache indexes: {geo_index_error}")
+        
         # Create text indexes for program search (non-blocking)
         try:
             print("Creating database indexes...")
-            await asyncio.wait_for(
-                db.programs.create_index([
-                    ("title", "text"),
-                    ("description", "text"),
-                    ("content", "text"),
-                    ("keywords", "text")
-                ]), 
-                timeout=5.0
-            )
-            logger.info("Created text search indexes for programs collection")
+            # Declared indexes for every collection the API queries are built in the background
+            await index_registry.start()
             
-            # Create text indexes for AI programs collection
-            await asyncio.wait_for(
-                db.ai_programs.create_index([
-                    ("title", "text"),
-                    ("description", "text"),
-                    ("content", "text"),
-                    ("keywords", "text")
-                ]),
-                timeout=5.0
-            )
-            logger.info("Created text search indexes for ai_programs collection")
+            # The analytics timestamp index becomes the retention TTL index once the archiver catches up
+            await asyncio.wait_for(analytics_retention.ensure_indexes(), timeout=5.0)
+            await asyncio.wait_for(analytics_rollups.ensure_indexes(), timeout=5.0)
+            await asyncio.wait_for(weather_service.ensure_indexes(), timeout=5.0)
+            if isinstance(response_cache.backend, MongoCacheBackend):
+                await asyncio.wait_for(response_cache.backend.ensure_indexes(), timeout=5.0)
             print("✅ Database indexes created")
         except asyncio.TimeoutError:
             logger.warning("Index creation timed out - continuing startup")
@@ -7600,6 +7172,23 @@ async def startup_db_client():
 @app.on_event("shutdown")
 async def shutdown_db_client():
     """Close database connection on shutdown"""
+    try:
+        # Flush queued analytics events before the connection goes away
+        await analytics_ingest.drain(timeout=10.0)
+    except Exception as e:
+        logger.error(f"Error draining analytics queue: {e}")
+    await analytics_retention.stop()
+    await analytics_rollups.stop()
+    await index_registry.stop()
+    await weather_service.close()
+    await document_previews.stop()
+    await project_files.stop()
+    await import_scheduler.stop()
+    await import_jobs.stop()
+    render_service.shutdown()
+    if dropbox_manager:
+        dropbox_manager.storage.close()
+    await geo_resolver.close()
     try:
         client.close()
         logger.info("MongoDB connection closed")
@@ -0,0 +1,41 @@
+from io import StringIO
+
+import pandas as pd
+import pytest
+
+from benchmark_csv_validation import EDGE_AMOUNTS, EDGE_DATES, donations, validate_rows, visitors
+from csv_import import validate_csv_data
+
+
+def _read_back(df: pd.DataFrame) -> pd.DataFrame:
+    # Through CSV, so column dtypes are the ones an import sees
+    return pd.read_csv(StringIO(df.to_csv(index=False)))
+
+
+@pytest.mark.parametrize("file_type, build", [("donations", donations), ("visitors", visitors)])
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_same_errors_as_row_by_row_validation(file_type, build, seed):
+    df = _read_back(build(2000, 0.05, seed=seed))
+    assert validate_csv_data(df, file_type) == validate_rows(df, file_type)
+
+
+def test_edge_values_in_every_column():
+    values = EDGE_DATES + EDGE_AMOUNTS
+    df = _read_back(pd.DataFrame({
+        'donor_name': ['Donor'] * len(values),
+        'email': values,
+        'amount': values,
+        'amount_currency': values,
+        'date_iso': values,
+        'anonymous_y_n': values,
+    }))
+    expected = validate_rows(df, 'donations')
+    assert expected
+    assert validate_csv_data(df, 'donations') == expected
+
+
+def test_missing_required_fields_come_first():
+    df = _read_back(pd.DataFrame({'email': ['nobody', 'a@b.org'], 'date_iso': ['2024-01-01', '01/02/2024']}))
+    errors = validate_csv_data(df, 'donations')
+    assert errors == validate_rows(df, 'donations')
+    assert errors[0].startswith("Missing required field")
@@ -0,0 +1,35 @@
+import pytest
+
+from file_storage import RangeNotSatisfiable, parse_byte_range
+
+
+@pytest.mark.parametrize("header", [None, "", "bytes=-", "items=0-10", "bytes=0-10,20-30", "bytes=a-b"])
+def test_whole_file_without_a_usable_single_range(header):
+    assert parse_byte_range(header, 1000) is None
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 999)),
+    ("bytes=999-999", (999, 999)),
+    (" bytes=10-20 ", (10, 20)),
+    # An end past the file is clamped to its last byte
+    ("bytes=500-5000", (500, 999)),
+    # Suffix ranges count from the end, and a suffix longer than the file is the whole file
+    ("bytes=-100", (900, 999)),
+    ("bytes=-5000", (0, 999)),
+])
+def test_single_range(header, expected):
+    assert parse_byte_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header, size", [
+    ("bytes=1000-", 1000),
+    ("bytes=1000-1100", 1000),
+    ("bytes=20-10", 1000),
+    ("bytes=-0", 1000),
+    ("bytes=0-", 0),
+])
+def test_unsatisfiable_range(header, size):
+    with pytest.raises(RangeNotSatisfiable):
+        parse_byte_range(header, size)
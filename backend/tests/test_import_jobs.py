@@ -0,0 +1,166 @@
+import asyncio
+import uuid
+from datetime import datetime, timezone
+from io import BytesIO, StringIO
+
+import gridfs
+import pandas as pd
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+from pydantic import BaseModel, Field
+
+import import_jobs
+from csv_import import CsvImporter, ImportOptions, read_chunks
+from import_jobs import ImportJobs
+
+
+class Visitor(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    name: str
+    email: str
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+
+class MemoryBucket:
+    """The parts of a GridFS bucket the jobs use; mongomock has no GridFS"""
+
+    def __init__(self, files):
+        self.files = files
+
+    def open_upload_stream_with_id(self, file_id, filename, metadata=None):
+        bucket, parts = self, []
+
+        class Upload:
+            async def write(self, data):
+                parts.append(data)
+
+            async def close(self):
+                bucket.files[file_id] = b"".join(parts)
+
+            async def abort(self):
+                parts.clear()
+
+        return Upload()
+
+    async def download_to_stream(self, file_id, destination):
+        if file_id not in self.files:
+            raise gridfs.errors.NoFile(file_id)
+        destination.write(self.files[file_id])
+
+    async def delete(self, file_id):
+        if self.files.pop(file_id, None) is None:
+            raise gridfs.errors.NoFile(file_id)
+
+
+@pytest.fixture
+def db(monkeypatch):
+    files = {}
+    monkeypatch.setattr(import_jobs, "AsyncIOMotorGridFSBucket", lambda db, bucket_name: MemoryBucket(files))
+    monkeypatch.setattr(import_jobs, "CHUNK_ROWS", 10)
+    return AsyncMongoMockClient()["import_jobs_test"]
+
+
+def _worker(db, worker_id):
+    jobs = ImportJobs(db, CsvImporter(db, {"visitors": Visitor}), lease_seconds=60)
+    jobs.worker_id = worker_id
+    return jobs
+
+
+def _csv(rows, invalid_row=None):
+    lines = ["name,email"]
+    for row in range(rows):
+        lines.append(f"Visitor {row},{'not-an-email' if row == invalid_row else f'visitor{row}@example.org'}")
+    return BytesIO(("\n".join(lines) + "\n").encode())
+
+
+async def _crash_in_second_chunk(db, source, options):
+    """Worker a writes the first chunk and part of the second, then dies before its checkpoint"""
+    crashed = _worker(db, "a")
+    write_chunk = crashed.importer.import_chunk
+    calls = []
+
+    async def import_chunk(chunk, *args, **kwargs):
+        calls.append(chunk)
+        if len(calls) == 2:
+            await write_chunk(chunk.iloc[:3], *args, **kwargs)
+            raise asyncio.CancelledError()
+        return await write_chunk(chunk, *args, **kwargs)
+
+    crashed.importer.import_chunk = import_chunk
+    submitted = await crashed.submit(source, "visitors.csv", "visitors", options)
+    with pytest.raises(asyncio.CancelledError):
+        await crashed._execute(await crashed._claim())
+
+    interrupted = await crashed.get(submitted["id"])
+    assert interrupted["status"] == "running"
+    assert interrupted["rows_processed"] == 10
+    # The lease runs out, as it would after a pod restart
+    await db.import_jobs.update_one({"id": submitted["id"]}, {"$set": {"lease_until": None}})
+    return submitted["id"]
+
+
+def test_resumed_job_writes_every_row_once(db):
+    async def scenario():
+        job_id = await _crash_in_second_chunk(db, _csv(25), ImportOptions(batch_size=4))
+        resumed = _worker(db, "b")
+        job = await resumed._claim()
+        assert job["id"] == job_id and job["attempts"] == 2
+        await resumed._execute(job)
+
+        finished = await resumed.get(job_id)
+        assert finished["status"] == "completed" and finished["success"]
+        assert finished["rows_processed"] == 25
+        assert finished["imported_count"] == 25
+        documents = await db.visitors.find({}, {"_id": 0, "id": 1, "name": 1}).to_list(None)
+        assert len(documents) == 25
+        assert len({document["id"] for document in documents}) == 25
+        assert sorted(document["name"] for document in documents) == sorted(f"Visitor {row}" for row in range(25))
+        # The upload is removed once the job finished
+        assert resumed.uploads.files == {}
+
+    asyncio.run(scenario())
+
+
+def test_resumed_ordered_job_stops_at_first_invalid_row(db):
+    async def scenario():
+        job_id = await _crash_in_second_chunk(db, _csv(25, invalid_row=15), ImportOptions(ordered=True, batch_size=4))
+        resumed = _worker(db, "b")
+        await resumed._execute(await resumed._claim())
+
+        finished = await resumed.get(job_id)
+        assert finished["status"] == "completed" and not finished["success"]
+        assert finished["stopped"]
+        assert finished["error_count"] == 1
+        assert finished["validation_errors"] == ["Row 17: Invalid email format: not-an-email"]
+        # Rows before the invalid one, each once
+        assert finished["imported_count"] == 15
+        names = sorted(document["name"] for document in await db.visitors.find({}, {"name": 1}).to_list(None))
+        assert names == sorted(f"Visitor {row}" for row in range(15))
+
+    asyncio.run(scenario())
+
+
+def test_parse_next_skips_rows_before_the_checkpoint():
+    chunks = read_chunks(BytesIO(_csv(25).getvalue()), "csv", 10)
+    chunk, errors = ImportJobs._parse_next(chunks, "csv", "visitors", skip_rows=15)
+    assert list(chunk.index) == list(range(15, 20))
+    assert errors == []
+    chunk, _ = ImportJobs._parse_next(chunks, "csv", "visitors")
+    assert list(chunk.index) == list(range(20, 25))
+    assert ImportJobs._parse_next(chunks, "csv", "visitors") is None
+
+
+def test_unwritten_skips_records_already_imported(db):
+    async def scenario():
+        importer = CsvImporter(db, {"visitors": Visitor})
+        frame = pd.read_csv(StringIO(_csv(6).getvalue().decode()), dtype=str)
+        options = ImportOptions(batch_size=10)
+        first = import_jobs.ImportResult(success=False, imported_count=0, error_count=0)
+        await importer.import_chunk(frame.iloc[:4], "visitors", options, first, id_seed="job")
+
+        again = import_jobs.ImportResult(success=False, imported_count=0, error_count=0)
+        await importer.import_chunk(frame, "visitors", options, again, id_seed="job", skip_existing=True)
+        assert again.imported_count == 6
+        assert await db.visitors.count_documents({}) == 6
+
+    asyncio.run(scenario())
@@ -0,0 +1,73 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from import_schedules import SCHEDULER_LOCK, ImportScheduler
+
+
+class RecordingScheduler(ImportScheduler):
+    """Submits nothing; records which schedules got past the claim"""
+
+    def __init__(self, db):
+        super().__init__(db, jobs=None, importer=None, mongo_url="mongodb://unused", db_name="unused")
+        self.submitted = []
+
+    async def _submit(self, schedule, started):
+        self.submitted.append(schedule["id"])
+        await asyncio.sleep(0)
+        return {"id": f"job-{len(self.submitted)}"}
+
+
+@pytest.fixture
+def db():
+    return AsyncMongoMockClient()["import_schedules_test"]
+
+
+async def add_schedule(db, due: datetime):
+    await db.import_schedules.insert_one({
+        "id": "nightly", "is_active": True, "cron_expression": "0 2 * * *",
+        "source_url": "https://example.com/visitors.csv", "file_type": "visitors",
+        "next_run": due.isoformat(), "run_count": 0,
+    })
+
+
+async def lead(db, scheduler):
+    await db.scheduler_locks.insert_one({
+        "_id": SCHEDULER_LOCK, "owner": scheduler.owner,
+        "expires_at": datetime.now(timezone.utc) + timedelta(minutes=1),
+    })
+
+
+def test_run_fired_twice_is_claimed_once(db):
+    async def scenario():
+        scheduler = RecordingScheduler(db)
+        await lead(db, scheduler)
+        await add_schedule(db, datetime.now(timezone.utc) - timedelta(seconds=1))
+        await asyncio.gather(scheduler.run("nightly"), scheduler.run("nightly"))
+        # A late duplicate sees next_run already moved past now
+        await scheduler.run("nightly")
+        return scheduler, await db.import_schedules.find_one({"id": "nightly"})
+
+    scheduler, schedule = asyncio.run(scenario())
+    assert scheduler.submitted == ["nightly"]
+    assert schedule["run_count"] == 1
+    assert schedule["last_status"] == "queued"
+    assert datetime.fromisoformat(schedule["next_run"]) > datetime.now(timezone.utc)
+
+
+def test_replica_without_the_lease_does_not_run(db):
+    async def scenario():
+        scheduler = RecordingScheduler(db)
+        await db.scheduler_locks.insert_one({
+            "_id": SCHEDULER_LOCK, "owner": "other-host:1",
+            "expires_at": datetime.now(timezone.utc) + timedelta(minutes=1),
+        })
+        await add_schedule(db, datetime.now(timezone.utc) - timedelta(seconds=1))
+        await scheduler.run("nightly")
+        return scheduler, await db.import_schedules.find_one({"id": "nightly"})
+
+    scheduler, schedule = asyncio.run(scenario())
+    assert scheduler.submitted == []
+    assert schedule["run_count"] == 0
@@ -0,0 +1,150 @@
+"""
+Vectorized farmer weather indicators
+Hourly Open-Meteo series for every location are stacked into (locations x hours)
+NumPy arrays, and rain totals, spray windows, heat stress and next-rain ETA are
+computed for all locations at once instead of hour by hour in Python.
+"""
+
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+HOURS = 72
+
+# Hourly Open-Meteo field -> column name
+HOURLY_FIELDS = {
+    "temperature_2m": "temp",
+    "relative_humidity_2m": "humidity",
+    "precipitation_probability": "rain_prob",
+    "precipitation": "rain_mm",
+    "wind_speed_10m": "wind",
+}
+
+# An hour counts as rain when either threshold is reached
+RAIN_PROB_PCT = 50
+RAIN_MM = 0.5
+
+# Spraying needs dry, calm hours in a row so the product is not washed or blown off
+SPRAY_MAX_RAIN_PROB_PCT = 30
+SPRAY_MAX_RAIN_MM = 0.1
+SPRAY_MAX_WIND_MS = 4.0  # about 15 km/h
+SPRAY_MIN_HOURS = 3
+
+# Heat index (°C) from which outdoor field work needs extra caution
+HEAT_STRESS_C = 32.0
+
+ROLLING_HOURS = 6
+
+
+class HourlyColumns:
+    """Hourly series of several locations as aligned 2-D float arrays (NaN where missing)"""
+
+    def __init__(self, names: List[str], series: List[Optional[Dict[str, Any]]], hours: int = HOURS):
+        self.names = names
+        self.hours = hours
+        self.times: List[List[str]] = []
+        self.columns: Dict[str, np.ndarray] = {
+            column: np.full((len(names), hours), np.nan) for column in HOURLY_FIELDS.values()
+        }
+        for row, hourly in enumerate(series):
+            hourly = hourly or {}
+            times = list(hourly.get("time", [])[:hours])
+            self.times.append(times)
+            for field, column in HOURLY_FIELDS.items():
+                values = hourly.get(field, [])[:len(times)]
+                if values:
+                    # None becomes NaN on conversion to float
+                    self.columns[column][row, :len(values)] = np.array(values, dtype=float)
+        self.lengths = np.array([len(times) for times in self.times], dtype=int)
+        # Hours past a location's series are not part of it
+        self.valid = np.arange(hours)[None, :] < self.lengths[:, None]
+
+    def __getitem__(self, column: str) -> np.ndarray:
+        return self.columns[column]
+
+    def filled(self, column: str, value: float = 0.0) -> np.ndarray:
+        return np.nan_to_num(self.columns[column], nan=value)
+
+
+def rolling_sum(values: np.ndarray, window: int) -> np.ndarray:
+    """Sum over the next ``window`` hours starting at each hour (shorter at the end of the series)"""
+    padded = np.concatenate([values, np.zeros((values.shape[0], window))], axis=1)
+    totals = np.cumsum(padded, axis=1)
+    totals = np.concatenate([np.zeros((values.shape[0], 1)), totals], axis=1)
+    return totals[:, window:window + values.shape[1]] - totals[:, :values.shape[1]]
+
+
+def heat_index(temp_c: np.ndarray, humidity_pct: np.ndarray) -> np.ndarray:
+    """NWS heat index (Rothfusz regression) in °C; below 27 °C the air temperature is used"""
+    t = temp_c * 9 / 5 + 32
+    rh = humidity_pct
+    hi = (-42.379 + 2.04901523 * t + 10.14333127 * rh - 0.22475541 * t * rh
+          - 6.83783e-3 * t * t - 5.481717e-2 * rh * rh + 1.22874e-3 * t * t * rh
+          + 8.5282e-4 * t * rh * rh - 1.99e-6 * t * t * rh * rh)
+    hi_c = (hi - 32) * 5 / 9
+    return np.where(temp_c >= 27, np.fmax(hi_c, temp_c), temp_c)
+
+
+def runs(mask: np.ndarray, min_length: int = 1):
+    """(row, start, end) of every run of True values per row, end exclusive"""
+    edges = np.diff(np.pad(mask.astype(np.int8), ((0, 0), (1, 1))), axis=1)
+    start_rows, starts = np.nonzero(edges == 1)
+    _, ends = np.nonzero(edges == -1)
+    # Both are ordered by row then column, so the n-th start pairs with the n-th end
+    keep = ends - starts >= min_length
+    return zip(start_rows[keep].tolist(), starts[keep].tolist(), ends[keep].tolist())
+
+
+def farmer_indicators(columns: HourlyColumns) -> List[Dict[str, Any]]:
+    """Derived indicators per location, in the order of ``columns.names``"""
+    valid = columns.valid
+    rain_mm = columns.filled("rain_mm")
+    rain_prob = columns.filled("rain_prob")
+    wind = columns["wind"]
+
+    rainy = valid & ((rain_prob >= RAIN_PROB_PCT) | (rain_mm >= RAIN_MM))
+    # Missing wind readings do not rule out spraying; missing rain data does
+    spray = (
+        valid
+        & ~np.isnan(columns["rain_prob"]) & (rain_prob < SPRAY_MAX_RAIN_PROB_PCT)
+        & (rain_mm < SPRAY_MAX_RAIN_MM)
+        & ~(wind > SPRAY_MAX_WIND_MS)
+    )
+    heat_stress = valid & (heat_index(columns["temp"], columns["humidity"]) >= HEAT_STRESS_C)
+
+    rolling = rolling_sum(rain_mm, ROLLING_HOURS)
+    peak_hour = rolling.argmax(axis=1)
+    rain_24h = rain_mm[:, :24].sum(axis=1)
+    rain_total = rain_mm.sum(axis=1)
+    has_rain = rainy.any(axis=1)
+    next_rain = rainy.argmax(axis=1)
+    heat_hours = heat_stress.sum(axis=1)
+    heat_hours_next_24h = heat_stress[:, :24].sum(axis=1)
+
+    spray_windows: List[List[Dict[str, Any]]] = [[] for _ in columns.names]
+    for row, start, end in runs(spray, SPRAY_MIN_HOURS):
+        times = columns.times[row]
+        spray_windows[row].append({
+            "startIsoUTC": times[start],
+            "endIsoUTC": times[end - 1],
+            "hours": end - start,
+        })
+
+    indicators = []
+    for row, times in enumerate(columns.times):
+        if not times:
+            indicators.append(None)
+            continue
+        eta = int(next_rain[row]) if has_rain[row] else None
+        indicators.append({
+            "rainNext24hMm": round(float(rain_24h[row]), 1),
+            "rainNext72hMm": round(float(rain_total[row]), 1),
+            "maxRain6hMm": round(float(rolling[row, peak_hour[row]]), 1),
+            "maxRain6hStartIsoUTC": times[peak_hour[row]],
+            "nextRainEtaHours": eta,
+            "nextRainIsoUTC": times[eta] if eta is not None else None,
+            "sprayWindows": spray_windows[row],
+            "heatStressHours": int(heat_hours[row]),
+            "heatStressHoursNext24h": int(heat_hours_next_24h[row]),
+        })
+    return indicators
@@ -0,0 +1,488 @@
+"""
+Shared Open-Meteo weather service
+One pooled aiohttp session fetches every coverage location concurrently. The
+normalized result is cached with stale-while-revalidate, and the current,
+forecast and farmer weather endpoints are all rendered from it. Locations
+come from the weather_locations collection, and Open-Meteo's multi-coordinate
+requests fetch a whole batch of them in one HTTP call. A background
+pre-fetcher keeps the data warm and persists timestamped snapshots to
+MongoDB, so bulletins are served from the latest good snapshot even when
+Open-Meteo is unreachable or the server has just restarted.
+"""
+
+import asyncio
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+import aiohttp
+import numpy as np
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from weather_indicators import HourlyColumns, farmer_indicators
+
+logger = logging.getLogger(__name__)
+
+OPEN_METEO_URL = "https://api.open-meteo.com/v1/forecast"
+
+# Broadcast coverage locations, followed by the church partner cities; these seed
+# the weather_locations collection, which is the source of truth once it exists
+LOCATIONS: List[Dict[str, Any]] = [
+    {"name": "Foya, Liberia", "lat": 8.3580, "lon": -10.2049},
+    {"name": "Koindu, Sierra Leone", "lat": 8.2804, "lon": -10.6514},
+    {"name": "Guéckédou, Guinea", "lat": 8.5674, "lon": -10.1330},
+    {"name": "Kissidougou, Guinea", "lat": 9.1885, "lon": -10.0996},
+    {"name": "Kailahun, Sierra Leone", "lat": 8.2789, "lon": -10.5739},
+    {"name": "Bo, Sierra Leone", "lat": 7.9647, "lon": -11.7383},
+    {"name": "N'Zérékoré, Guinea", "lat": 7.7562, "lon": -8.8179},
+    {"name": "Kolahun, Liberia", "lat": 8.2833, "lon": -10.0833},
+    {"name": "Kakata, Liberia", "lat": 6.5306, "lon": -10.3517},
+    {"name": "Monrovia, Liberia", "lat": 6.3156, "lon": -10.8074},
+]
+
+# One request per location carries every field the three endpoints need
+FORECAST_PARAMS = {
+    "current": "temperature_2m,relative_humidity_2m,precipitation,weather_code,cloud_cover,wind_speed_10m",
+    "hourly": "temperature_2m,relative_humidity_2m,precipitation_probability,precipitation,weather_code,wind_speed_10m",
+    "daily": "temperature_2m_max,temperature_2m_min,weather_code,precipitation_probability_max,precipitation_sum",
+    "wind_speed_unit": "ms",
+    "timezone": "UTC",
+    "forecast_days": 3,
+    "forecast_hours": 72,
+}
+
+# WMO weather interpretation codes
+CONDITIONS = {
+    0: "Clear sky", 1: "Mainly clear", 2: "Partly cloudy", 3: "Overcast",
+    45: "Fog", 48: "Depositing rime fog", 51: "Light drizzle", 53: "Moderate drizzle",
+    55: "Dense drizzle", 56: "Light freezing drizzle", 57: "Dense freezing drizzle",
+    61: "Slight rain", 63: "Moderate rain", 65: "Heavy rain", 66: "Light freezing rain",
+    67: "Heavy freezing rain", 71: "Slight snow", 73: "Moderate snow", 75: "Heavy snow",
+    77: "Snow grains", 80: "Slight rain showers", 81: "Moderate rain showers",
+    82: "Violent rain showers", 85: "Slight snow showers", 86: "Heavy snow showers",
+    95: "Thunderstorm", 96: "Thunderstorm with hail", 99: "Thunderstorm with heavy hail"
+}
+
+SECTIONS = ("current", "hourly", "daily")
+
+
+class WeatherService:
+    """Cached, coalesced access to Open-Meteo for all coverage locations"""
+
+    def __init__(
+        self,
+        db=None,
+        locations: List[Dict[str, Any]] = None,
+        ttl_minutes: float = None,
+        stale_minutes: float = None,
+        refresh_minutes: float = None,
+        timeout: float = 10.0,
+        retry_seconds: float = 60.0,
+    ):
+        self.collection = db.weather_snapshots if db is not None else None
+        self.locations_collection = db.weather_locations if db is not None else None
+        self.locations = locations or LOCATIONS
+        # Coordinates per Open-Meteo request; bounded so the query string stays short
+        self.batch_size = int(os.environ.get('WEATHER_BATCH_SIZE', '50'))
+        self.ttl_seconds = (ttl_minutes or float(os.environ.get('WEATHER_CACHE_TTL_MINUTES', '15'))) * 60
+        # How long past the TTL stale data may still be served while a refresh runs
+        self.stale_seconds = (stale_minutes or float(os.environ.get('WEATHER_STALE_MINUTES', '60'))) * 60
+        self.refresh_seconds = (refresh_minutes or float(os.environ.get('WEATHER_REFRESH_MINUTES', '10'))) * 60
+        self.snapshot_retention_days = int(os.environ.get('WEATHER_SNAPSHOT_RETENTION_DAYS', '30'))
+        self.timeout = timeout
+        self.retry_seconds = retry_seconds
+
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._data: Dict[str, Dict[str, Any]] = {}
+        self._refreshed_at: Optional[float] = None
+        self._retry_after = 0.0
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._prefetch_task: Optional[asyncio.Task] = None
+        # Bumped whenever _data changes; rendered payloads are reused until then
+        self._version = 0
+        self._rendered: Dict[str, Any] = {}
+
+        self.upstream_requests = 0
+        self.upstream_failures = 0
+        self.served_fresh = 0
+        self.served_stale = 0
+
+    @property
+    def ttl_minutes(self) -> int:
+        return int(self.ttl_seconds // 60)
+
+    async def ensure_indexes(self):
+        if self.collection is None:
+            return
+        await self.collection.create_index([("location", 1), ("fetched_at", -1)])
+        await self.collection.create_index("fetched_at", expireAfterSeconds=self.snapshot_retention_days * 86400)
+
+    async def load_locations(self) -> List[Dict[str, Any]]:
+        """Read active locations from the registry, seeding it with LOCATIONS on first use"""
+        if self.locations_collection is None:
+            return self.locations
+        if await self.locations_collection.count_documents({}) == 0:
+            await self._seed_locations()
+        documents = await self.locations_collection.find(
+            {"active": True}, {"_id": 0, "name": 1, "lat": 1, "lon": 1}
+        ).sort([("sort_order", 1), ("name", 1)]).to_list(None)
+        if documents:
+            self.set_locations(documents)
+        return self.locations
+
+    async def _seed_locations(self):
+        """Insert LOCATIONS; replicas seeding at the same first boot insert each name once"""
+        # The same unique index the registry declares, which may not have been built yet
+        await self.locations_collection.create_index("name", unique=True)
+        now = datetime.now(timezone.utc)
+        try:
+            await self.locations_collection.bulk_write([
+                UpdateOne({"name": location["name"]}, {"$setOnInsert": {
+                    "id": str(uuid.uuid4()), **location, "active": True, "sort_order": index,
+                    "created_at": now, "updated_at": now,
+                }}, upsert=True)
+                for index, location in enumerate(LOCATIONS)
+            ], ordered=False)
+        except BulkWriteError as e:
+            # Lost an upsert race for a name another replica just inserted
+            if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                raise
+
+    def set_locations(self, locations: List[Dict[str, Any]]):
+        """Switch to a new location list, dropping data for removed or moved locations"""
+        previous = {location["name"]: (location["lat"], location["lon"]) for location in self.locations}
+        self.locations = [{"name": l["name"], "lat": l["lat"], "lon": l["lon"]} for l in locations]
+        current = {location["name"]: (location["lat"], location["lon"]) for location in self.locations}
+        if current == previous:
+            return
+        self._data = {
+            name: data for name, data in self._data.items() if current.get(name) == previous.get(name)
+        }
+        self._version += 1
+        if self._data and any(name not in self._data for name in current):
+            # Fill in new locations without waiting for the next scheduled round
+            self._start_refresh()
+
+    async def load_latest(self):
+        """Seed the in-memory cache from the newest persisted snapshot of each location"""
+        if self.collection is None:
+            return
+        newest = None
+        for location in list(self.locations):
+            document = await self.collection.find_one(
+                {"location": location["name"]}, {"_id": 0}, sort=[("fetched_at", -1)]
+            )
+            if not document or location["name"] in self._data:
+                continue
+            if document["fetched_at"].tzinfo is None:
+                document["fetched_at"] = document["fetched_at"].replace(tzinfo=timezone.utc)
+            self._data[location["name"]] = {section: document.get(section, {}) for section in SECTIONS}
+            self._data[location["name"]]["fetched_at"] = document["fetched_at"]
+            newest = max(newest or document["fetched_at"], document["fetched_at"])
+            self._version += 1
+        if newest is not None and self._refreshed_at is None:
+            age = (datetime.now(timezone.utc) - newest).total_seconds()
+            self._refreshed_at = time.monotonic() - max(age, 0)
+
+    @property
+    def prefetching(self) -> bool:
+        return bool(self._prefetch_task and not self._prefetch_task.done())
+
+    async def start(self):
+        """Load persisted snapshots, then refresh every ``refresh_seconds`` in the background"""
+        if self.prefetching:
+            return
+        self._prefetch_task = asyncio.create_task(self._prefetch())
+        logger.info(f"Weather pre-fetcher started (every {self.refresh_seconds / 60:g} min)")
+
+    async def _prefetch(self):
+        try:
+            await self.load_locations()
+        except Exception as e:
+            logger.warning(f"Failed to load weather locations, using defaults: {e}")
+        try:
+            await self.load_latest()
+        except Exception as e:
+            logger.warning(f"Failed to load weather snapshots: {e}")
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"Weather pre-fetch failed: {e}")
+            await asyncio.sleep(self.refresh_seconds)
+            try:
+                # Locations may have been changed through another worker or replica
+                await self.load_locations()
+            except Exception as e:
+                logger.warning(f"Failed to reload weather locations: {e}")
+
+    async def close(self):
+        for task in (self._prefetch_task, self._refresh_task):
+            if task and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except (asyncio.CancelledError, Exception):
+                    pass
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _age(self) -> Optional[float]:
+        return time.monotonic() - self._refreshed_at if self._refreshed_at is not None else None
+
+    async def get(self) -> Dict[str, Optional[Dict[str, Any]]]:
+        """Normalized data per location name (None where nothing could be fetched)"""
+        if self.prefetching and self._data:
+            # The pre-fetcher keeps data warm; never make a caller wait on Open-Meteo
+            if (self._age() or 0) < self.ttl_seconds:
+                self.served_fresh += 1
+            else:
+                self.served_stale += 1
+            return {location["name"]: self._data.get(location["name"]) for location in self.locations}
+
+        age = self._age()
+        # After a fully failed round, wait retry_seconds before asking upstream again
+        can_refresh = time.monotonic() >= self._retry_after
+        if age is not None and age < self.ttl_seconds:
+            self.served_fresh += 1
+        elif age is not None and age < self.ttl_seconds + self.stale_seconds:
+            # Serve what we have and revalidate in the background
+            self.served_stale += 1
+            if can_refresh:
+                self._start_refresh()
+        elif can_refresh:
+            await self.refresh()
+        return {location["name"]: self._data.get(location["name"]) for location in self.locations}
+
+    async def render(self, name: str, builder: Callable[[Dict[str, Optional[Dict[str, Any]]]], Any]) -> Any:
+        """``builder(await self.get())``, reused until the data changes or a minute passes (ages are in minutes)"""
+        snapshot = await self.get()
+        key = (self._version, int(time.time() // 60))
+        cached = self._rendered.get(name)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        payload = builder(snapshot)
+        self._rendered[name] = (key, payload)
+        return payload
+
+    def _start_refresh(self) -> asyncio.Task:
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh())
+        return self._refresh_task
+
+    async def refresh(self):
+        """Refresh every location; concurrent callers share one upstream round"""
+        await asyncio.shield(self._start_refresh())
+
+    async def _refresh(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                connector=aiohttp.TCPConnector(limit=8, ttl_dns_cache=300),
+            )
+        # The location list may be swapped while this round is in flight
+        locations = list(self.locations)
+        batches = [locations[i:i + self.batch_size] for i in range(0, len(locations), self.batch_size)]
+        results = await asyncio.gather(*(self._fetch_batch(batch) for batch in batches), return_exceptions=True)
+
+        current = {(location["name"], location["lat"], location["lon"]) for location in self.locations}
+        snapshots = []
+        for batch, result in zip(batches, results):
+            if isinstance(result, BaseException):
+                self.upstream_failures += 1
+                logger.warning(f"Failed to fetch weather for {', '.join(l['name'] for l in batch)}: {result}")
+                continue
+            for location, data in zip(batch, result):
+                if (location["name"], location["lat"], location["lon"]) not in current:
+                    continue
+                # Locations in a failed batch keep their previous data
+                self._data[location["name"]] = data
+                snapshots.append({"location": location["name"], **data})
+        succeeded = len(snapshots)
+
+        if snapshots and self.collection is not None:
+            try:
+                await self.collection.insert_many(snapshots)
+            except Exception as e:
+                logger.warning(f"Failed to persist weather snapshots: {e}")
+
+        if succeeded:
+            self._version += 1
+            self._refreshed_at = time.monotonic()
+            self._retry_after = 0.0
+        else:
+            self._retry_after = time.monotonic() + self.retry_seconds
+
+    async def _fetch_batch(self, batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """One Open-Meteo call for several coordinates; results come back in request order"""
+        self.upstream_requests += 1
+        params = {
+            "latitude": ",".join(str(location["lat"]) for location in batch),
+            "longitude": ",".join(str(location["lon"]) for location in batch),
+            **FORECAST_PARAMS,
+        }
+        async with self._session.get(OPEN_METEO_URL, params=params) as response:
+            if response.status != 200:
+                raise RuntimeError(f"HTTP {response.status}")
+            data = await response.json()
+        # A single coordinate is answered with an object rather than a list
+        items = data if isinstance(data, list) else [data]
+        if len(items) != len(batch):
+            raise RuntimeError(f"expected {len(batch)} results, got {len(items)}")
+        fetched_at = datetime.now(timezone.utc)
+        return [{**{section: item.get(section, {}) for section in SECTIONS}, "fetched_at": fetched_at} for item in items]
+
+    def stats(self) -> Dict[str, Any]:
+        age = self._age()
+        return {
+            "locations": len(self.locations),
+            "batch_size": self.batch_size,
+            "cached_locations": len(self._data),
+            "age_seconds": round(age, 1) if age is not None else None,
+            "ttl_seconds": self.ttl_seconds,
+            "stale_seconds": self.stale_seconds,
+            "refreshing": bool(self._refresh_task and not self._refresh_task.done()),
+            "prefetching": self.prefetching,
+            "refresh_seconds": self.refresh_seconds,
+            "upstream_requests": self.upstream_requests,
+            "upstream_failures": self.upstream_failures,
+            "served_fresh": self.served_fresh,
+            "served_stale": self.served_stale,
+        }
+
+
+def _value(values: List[Any], index: int, default: Any = 0) -> Any:
+    if index < len(values) and values[index] is not None:
+        return values[index]
+    return default
+
+
+def _updated(data: Dict[str, Any]) -> str:
+    return data["fetched_at"].strftime("%Y-%m-%d %H:%M")
+
+
+def _age_minutes(data: Dict[str, Any]) -> int:
+    """How old a location's snapshot is, so bulletins can say when it was taken"""
+    return int((datetime.now(timezone.utc) - data["fetched_at"]).total_seconds() // 60)
+
+
+def build_current_weather(snapshot: Dict[str, Optional[Dict[str, Any]]]) -> Dict[str, Any]:
+    """Payload for /dashboard/weather"""
+    weather_data = {}
+    for name, data in snapshot.items():
+        current = (data or {}).get("current") or {}
+        if not current:
+            weather_data[name] = {
+                "temperature": "N/A",
+                "condition": "Weather unavailable",
+                "updated": datetime.utcnow().strftime("%Y-%m-%d %H:%M")
+            }
+            continue
+        weather_data[name] = {
+            "temperature": round(current.get("temperature_2m") or 0),
+            "condition": CONDITIONS.get(current.get("weather_code", 0), "Unknown"),
+            "updated": _updated(data),
+            "age_minutes": _age_minutes(data)
+        }
+    return weather_data
+
+
+def build_weather_forecast(snapshot: Dict[str, Optional[Dict[str, Any]]]) -> Dict[str, Any]:
+    """Payload for /dashboard/weather-forecast (today plus two days)"""
+    forecast_data = {}
+    for name, data in snapshot.items():
+        daily = (data or {}).get("daily") or {}
+        dates = daily.get("time", [])
+        if not dates:
+            forecast_data[name] = {
+                "forecast": [
+                    {"date": "N/A", "temp_max": "N/A", "temp_min": "N/A", "condition": "Weather unavailable", "day_label": label}
+                    for label in ("Today", "Day +1", "Day +2")
+                ],
+                "updated": datetime.utcnow().strftime("%Y-%m-%d %H:%M")
+            }
+            continue
+        temp_max = daily.get("temperature_2m_max", [])
+        temp_min = daily.get("temperature_2m_min", [])
+        weather_codes = daily.get("weather_code", [])
+        forecast_days = []
+        for i in range(min(3, len(dates))):
+            forecast_days.append({
+                "date": dates[i],
+                "temp_max": round(temp_max[i]) if _value(temp_max, i, None) is not None else "N/A",
+                "temp_min": round(temp_min[i]) if _value(temp_min, i, None) is not None else "N/A",
+                "condition": CONDITIONS.get(_value(weather_codes, i), "Unknown"),
+                "day_label": "Today" if i == 0 else f"Day +{i}"
+            })
+        forecast_data[name] = {"forecast": forecast_days, "updated": _updated(data), "age_minutes": _age_minutes(data)}
+    return forecast_data
+
+
+def build_farmer_weather(snapshot: Dict[str, Optional[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """Per-location entries for /dashboard/farmer-weather"""
+    names = list(snapshot)
+    columns = HourlyColumns(names, [(data or {}).get("hourly") for data in snapshot.values()])
+    indicators = farmer_indicators(columns)
+    # Round whole columns once; the per-hour dicts are then only zipped together
+    temps = np.round(columns.filled("temp"), 1).tolist()
+    rain_probs = np.round(columns.filled("rain_prob")).astype(int).tolist()
+    rain_mms = np.round(columns.filled("rain_mm"), 2).tolist()
+
+    locations = []
+    for row, (name, data) in enumerate(snapshot.items()):
+        if not data or not data.get("current"):
+            locations.append({
+                "location": name,
+                "now": {"tempC": 0, "humidityPct": 0, "windKph": 0, "cloudPct": 0, "rainProbPct": 0, "rainMmHr": 0},
+                "hourly": [],
+                "daily": []
+            })
+            continue
+
+        current = data["current"]
+        hours = len(columns.times[row])
+        hourly = [
+            {"timeIsoUTC": time_iso, "tempC": temp, "rainProbPct": rain_prob, "rainMmHr": rain_mm}
+            for time_iso, temp, rain_prob, rain_mm in zip(
+                columns.times[row], temps[row][:hours], rain_probs[row][:hours], rain_mms[row][:hours]
+            )
+        ]
+        now = {
+            "tempC": round(current.get("temperature_2m") or 0, 1),
+            "humidityPct": round(current.get("relative_humidity_2m") or 0),
+            "windKph": round((current.get("wind_speed_10m") or 0) * 3.6, 1),  # m/s to km/h
+            "cloudPct": round(current.get("cloud_cover") or 0),
+            # Not available in current, taken from the first hourly value
+            "rainProbPct": hourly[0]["rainProbPct"] if hourly else 0,
+            "rainMmHr": round(current.get("precipitation") or 0, 2)
+        }
+
+        daily_data = data.get("daily") or {}
+        daily_times = daily_data.get("time", [])
+        daily_rain_prob_max = daily_data.get("precipitation_probability_max", [])
+        daily_rain_sum = daily_data.get("precipitation_sum", [])
+        daily = []
+        for i in range(min(3, len(daily_times))):
+            date_str = daily_times[i]
+            date_iso = f"{date_str}T00:00:00Z" if isinstance(date_str, str) and len(date_str) == 10 else date_str
+            daily.append({
+                "dateIsoUTC": date_iso,
+                "rainProbMaxPct": round(_value(daily_rain_prob_max, i)),
+                "rainSumMm": round(_value(daily_rain_sum, i), 1)
+            })
+
+        locations.append({
+            "location": name,
+            "updatedIsoUTC": data["fetched_at"].strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "ageMinutes": _age_minutes(data),
+            "now": now,
+            "hourly": hourly,
+            "daily": daily,
+            "indicators": indicators[row]
+        })
+    return locations
@@ -14,6 +14,7 @@ const CRMProjects = ({ crmAuth }) => {
   const [showReceiptsModal, setShowReceiptsModal] = useState(false);
   const [showReportsModal, setShowReportsModal] = useState(false);
   const [projectFiles, setProjectFiles] = useState([]);
+  const [projectFilesCursor, setProjectFilesCursor] = useState(null);
   const [projectReceipts, setProjectReceipts] = useState([]);
   const [projectReports, setProjectReports] = useState([]);
   const [uploadProgress, setUploadProgress] = useState(0);
@@ -247,9 +248,10 @@ const CRMProjects = ({ crmAuth }) => {
     }
   };
 
-  const loadProjectFiles = async (projectId) => {
+  const loadProjectFiles = async (projectId, cursor = null) => {
     try {
-      const response = await fetch(`${BACKEND_URL}/api/projects/${projectId}/files`, {
+      const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
+      const response = await fetch(`${BACKEND_URL}/api/projects/${projectId}/files${query}`, {
         headers: {
           'Authorization': `Basic ${crmAuth}`,
           'Content-Type': 'application/json'
@@ -258,7 +260,9 @@ const CRMProjects = ({ crmAuth }) => {
 
       if (response.ok) {
         const data = await response.json();
-        setProjectFiles(data.files || []);
+        // Pages are newest first; a cursor appends the next page to what is shown
+        setProjectFiles(prev => (cursor ? [...prev, ...(data.files || [])] : data.files || []));
+        setProjectFilesCursor(data.next_cursor || null);
       }
     } catch (error) {
       console.error('Failed to load project files:', error);
@@ -957,6 +961,14 @@ const CRMProjects = ({ crmAuth }) => {
                         </div>
                       ))
                     )}
+                    {projectFilesCursor && (
+                      <button
+                        onClick={() => loadProjectFiles(selectedProject.project_code, projectFilesCursor)}
+                        className="w-full text-blue-600 hover:text-blue-800 text-sm px-2 py-2 border rounded-lg"
+                      >
+                        {t('Load more files') || 'Load more files'}
+                      </button>
+                    )}
                   </div>
                 </div>
               </div>
@@ -1174,7 +1186,7 @@ const FileUploadForm = ({ projectId, onUpload, onSuccess }) => {
     <form onSubmit={handleSubmit} className="space-y-4">
       <div>
         <label className="block text-sm font-medium text-gray-700 mb-2">
-          {t('Select File') || 'Select File'} (Max 3MB)
+          {t('Select File') || 'Select File'} (Max 100MB)
         </label>
         <input
           type="file"